@@ -8,6 +8,7 @@
 
 import subprocess
 import sys
+import importlib
 
 required_packages = [
     "mistapi",
@@ -22,26 +23,20 @@ required_packages = [
     "python-dotenv"
 ]
 
-for package in required_packages:
-    try:
-        if package in {"websocket-client"}:
-            __import__("websocket")
-        elif package == "python-dotenv":
-            __import__("dotenv")
-        else:
-            __import__(package)
-    except ImportError:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+# pip package names whose importable module name differs from the package name
+required_package_import_names = {
+    "websocket-client": "websocket",
+    "python-dotenv": "dotenv"
+}
 
-import mistapi, csv, ast, json, time, logging, os, argparse, sys, websocket, threading, re, sys, shutil, pyte, inspect, requests
-from prettytable import PrettyTable
-from tqdm import tqdm
+import csv, ast, json, time, logging, os, argparse, threading, re, shutil, inspect, math, hashlib, atexit, sqlite3
 from datetime import datetime, timedelta, timezone
-from sshkeyboard import listen_keyboard, stop_listening
-from dotenv import load_dotenv
-import numpy as np
 from logging.handlers import RotatingFileHandler
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, Future
+from collections import Counter
+from contextlib import contextmanager, closing
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
 
 log_handler = RotatingFileHandler(
     filename='script.log',
@@ -56,14 +51,90 @@ logging.basicConfig(
     handlers=[log_handler]
 )
 
+# When True (set by --offline), no package installs or Mist API calls are allowed; only cached CSVs are used
+offline_mode = False
+
+class OfflineModeError(RuntimeError):
+    """
+    Raised when an action needs the network (API call, login or pip install) while --offline is active.
+    """
+
+def import_or_install_required_package(package_name):
+    """
+    Imports one of the required third-party packages, pip-installing it first if it is missing.
+    Called lazily the first time the package is actually used instead of at script startup.
+    """
+    import_name = required_package_import_names.get(package_name, package_name)
+    try:
+        return importlib.import_module(import_name)
+    except ImportError:
+        # Never shell out to pip when running offline
+        if offline_mode:
+            raise OfflineModeError(f"Package '{package_name}' is not installed and cannot be installed in offline mode.")
+        logging.info(f"📦 Installing missing package '{package_name}'...")
+        subprocess.check_call([sys.executable, "-m", "pip", "install", package_name])
+        return importlib.import_module(import_name)
+
+class LazyImportedModule:
+    """
+    Stand-in for a third-party module that is only imported (and installed if missing)
+    the first time one of its attributes is read or patched.
+    """
+    def __init__(self, package_name):
+        object.__setattr__(self, "_package_name", package_name)
+        object.__setattr__(self, "_loaded_module", None)
+
+    def _load(self):
+        # Import the real module once and keep a reference to it
+        if self._loaded_module is None:
+            object.__setattr__(self, "_loaded_module", import_or_install_required_package(self._package_name))
+        return self._loaded_module
+
+    def __getattr__(self, attribute_name):
+        return getattr(self._load(), attribute_name)
+
+    def __setattr__(self, attribute_name, value):
+        # Forward writes (e.g. test monkeypatching) to the real module so every user sees them
+        setattr(self._load(), attribute_name, value)
+
+class LazyImportedAttribute:
+    """
+    Stand-in for a callable imported from a third-party module (e.g. PrettyTable, tqdm).
+    The module is only imported when the callable is first invoked.
+    """
+    def __init__(self, lazy_module, attribute_name):
+        self._lazy_module = lazy_module
+        self._attribute_name = attribute_name
+
+    def __call__(self, *args, **kwargs):
+        return getattr(self._lazy_module, self._attribute_name)(*args, **kwargs)
+
+# Heavy third-party imports are deferred until first use so cache-only actions start instantly
+mistapi = LazyImportedModule("mistapi")
+websocket = LazyImportedModule("websocket-client")
+pyte = LazyImportedModule("pyte")
+requests = LazyImportedModule("requests")
+np = LazyImportedModule("numpy")
+PrettyTable = LazyImportedAttribute(LazyImportedModule("prettytable"), "PrettyTable")
+tqdm = LazyImportedAttribute(LazyImportedModule("tqdm"), "tqdm")
+listen_keyboard = LazyImportedAttribute(LazyImportedModule("sshkeyboard"), "listen_keyboard")
+stop_listening = LazyImportedAttribute(LazyImportedModule("sshkeyboard"), "stop_listening")
+load_dotenv = LazyImportedAttribute(LazyImportedModule("python-dotenv"), "load_dotenv")
+
+_api_usage_lock = threading.RLock()  # Guards _api_usage_cache and the PID tuning state across threads
 _api_usage_cache = {
     "timestamp": 0,
-    "used": 0,
+    "used": 0,  # Requests in the current hour according to the last getSelfApiUsage reconciliation
     "limit": 5000,
     "last_updated": 0,
-    "perceived_requests": 0,
+    "last_reconciled": 0,
+    "reconciled_hour": None,
+    "requests_since_reconcile": 0,  # Requests this process sent since then (counted by the session hook)
+    "reconcile_in_progress": False,  # One thread polls getSelfApiUsage (outside the lock) at a time
     "initialized": False 
 }
+api_usage_reconcile_interval_seconds = 600  # How often local counts are checked against getSelfApiUsage
+_api_request_counts = Counter()  # "METHOD /normalized/path" -> requests sent by this process
 
 current_epoch = int(time.time()) # Get the current epoch timestamp
 past_epoch = current_epoch - 24 * 3600 # 24 hours * 3600 seconds/hour
@@ -74,40 +145,867 @@ fields = ["key", "display", "description"]
 
 # Global state for integral control and JSON persistence
 tuning_data_file = "tuning_data.json"
+default_pid_tuning_data = {"k_p": 0.1, "k_i": 0.0005, "error": [], "integral": 0.0}
+# The controller state lives in memory and is written out every interval and at exit
+controller_state_flush_interval_seconds = 60
+delay_metrics_file = "delay_metrics_by_minute.json"
+delay_metrics_retention_minutes = 7 * 24 * 60
+_pid_tuning_state = None
+_pid_tuning_state_dirty = False
+_controller_state_last_flush = time.monotonic()
+_pending_delay_metrics = {}  # Per-minute aggregates not yet written to delay_metrics_file
+
+# The real, logged-in mistapi.APISession; created on the first API call
+_authenticated_api_session = None
+_api_session_lock = threading.Lock()
+
+def get_authenticated_api_session():
+    """
+    Returns the logged-in Mist API session, creating it and calling login() on first use.
+    Raises OfflineModeError instead of touching the network when --offline is active.
+    """
+    global _authenticated_api_session
+    if offline_mode:
+        raise OfflineModeError("This action needs the Mist API, which is disabled in offline mode.")
+    with _api_session_lock:
+        if _authenticated_api_session is None:
+            logging.info("🔐 First API call requested. Logging in to the Mist API...")
+            # Initialize API session with environment file
+            session = mistapi.APISession(env_file=".env", console_log_level=20, logging_log_level=20)
+            session.login()
+            # Password login replaces the requests session, so the pool and request counting go on the final one
+            configure_http_connection_pool(getattr(session, "_session", None))
+            install_request_accounting_hook(getattr(session, "_session", None))
+            _authenticated_api_session = session
+    return _authenticated_api_session
+
+# Keep-alive HTTP connection pool shared by mistapi and the raw requests calls
+http_pool_minimum_size = 10
+_http_pool_adapters = []
+_http_pool_sizes = {}  # Pooled requests session -> connections per host it is sized for
+_http_pool_lock = threading.Lock()
+_standalone_http_session = None
+
+def get_http_pool_size(worker_count=None):
+    """
+    Returns the connections per host needed by worker_count fan-out workers (default: --workers)
+    and the page/window fetches they start.
+    """
+    return max(http_pool_minimum_size, max(worker_count or 0, fan_out_worker_count) * 2)
 
-# Initialize API session with environment file
-apisession = mistapi.APISession(env_file=".env",console_log_level=20,logging_log_level=20)
-apisession.login()
+def configure_http_connection_pool(http_session, worker_count=None):
+    """
+    Mounts a keep-alive adapter on a requests session with enough pooled connections per host for
+    every fan-out worker and the page/window fetches they start. The default pool holds 10
+    connections, so extra workers' connections were discarded and re-opened with new TLS handshakes.
+    """
+    if http_session is None:
+        return
+    pool_size = get_http_pool_size(worker_count)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    http_session.mount("https://", adapter)
+    http_session.mount("http://", adapter)
+    with _http_pool_lock:
+        _http_pool_adapters.append(adapter)
+        _http_pool_sizes[http_session] = pool_size
+    logging.debug(f"HTTP connection pool sized to {pool_size} connections per host.")
+
+def ensure_http_connection_pool_size(worker_count):
+    """
+    Re-sizes the pooled sessions when a fan-out runs more workers than they were sized for
+    (e.g. --fast uses one worker per CPU instead of --workers).
+    """
+    with _http_pool_lock:
+        undersized_sessions = [http_session for http_session, pool_size in _http_pool_sizes.items() if pool_size < get_http_pool_size(worker_count)]
+    for http_session in undersized_sessions:
+        configure_http_connection_pool(http_session, worker_count)
 
-org_id=None
+def get_shared_http_session():
+    """
+    Returns the pooled requests session to use for raw HTTP calls: the Mist API session's own one,
+    so raw calls reuse its open connections, or a standalone pooled session if that is unavailable.
+    """
+    global _standalone_http_session
+    http_session = getattr(get_authenticated_api_session(), "_session", None)
+    if http_session is not None:
+        return http_session
+    with _api_session_lock:
+        if _standalone_http_session is None:
+            _standalone_http_session = requests.Session()
+            configure_http_connection_pool(_standalone_http_session)
+            install_request_accounting_hook(_standalone_http_session)
+    return _standalone_http_session
+
+def get_http_connection_pool_stats():
+    """
+    Returns cumulative pool statistics: requests sent, connections opened (misses) and reuses (hits).
+    """
+    request_count = connection_count = 0
+    for adapter in list(_http_pool_adapters):
+        host_pools = adapter.poolmanager.pools
+        for pool_key in host_pools.keys():
+            host_pool = host_pools.get(pool_key)
+            if host_pool is not None:
+                request_count += host_pool.num_requests
+                connection_count += host_pool.num_connections
+    return {"requests": request_count, "misses": connection_count, "hits": max(request_count - connection_count, 0)}
+
+def report_http_connection_pool_stats(stats_before):
+    """
+    Logs how many requests since stats_before reused a pooled connection.
+    """
+    stats_after = get_http_connection_pool_stats()
+    request_count = stats_after["requests"] - stats_before["requests"]
+    if request_count:
+        hit_count = stats_after["hits"] - stats_before["hits"]
+        logging.info(f"🔌 HTTP connection pool: {request_count} requests, {hit_count} reused connections, {stats_after['misses'] - stats_before['misses']} new connections.")
 
-def check_and_generate_csv(file_name, generate_function, freshness_minutes=15):
+class LazyMistApiSession:
     """
-    Checks if a CSV file exists and is fresh (modified within the last `freshness_minutes`).
-    If not, it runs the `generate_function` to regenerate the file.
+    Stand-in for the global API session passed to every mistapi call.
+    The login only happens when mistapi first uses the session to issue a request.
+    GET requests are routed through the optional response cache.
     """
-    # Check if the file already exists
-    if os.path.exists(file_name):
-        # Get the last modified time of the file
-        file_mtime = datetime.fromtimestamp(os.path.getmtime(file_name))
-        
-        # Check if the file is still fresh
-        if datetime.now() - file_mtime < timedelta(minutes=freshness_minutes):
-            # Log that the cached file is being used
-            logging.info(f"✅ Using cached {file_name} (fresh)")
-            return
+    def mist_get(self, uri, query=None):
+        response = get_api_response_through_cache(uri, query)
+        note_throttling_response(response)
+        return response
+
+    def __getattr__(self, attribute_name):
+        return getattr(get_authenticated_api_session(), attribute_name)
+
+apisession = LazyMistApiSession()
+
+# Optional HTTP response cache for GET requests (enabled with --response-cache)
+api_response_cache_enabled = False
+api_response_cache_directory = "api_response_cache"
+
+# Per-endpoint cache lifetimes in seconds; GETs to endpoints not listed here are never cached
+api_response_cache_ttl_seconds = [
+    (r"^/api/v1/const/", 86400),                                  # Constant definitions
+    (r"^/api/v1/orgs/[^/]+/sites$", 900),                         # listOrgSites
+    (r"^/api/v1/orgs/[^/]+/inventory$", 300),                     # getOrgInventory
+    (r"^/api/v1/sites/[^/]+/setting$", 900),                      # getSiteSetting
+    (r"^/api/v1/sites/[^/]+/devices$", 300),                      # listSiteDevices
+    (r"^/api/v1/sites/[^/]+/devices/[^/]+$", 300),                # getSiteDevice
+    (r"^/api/v1/sites/[^/]+/devices/[^/]+/vc$", 300),             # getSiteDeviceVirtualChassis
+    (r"^/api/v1/sites/[^/]+/devices/[^/]+/synthetic_test$", 60),  # getSiteDeviceSyntheticTest
+    (r"^/api/v1/sites/[^/]+/stats/devices/[^/]+$", 30),           # getSiteDeviceStats
+]
+
+_api_response_memory_cache = {}
+_api_in_flight_requests = {}
+_api_response_cache_lock = threading.Lock()
+_api_response_cache_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0}
+
+class CachedApiResponse:
+    """
+    Replays a cached mistapi.APIResponse: the attributes mistapi.get_all and callers read.
+    """
+    def __init__(self, cache_entry):
+        self.url = cache_entry["url"]
+        self.data = cache_entry["data"]
+        self.raw_data = ""
+        self.next = cache_entry.get("next")
+        self.headers = cache_entry.get("headers", {})
+        self.status_code = cache_entry.get("status_code", 200)
+        self.proxy_error = False
+
+def get_api_response_cache_ttl_seconds(uri):
+    """
+    Returns how long a GET response for `uri` may be cached, or 0 if the endpoint is not cacheable.
+    """
+    uri_path = uri.split("?", 1)[0]
+    for pattern, ttl_seconds in api_response_cache_ttl_seconds:
+        if re.match(pattern, uri_path):
+            return ttl_seconds
+    return 0
+
+def get_api_response_cache_file(cache_key):
+    """
+    Returns the on-disk location of a cached response.
+    """
+    return os.path.join(api_response_cache_directory, hashlib.sha256(cache_key.encode("utf-8")).hexdigest() + ".json")
+
+def read_cached_api_response(cache_key):
+    """
+    Returns a non-expired cached response entry from memory or disk, or None.
+    """
+    now_epoch = time.time()
+    with _api_response_cache_lock:
+        cache_entry = _api_response_memory_cache.get(cache_key)
+        if cache_entry and cache_entry["expires_epoch"] > now_epoch:
+            _api_response_cache_stats["memory_hits"] += 1
+            return cache_entry
+
+    # Fall back to the persistent store (shared across runs and processes)
+    cache_file = get_api_response_cache_file(cache_key)
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache_entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cache_entry.get("cache_key") != cache_key:
+        return None
+    if cache_entry.get("expires_epoch", 0) <= now_epoch:
+        remove_expired_api_response_cache_file(cache_file)
+        return None
+    with _api_response_cache_lock:
+        _api_response_memory_cache[cache_key] = cache_entry
+        _api_response_cache_stats["disk_hits"] += 1
+    return cache_entry
+
+def remove_expired_api_response_cache_file(cache_file):
+    """
+    Deletes an expired cache file; another process may already have replaced or removed it.
+    """
+    try:
+        os.remove(cache_file)
+    except OSError:
+        pass
+
+def prune_expired_api_response_cache():
+    """
+    Deletes every expired or unreadable entry from the on-disk response cache.
+    """
+    if not os.path.isdir(api_response_cache_directory):
+        return
+    now_epoch = time.time()
+    pruned_count = 0
+    for file_name in os.listdir(api_response_cache_directory):
+        if not file_name.endswith(".json"):
+            continue
+        cache_file = os.path.join(api_response_cache_directory, file_name)
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                expires_epoch = json.load(f).get("expires_epoch", 0)
+        except (OSError, ValueError, AttributeError):
+            expires_epoch = 0
+        if expires_epoch <= now_epoch:
+            remove_expired_api_response_cache_file(cache_file)
+            pruned_count += 1
+    if pruned_count:
+        logging.info(f"🧹 Pruned {pruned_count} expired entries from {api_response_cache_directory}/.")
+
+def report_api_response_cache_stats(stats_before):
+    """
+    Logs the response cache hits, misses and coalesced requests since stats_before.
+    """
+    with _api_response_cache_lock:
+        stats = {name: count - stats_before[name] for name, count in _api_response_cache_stats.items()}
+    if any(stats.values()):
+        logging.info(f"📦 Response cache: {stats['memory_hits']} memory hits, {stats['disk_hits']} disk hits, {stats['misses']} misses, {stats['coalesced']} coalesced requests.")
+
+def store_cached_api_response(cache_key, response, ttl_seconds):
+    """
+    Saves a successful GET response in memory and on disk for `ttl_seconds`.
+    """
+    response_headers = getattr(response, "headers", None) or {}
+    cache_entry = {
+        "cache_key": cache_key,
+        "url": response.url,
+        "data": response.data,
+        "next": response.next,
+        "status_code": response.status_code,
+        # Only pagination headers are needed to replay the response
+        "headers": {name: value for name, value in response_headers.items() if name.lower().startswith("x-page-")},
+        "stored_at": datetime.now(timezone.utc).isoformat(),
+        "expires_epoch": time.time() + ttl_seconds
+    }
+    with _api_response_cache_lock:
+        _api_response_memory_cache[cache_key] = cache_entry
+    try:
+        os.makedirs(api_response_cache_directory, exist_ok=True)
+        with open_file_for_atomic_replace(get_api_response_cache_file(cache_key)) as f:
+            json.dump(cache_entry, f)
+    except (OSError, TypeError) as e:
+        logging.debug(f"Could not persist cached response for {cache_key}: {e}")
+
+def get_api_response_through_cache(uri, query=None):
+    """
+    Issues a GET through the authenticated session. When the response cache is enabled,
+    fresh cached responses are replayed and identical concurrent requests are coalesced so
+    only one goes to the network and every waiter shares its result.
+    """
+    if not api_response_cache_enabled:
+        return get_authenticated_api_session().mist_get(uri, query=query)
+
+    cache_key = uri + ("?" + json.dumps(query, sort_keys=True, default=str) if query else "")
+    ttl_seconds = get_api_response_cache_ttl_seconds(uri)
+    if ttl_seconds:
+        cache_entry = read_cached_api_response(cache_key)
+        if cache_entry:
+            logging.debug(f"📦 Response cache hit for {cache_key}")
+            return CachedApiResponse(cache_entry)
+
+    # Join an identical request that is already on the wire instead of sending another one
+    with _api_response_cache_lock:
+        in_flight_request = _api_in_flight_requests.get(cache_key)
+        is_request_owner = in_flight_request is None
+        if is_request_owner:
+            in_flight_request = Future()
+            _api_in_flight_requests[cache_key] = in_flight_request
+            _api_response_cache_stats["misses"] += 1
         else:
-            # Log that the file is stale and will be regenerated
-            logging.info(f"♻️ {file_name} is older than {freshness_minutes} minutes. Regenerating...")
-    else:
-        # Log that the file does not exist and will be generated
-        logging.info(f"📄 {file_name} not found. Generating...")
+            _api_response_cache_stats["coalesced"] += 1
+    if not is_request_owner:
+        logging.debug(f"🔗 Waiting for in-flight request {cache_key}")
+        return in_flight_request.result()
+
+    try:
+        response = get_authenticated_api_session().mist_get(uri, query=query)
+        if ttl_seconds and response.status_code == 200:
+            store_cached_api_response(cache_key, response, ttl_seconds)
+        in_flight_request.set_result(response)
+        return response
+    except BaseException as e:
+        in_flight_request.set_exception(e)
+        raise
+    finally:
+        with _api_response_cache_lock:
+            _api_in_flight_requests.pop(cache_key, None)
+
+# Per-thread record of throttling (429) and server error (5xx) responses, read by the fan-out executor
+_api_call_observations = threading.local()
+
+def parse_retry_after_seconds(headers):
+    """
+    Returns the delay requested by a Retry-After header (seconds or HTTP date), or None.
+    """
+    value = (headers or {}).get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        try:
+            return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+        except (TypeError, ValueError):
+            return None
+
+def note_throttling_response(response):
+    """
+    Remembers on the current thread that a request was throttled or hit a server error, with its
+    Retry-After delay. mistapi returns these responses instead of raising, so callers that only
+    look at .data would otherwise never notice.
+    """
+    status_code = getattr(response, "status_code", None)
+    if status_code is None or not (status_code == 429 or status_code >= 500):
+        return
+    retry_after_seconds = parse_retry_after_seconds(getattr(response, "headers", None))
+    logging.warning(f"⚠️ API responded {status_code} for {getattr(response, 'url', 'request')} (Retry-After: {retry_after_seconds})")
+    _api_call_observations.throttled_status = status_code
+    previous_retry_after = getattr(_api_call_observations, "retry_after_seconds", None)
+    if retry_after_seconds is not None and (previous_retry_after is None or retry_after_seconds > previous_retry_after):
+        _api_call_observations.retry_after_seconds = retry_after_seconds
+
+org_id=None
+
+@contextmanager
+def open_file_for_atomic_replace(target_file, newline=None):
+    """
+    Opens a temporary file next to `target_file` for writing and, once the block completes,
+    renames it over the target in one step. Readers in this or other processes never see a
+    half-written file; if the block fails the original file is left untouched.
+    """
+    temporary_file = f"{target_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporary_file, 'w', newline=newline, encoding='utf-8') as file:
+            yield file
+        # Windows refuses the rename while another process has the target open, so retry briefly
+        for attempt in range(5):
+            try:
+                os.replace(temporary_file, target_file)
+                break
+            except PermissionError:
+                if attempt == 4:
+                    raise
+                time.sleep(0.2)
+    finally:
+        # Clean up the temporary file if the swap did not happen
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+
+# Cross-process dataset locks: a "<file>.lock" file created exclusively by the generating process
+dataset_lock_timeout_seconds = 600
+dataset_lock_stale_seconds = 1800
+_held_dataset_locks = threading.local()
+
+def is_lock_owner_process_alive(lock_owner_pid):
+    """
+    Returns False only when the process that wrote a lock file is known to be gone.
+    """
+    # os.kill(pid, 0) would terminate the process on Windows, so rely on lock age there
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(lock_owner_pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+def remove_lock_file_if_abandoned(lock_file):
+    """
+    Deletes a lock file left behind by a crashed process or held longer than dataset_lock_stale_seconds.
+    """
+    try:
+        lock_age_seconds = time.time() - os.path.getmtime(lock_file)
+    except OSError:
+        return  # The lock was released meanwhile
+    try:
+        with open(lock_file, 'r', encoding='utf-8') as f:
+            lock_owner = json.load(f)
+    except (OSError, ValueError):
+        lock_owner = {}  # The owner may still be writing the lock details
+    owner_pid = lock_owner.get("pid")
+    owner_is_alive = is_lock_owner_process_alive(owner_pid) if owner_pid else True
+    if lock_age_seconds > dataset_lock_stale_seconds or not owner_is_alive:
+        logging.warning(f"⚠️ Removing abandoned lock {lock_file} (owner: {lock_owner}, age: {lock_age_seconds:.0f}s)")
+        try:
+            os.remove(lock_file)
+        except OSError:
+            pass
+
+@contextmanager
+def dataset_generation_lock(file_name, timeout_seconds=None):
+    """
+    Holds an exclusive, cross-process lock for regenerating `file_name`.
+    Other MistHelper processes (and threads) wait here until the owner finishes, then typically
+    find the dataset fresh and reuse it. Re-entrant within a thread. Yields True when the lock was
+    acquired and False when waiting timed out and the caller proceeds without it.
+    """
+    lock_file = f"{file_name}.lock"
+    held_locks = getattr(_held_dataset_locks, "files", None)
+    if held_locks is None:
+        held_locks = _held_dataset_locks.files = set()
+    if lock_file in held_locks:
+        yield True
+        return
+
+    timeout_seconds = dataset_lock_timeout_seconds if timeout_seconds is None else timeout_seconds
+    wait_started = time.time()
+    acquired = False
+    logged_wait = False
+    while not acquired:
+        try:
+            # O_EXCL makes creation atomic: exactly one process succeeds
+            lock_descriptor = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            with os.fdopen(lock_descriptor, 'w', encoding='utf-8') as f:
+                json.dump({"pid": os.getpid(), "thread": threading.current_thread().name, "acquired_at": datetime.now(timezone.utc).isoformat()}, f)
+            acquired = True
+        except FileExistsError:
+            if not logged_wait:
+                logging.info(f"⏳ Waiting for another process to finish generating {file_name}...")
+                logged_wait = True
+            remove_lock_file_if_abandoned(lock_file)
+            if time.time() - wait_started > timeout_seconds:
+                logging.warning(f"⚠️ Timed out after {timeout_seconds}s waiting for {lock_file}. Proceeding without the lock.")
+                break
+            time.sleep(0.5)
+
+    if acquired:
+        held_locks.add(lock_file)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            held_locks.discard(lock_file)
+            try:
+                os.remove(lock_file)
+            except OSError as e:
+                logging.warning(f"⚠️ Failed to remove lock {lock_file}: {e}")
+
+# Parsed CSV datasets kept in memory across menu selections: file name -> {"signature", "rows"}
+_loaded_csv_datasets = {}
+_loaded_csv_datasets_lock = threading.Lock()
+
+def load_csv_rows_with_memory_cache(file_name):
+    """
+    Returns the rows of a CSV file as a list of dictionaries, re-reading the file only when its
+    modification time or size changed since the last load. Callers must treat the rows as read-only.
+    """
+    file_stat = os.stat(file_name)
+    file_signature = (file_stat.st_mtime_ns, file_stat.st_size)
+    with _loaded_csv_datasets_lock:
+        cached_dataset = _loaded_csv_datasets.get(file_name)
+        if cached_dataset and cached_dataset["signature"] == file_signature:
+            logging.debug(f"♻️ Reusing parsed {file_name} from memory ({len(cached_dataset['rows'])} rows)")
+            return cached_dataset["rows"]
+
+    # Parse the file outside the lock so other datasets can be served meanwhile
+    with open(file_name, mode='r', encoding='utf-8') as file:
+        rows = list(csv.DictReader(file))
+    with _loaded_csv_datasets_lock:
+        _loaded_csv_datasets[file_name] = {"signature": file_signature, "rows": rows}
+    logging.info(f"📥 Loaded {len(rows)} rows from {file_name} into memory")
+    return rows
+
+# Manifest describing how and when each cached CSV dataset was produced
+dataset_manifest_file = "dataset_manifest.json"
+_dataset_manifest_cache = None
+_dataset_manifest_signature = None
+_dataset_manifest_lock = threading.RLock()
+
+# How long each cached dataset stays fresh. Slow-changing data is kept for hours, live stats for minutes.
+default_dataset_cache_ttl_minutes = 15
+constant_definitions_ttl_minutes = 3 * 24 * 60  # /const responses only change with Mist releases
+dataset_cache_ttl_minutes = {
+    # Organization structure changes rarely
+    "SiteList.csv": 360,
+    "SitesWithLocations.csv": 360,
+    "AllSiteConfigs.csv": 240,
+    "OrgInventory.csv": 60,
+    "OrgDevices.csv": 60,
+    "AllDevicesWithSiteInfo.csv": 60,
+    "GatewaysWithSiteInfo.csv": 60,
+    "AllSiteGatewayConfigs.csv": 60,
+    # Constant definitions only change when Mist ships a release
+    "NacEventDefinitions.csv": constant_definitions_ttl_minutes,
+    "ClientEventDefinitions.csv": constant_definitions_ttl_minutes,
+    "DeviceEventDefinitions.csv": constant_definitions_ttl_minutes,
+    "MistEdgeEventDefinitions.csv": constant_definitions_ttl_minutes,
+    "OtherEventDefinitions.csv": constant_definitions_ttl_minutes,
+    "SystemEventDefinitions.csv": constant_definitions_ttl_minutes,
+    "AlarmDefinitions.csv": constant_definitions_ttl_minutes,
+    # Logs and events
+    "OrgAlarms.csv": 15,
+    "OrgDeviceEvents.csv": 15,
+    "OrgAuditLogs.csv": 30,
+    "AllGatewayTestResults.csv": 60,
+    "AllGatewaySyntheticTests.csv": 60,
+    # Live statistics move fast
+    "OrgDeviceStats.csv": 5,
+    "OrgDevicePortStats.csv": 5,
+    "OrgVPNPeerStats.csv": 5,
+    "OrgSwitchVCStats.csv": 15,
+}
+
+def get_dataset_cache_ttl_minutes(file_name):
+    """
+    Returns the freshness window in minutes for a cached dataset file.
+    """
+    return dataset_cache_ttl_minutes.get(file_name, default_dataset_cache_ttl_minutes)
+
+def get_file_signature(file_name):
+    """
+    Returns (mtime_ns, size) for a file, or None if it does not exist. Used to detect changes.
+    """
+    try:
+        file_stat = os.stat(file_name)
+    except OSError:
+        return None
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+def load_dataset_manifest():
+    """
+    Returns the dataset manifest (file name -> entry). dataset_manifest.json is re-read whenever
+    it changed on disk, so entries written by other MistHelper processes are picked up.
+    """
+    global _dataset_manifest_cache, _dataset_manifest_signature
+    with _dataset_manifest_lock:
+        manifest_signature = get_file_signature(dataset_manifest_file)
+        if _dataset_manifest_cache is None or (manifest_signature and manifest_signature != _dataset_manifest_signature):
+            _dataset_manifest_cache = {}
+            if manifest_signature:
+                try:
+                    with open(dataset_manifest_file, 'r', encoding='utf-8') as f:
+                        _dataset_manifest_cache = json.load(f)
+                except (json.JSONDecodeError, OSError) as e:
+                    logging.warning(f"⚠️ Failed to read {dataset_manifest_file}: {e}. Starting with an empty manifest.")
+            _dataset_manifest_signature = manifest_signature
+        return _dataset_manifest_cache
+
+def save_dataset_manifest():
+    """
+    Writes the in-memory dataset manifest back to dataset_manifest.json atomically.
+    """
+    global _dataset_manifest_signature
+    with _dataset_manifest_lock:
+        manifest = load_dataset_manifest()
+        try:
+            with open_file_for_atomic_replace(dataset_manifest_file) as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+            # Our own write should not trigger a reload
+            _dataset_manifest_signature = get_file_signature(dataset_manifest_file)
+        except OSError as e:
+            logging.warning(f"⚠️ Failed to write {dataset_manifest_file}: {e}")
+
+def build_dataset_cache_key(dataset_org_id, endpoint, query_parameters):
+    """
+    Builds the key identifying one dataset variant: which org, endpoint and query produced it.
+    """
+    serialized_parameters = json.dumps(query_parameters or {}, sort_keys=True, default=str)
+    return f"{dataset_org_id}|{endpoint}|{serialized_parameters}"
+
+def record_dataset_manifest_entry(file_name, endpoint=None, query_parameters=None, row_count=None, fetch_duration_seconds=None, extra_fields=None, file_rewritten=False):
+    """
+    Records (or updates) the manifest entry for a freshly written dataset file.
+    Fields not supplied are kept from the existing entry unless the file now belongs to another org
+    or was just rewritten (file_rewritten): the old endpoint, query and sync fields describe the
+    previous contents, so they are dropped until the writer records the new ones.
+    The manifest is re-read under a cross-process lock first so other processes' entries are kept.
+    """
+    with _dataset_manifest_lock, dataset_generation_lock(dataset_manifest_file, timeout_seconds=30):
+        manifest = load_dataset_manifest()
+        entry = dict(manifest.get(file_name, {}))
+        now_epoch = time.time()
+
+        # Details recorded for another org or for the previous contents do not describe this file anymore
+        if entry.get("org_id") != org_id or file_rewritten:
+            entry = {}
+
+        entry["org_id"] = org_id
+        entry["ttl_minutes"] = get_dataset_cache_ttl_minutes(file_name)
+        entry["generated_at"] = datetime.now(timezone.utc).isoformat()
+        entry["generated_epoch"] = now_epoch
+        if endpoint is not None:
+            entry["endpoint"] = endpoint
+        if query_parameters is not None:
+            entry["query_parameters"] = query_parameters
+        if row_count is not None:
+            entry["row_count"] = row_count
+        if fetch_duration_seconds is not None:
+            entry["fetch_duration_seconds"] = round(fetch_duration_seconds, 3)
+        if extra_fields:
+            entry.update(extra_fields)
+        entry["cache_key"] = build_dataset_cache_key(org_id, entry.get("endpoint"), entry.get("query_parameters"))
+
+        manifest[file_name] = entry
+        save_dataset_manifest()
+    logging.debug(f"Manifest entry recorded for {file_name}: {entry}")
+
+def get_expected_dataset_query_parameters(file_name):
+    """
+    Returns the query parameters the current settings (--history-hours, --delta-sync) would fetch a
+    dataset with, as its generator records them, or None for datasets without variants.
+    """
+    if file_name == "OrgAlarms.csv":
+        if delta_sync_enabled:
+            return {"status": "open", "window_hours": delta_sync_window_hours[file_name]}
+        return {"limit": 1000, "status": "open", "time_range_hours": search_history_hours}
+    if file_name == "OrgDeviceEvents.csv":
+        if delta_sync_enabled:
+            return {"device_type": "all", "window_hours": delta_sync_window_hours[file_name]}
+        return {"device_type": "all", "limit": 1000, "time_range_hours": search_history_hours}
+    return None
+
+def get_dataset_staleness_reason(file_name, freshness_minutes=None, expected_query_parameters=None):
+    """
+    Returns None when the cached dataset can be used, or a short reason why it must be regenerated.
+    A dataset is only fresh when it exists, was produced for the current org and query and is
+    younger than its TTL. The query defaults to get_expected_dataset_query_parameters(file_name)
+    and is compared through the manifest's cache key.
+    """
+    if not os.path.exists(file_name):
+        return "not found"
+
+    entry = load_dataset_manifest().get(file_name)
+    if not entry:
+        return "has no manifest entry (unknown org/parameters)"
+
+    current_org_id = org_id or get_cached_or_prompted_org_id()
+    if entry.get("org_id") != current_org_id:
+        return f"was generated for org {entry.get('org_id')}, not {current_org_id}"
+
+    if expected_query_parameters is None:
+        expected_query_parameters = get_expected_dataset_query_parameters(file_name)
+    if expected_query_parameters is not None and entry.get("cache_key") != build_dataset_cache_key(current_org_id, entry.get("endpoint"), expected_query_parameters):
+        return f"was generated with different query parameters {entry.get('query_parameters')}"
+
+    ttl_minutes = freshness_minutes if freshness_minutes is not None else entry.get("ttl_minutes", get_dataset_cache_ttl_minutes(file_name))
+    age_seconds = time.time() - entry.get("generated_epoch", 0)
+    if age_seconds >= ttl_minutes * 60:
+        return f"is older than {ttl_minutes} minutes"
+    return None
+
+# When True (set by --stale-while-revalidate), expired datasets are served immediately and refreshed in the background
+stale_while_revalidate_enabled = False
+
+# Background refresh thread per dataset file, so each dataset is only refreshed once at a time
+_background_dataset_refresh_threads = {}
+_background_dataset_refresh_lock = threading.Lock()
+_background_refresh_exit_wait_registered = False
+
+def wait_for_background_dataset_refreshes(timeout_seconds=None):
+    """
+    Waits for running background refreshes, so exiting (e.g. after a single -M action) does not
+    kill a refresh half way and leave its stale CSV and .lock file behind.
+    Registered with atexit when the first background refresh starts.
+    """
+    with _background_dataset_refresh_lock:
+        running_threads = [thread for thread in _background_dataset_refresh_threads.values() if thread.is_alive()]
+    if not running_threads:
+        return
+    logging.info(f"⏳ Waiting for {len(running_threads)} background dataset refreshes to finish before exiting...")
+    deadline = time.monotonic() + (timeout_seconds or dataset_lock_timeout_seconds)
+    for thread in running_threads:
+        thread.join(max(deadline - time.monotonic(), 0))
 
-    # Call the function to generate the file
-    logging.info(f"🔄 Running {generate_function.__name__} to generate {file_name}...")
+def run_dataset_generator(file_name, generate_function):
+    """
+    Runs `generate_function` and records a manifest entry for `file_name` only if the generator
+    actually rewrote the file. Generators log and swallow their own API errors, so returning
+    normally does not mean the data was refreshed; an old file left in place keeps its old entry.
+    Returns True when the file was rewritten.
+    """
+    signature_before = get_file_signature(file_name)
+    generation_started = time.time()
     generate_function()
+    signature_after = get_file_signature(file_name)
+    if signature_after is None or signature_after == signature_before:
+        return False
+    record_dataset_manifest_entry(file_name, fetch_duration_seconds=time.time() - generation_started)
+    return True
+
+def refresh_dataset_in_background(file_name, generate_function):
+    """
+    Regenerates a dataset in a daemon thread while callers keep using the stale copy.
+    The generator writes through write_dict_list_to_csv, which swaps the new file in atomically,
+    so the next read picks up the refreshed data.
+    """
+    with _background_dataset_refresh_lock:
+        running_thread = _background_dataset_refresh_threads.get(file_name)
+        if running_thread and running_thread.is_alive():
+            logging.debug(f"Background refresh of {file_name} already running.")
+            return running_thread
+
+        def run_background_refresh():
+            try:
+                with api_call_priority("background"), dataset_generation_lock(file_name):
+                    # Skip the refresh if another process already brought the dataset up to date
+                    if get_dataset_staleness_reason(file_name) is None:
+                        logging.info(f"✅ {file_name} was refreshed by another process. Skipping background refresh.")
+                        return
+                    logging.info(f"🔄 Background refresh of {file_name} started ({generate_function.__name__}).")
+                    if not run_dataset_generator(file_name, generate_function):
+                        logging.warning(f"⚠️ Background refresh of {file_name} did not rewrite it. Stale copy remains in use.")
+                        return
+                logging.info(f"✅ Background refresh of {file_name} complete.")
+            except Exception as e:
+                logging.warning(f"⚠️ Background refresh of {file_name} failed: {e}. Stale copy remains in use.")
+
+        global _background_refresh_exit_wait_registered
+        if not _background_refresh_exit_wait_registered:
+            # Registered at runtime so it runs before flush_controller_state and other import-time handlers
+            atexit.register(wait_for_background_dataset_refreshes)
+            _background_refresh_exit_wait_registered = True
+        refresh_thread = threading.Thread(target=run_background_refresh, name=f"refresh-{file_name}", daemon=True)
+        _background_dataset_refresh_threads[file_name] = refresh_thread
+        refresh_thread.start()
+        return refresh_thread
+
+def check_and_generate_csv(file_name, generate_function, freshness_minutes=None, expected_query_parameters=None, stale_while_revalidate=None):
+    """
+    Checks if a CSV file exists and is fresh according to the dataset manifest: generated for the
+    current org (and query parameters, when given) within the dataset's TTL, or within
+    `freshness_minutes` when explicitly passed. If not, it runs the `generate_function` to regenerate the file.
+    With stale-while-revalidate, a file that is only too old is returned as-is and refreshed in the background.
+    """
+    # Offline mode serves whatever is cached, regardless of age, and never regenerates
+    if offline_mode:
+        if os.path.exists(file_name):
+            logging.info(f"📴 Offline mode: using cached {file_name} regardless of age")
+            return
+        raise OfflineModeError(f"{file_name} is not cached and cannot be generated in offline mode.")
+
+    # Check the manifest to decide whether the cached file can be reused
+    staleness_reason = get_dataset_staleness_reason(file_name, freshness_minutes, expected_query_parameters)
+    if staleness_reason is None:
+        # Log that the cached file is being used
+        logging.info(f"✅ Using cached {file_name} (fresh)")
+        return
+    # Serve an expired (but otherwise valid) dataset right away and refresh it behind the caller's back
+    if stale_while_revalidate is None:
+        stale_while_revalidate = stale_while_revalidate_enabled
+    if stale_while_revalidate and get_dataset_staleness_reason(file_name, float("inf"), expected_query_parameters) is None:
+        logging.info(f"⏩ {file_name} {staleness_reason}. Serving stale copy while refreshing in the background...")
+        refresh_dataset_in_background(file_name, generate_function)
+        return
+
+    # Log why the file will be (re)generated
+    logging.info(f"♻️ {file_name} {staleness_reason}. Regenerating...")
+
+    # Only one process regenerates a dataset at a time; the others wait here
+    with dataset_generation_lock(file_name):
+        # Another process may have regenerated the dataset while we were waiting for the lock
+        if get_dataset_staleness_reason(file_name, freshness_minutes, expected_query_parameters) is None:
+            logging.info(f"✅ Using {file_name} freshly generated by another process")
+            return
+
+        # Call the function to generate the file and record how long it took
+        logging.info(f"🔄 Running {generate_function.__name__} to generate {file_name}...")
+        if not run_dataset_generator(file_name, generate_function):
+            logging.error(f"❌ {generate_function.__name__} did not write {file_name}. Its manifest entry is left unchanged.")
+            return
     logging.info(f"✅ {file_name} generated or refreshed.")
 
+# Run-scoped registry of org-level collections: each one is fetched once per menu action and shared by every consumer
+org_collection_page_limit = 1000
+org_collection_fetchers = {
+    "sites": lambda session, collection_org_id: mistapi.api.v1.orgs.sites.listOrgSites(session, collection_org_id, limit=org_collection_page_limit),
+    "inventory": lambda session, collection_org_id: mistapi.api.v1.orgs.inventory.getOrgInventory(session, collection_org_id, limit=org_collection_page_limit),
+}
+_org_collection_registry = {}
+_org_collection_registry_lock = threading.Lock()
+_org_collection_registry_stats = {"fetches": 0, "reuses": 0, "api_calls_saved": 0}
+
+def reset_org_collection_registry():
+    """
+    Forgets all shared org collections and their statistics. Called at the start of each menu action.
+    """
+    with _org_collection_registry_lock:
+        _org_collection_registry.clear()
+        _org_collection_registry_stats.update({"fetches": 0, "reuses": 0, "api_calls_saved": 0})
+
+def get_shared_org_collection(collection_name, collection_org_id=None, mist_session=None):
+    """
+    Returns an org-level collection ("sites" or "inventory"), paginating through the API only the
+    first time it is requested during the current run. Concurrent requests for the same collection
+    wait for the single in-flight fetch. The returned list is shared: copy items before modifying them.
+    """
+    collection_org_id = collection_org_id or get_cached_or_prompted_org_id()
+    mist_session = mist_session or apisession
+    registry_key = (collection_org_id, collection_name)
+    with _org_collection_registry_lock:
+        registry_entry = _org_collection_registry.setdefault(registry_key, {"lock": threading.Lock(), "items": None, "pages": 0})
+
+    with registry_entry["lock"]:
+        # Serve the collection already fetched during this run
+        if registry_entry["items"] is not None:
+            with _org_collection_registry_lock:
+                _org_collection_registry_stats["reuses"] += 1
+                _org_collection_registry_stats["api_calls_saved"] += registry_entry["pages"]
+            logging.info(f"♻️ Reusing shared org {collection_name} ({len(registry_entry['items'])} items) instead of refetching.")
+            return registry_entry["items"]
+
+        # First request: paginate through the API
+        logging.info(f"📡 Fetching org {collection_name} for the shared dataset registry...")
+        response = org_collection_fetchers[collection_name](mist_session, collection_org_id)
+        items = get_all_pages_concurrently(response=response, mist_session=mist_session) or []
+        with _org_collection_registry_lock:
+            _org_collection_registry_stats["fetches"] += 1
+
+        # Only keep successful results so a failed call is retried by the next consumer
+        if getattr(response, "status_code", 200) == 200:
+            registry_entry["items"] = items
+            registry_entry["pages"] = max(1, math.ceil(len(items) / org_collection_page_limit))
+        return items
+
+def report_org_collection_registry_savings():
+    """
+    Logs and prints how many API calls the shared registry saved during the current run.
+    """
+    with _org_collection_registry_lock:
+        stats = dict(_org_collection_registry_stats)
+    if not stats["fetches"] and not stats["reuses"]:
+        return
+    summary = (f"📦 Shared dataset registry: {stats['fetches']} collection fetches, "
+               f"{stats['reuses']} reuses, {stats['api_calls_saved']} API calls saved.")
+    logging.info(summary)
+    print(summary)
+
 def prepare_data_and_write_csv(data, filename, sort_key=None):
     """
     Flattens, sanitizes, optionally sorts, and writes data to a CSV file.
@@ -201,37 +1099,33 @@ def process_and_merge_csv_for_sfp_address():
         export_devices_with_site_info_to_csv()
 
     # Load site and device info, keyed by MAC address
-    with open('AllDevicesWithSiteInfo.csv', mode='r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        site_info = {
-            row['mac']: {
-                'site_name': row.get('site_name', ''),
-                'site_address': row.get('site_address', ''),
-                'device_name': row.get('name', '')
-            } for row in reader
-        }
+    site_info = {
+        row['mac']: {
+            'site_name': row.get('site_name', ''),
+            'site_address': row.get('site_address', ''),
+            'device_name': row.get('name', '')
+        } for row in load_csv_rows_with_memory_cache('AllDevicesWithSiteInfo.csv')
+    }
 
     # Merge with port stats, skipping rows with blank/null transceiver model
     merged_data = []
-    with open('OrgDevicePortStats.csv', mode='r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            mac = row.get('mac')
-            transceiver_model = row.get('xcvr_model', '').strip()
-            if mac in site_info and transceiver_model:
-                merged_data.append({
-                    'site_name': site_info[mac]['site_name'],
-                    'site_address': site_info[mac]['site_address'],
-                    'device_name': site_info[mac]['device_name'],
-                    'port_id': row.get('port_id', ''),
-                    'transceiver_part_number': row.get('xcvr_part_number', ''),
-                    'transceiver_model': transceiver_model,
-                    'transceiver_serial_number': row.get('xcvr_serial', '')
-                })
+    for row in load_csv_rows_with_memory_cache('OrgDevicePortStats.csv'):
+        mac = row.get('mac')
+        transceiver_model = row.get('xcvr_model', '').strip()
+        if mac in site_info and transceiver_model:
+            merged_data.append({
+                'site_name': site_info[mac]['site_name'],
+                'site_address': site_info[mac]['site_address'],
+                'device_name': site_info[mac]['device_name'],
+                'port_id': row.get('port_id', ''),
+                'transceiver_part_number': row.get('xcvr_part_number', ''),
+                'transceiver_model': transceiver_model,
+                'transceiver_serial_number': row.get('xcvr_serial', '')
+            })
 
     # Write output to new CSV
     output_file = 'MergedTransceiverData.csv'
-    with open(output_file, mode='w', newline='', encoding='utf-8') as file:
+    with open_file_for_atomic_replace(output_file, newline='') as file:
         fieldnames = [
             'site_name', 'site_address', 'device_name', 'port_id',
             'transceiver_part_number', 'transceiver_model', 'transceiver_serial_number'
@@ -264,6 +1158,22 @@ def get_cached_or_prompted_org_id():
     org_id = org_id_list[0]
     return org_id
 
+def read_env_file_value(key, env_file=".env"):
+    """
+    Returns the value of `key` from the environment or the .env file without prompting, or None.
+    """
+    if os.getenv(key):
+        return os.getenv(key)
+    try:
+        with open(env_file, "r") as f:
+            for line in f:
+                if line.strip().startswith(f"{key}="):
+                    value = line.strip().split("=", 1)[1].strip().strip('"')
+                    return value or None
+    except FileNotFoundError:
+        pass
+    return None
+
 def flatten_dict_recursively(d, parent_key='', sep='_'):
     """
     Recursively flattens a nested dictionary, joining keys with `sep`.
@@ -397,7 +1307,8 @@ def write_dict_list_to_csv(data, csv_file):
     logging.debug(f"CSV fields determined: {fields}")
 
     try:
-        with open(csv_file, 'w', newline='', encoding='utf-8') as file:
+        # Write to a temporary file and swap it in, so readers never see a partial file
+        with open_file_for_atomic_replace(csv_file, newline='') as file:
             writer = csv.DictWriter(file, fieldnames=fields)
             writer.writeheader()
             for idx, row in enumerate(data):
@@ -405,14 +1316,18 @@ def write_dict_list_to_csv(data, csv_file):
                 if idx < 3:  # Log the first few rows for debugging
                     logging.debug(f"Row {idx} written: {row}")
         logging.info(f"Data saved to {csv_file} ({len(data)} rows)")
+        # Remember which org produced this file and how many rows it holds
+        record_dataset_manifest_entry(csv_file, row_count=len(data), file_rewritten=True)
     except PermissionError as e:
         logging.error(f"❌ Permission denied when writing to {csv_file}: {e}")
         print(f"❌ Cannot write to {csv_file}. Is it open in another program?")
 
-def fetch_and_display_api_data(title, api_call, filename, sort_key=None, display_fields=None, **kwargs):
+def fetch_and_display_api_data(title, api_call, filename, sort_key=None, display_fields=None, time_range_hours=None, id_fields=None, **kwargs):
     """
     Fetches data using the provided API call, processes it (flattening, sorting, escaping),
     writes it to a CSV file, and displays it in a PrettyTable. Adds detailed logging.
+    With time_range_hours, a search endpoint is queried as parallel time windows over that range
+    (deduplicated on id_fields) instead of one sequential cursor.
     """
     logging.info(f"Starting data fetch: {title}")
     print(title)
@@ -422,10 +1337,17 @@ def fetch_and_display_api_data(title, api_call, filename, sort_key=None, display
 
     try:
         # Call the API and get all paginated results
-        response = api_call(apisession, org_id, **kwargs)
-        smoothed, delay = get_rate_limited_delay(smoothed)
-        time.sleep(delay)
-        rawdata = mistapi.get_all(response=response, mist_session=apisession)
+        fetch_started = time.time()
+        if time_range_hours:
+            rawdata = fetch_time_range_in_shards(api_call, fetch_started - time_range_hours * 3600, fetch_started, id_fields=id_fields, **kwargs)
+        else:
+            response = api_call(apisession, org_id, **kwargs)
+            # Interactive calls use the reserved headroom instead of waiting for the pacing delay
+            if get_current_api_priority() != "interactive":
+                smoothed, delay = get_rate_limited_delay(smoothed)
+                time.sleep(delay)
+            rawdata = get_all_pages_concurrently(response=response, mist_session=apisession)
+        fetch_duration_seconds = time.time() - fetch_started
 
         if rawdata is None:
             logging.warning(f"⚠️ No data returned from API for {title}. Skipping.")
@@ -457,6 +1379,13 @@ def fetch_and_display_api_data(title, api_call, filename, sort_key=None, display
         # Write processed data to CSV
         write_dict_list_to_csv(data, filename)
         logging.info(f"Data written to {filename} ({len(data)} rows).")
+        # Record the endpoint and query that produced the file in the dataset manifest
+        record_dataset_manifest_entry(
+            filename,
+            endpoint=api_call.__name__,
+            query_parameters=dict(kwargs, time_range_hours=time_range_hours) if time_range_hours else kwargs,
+            fetch_duration_seconds=fetch_duration_seconds
+        )
 
         # Prepare and display PrettyTable
         table = PrettyTable()
@@ -467,6 +1396,9 @@ def fetch_and_display_api_data(title, api_call, filename, sort_key=None, display
             table.add_row(row)
         logging.info("\n" + table.get_string())
 
+    except OfflineModeError:
+        # Let offline-mode refusals reach the caller instead of being logged as fetch errors
+        raise
     except Exception as e:
         logging.error(f"❌ Error during data fetch for {title}: {e}")
 
@@ -580,11 +1512,10 @@ def prompt_select_site_id_from_csv(csv_file="SiteList.csv"):
     # Ensure the site list CSV is fresh or generate it if missing/stale
     check_and_generate_csv(csv_file, export_all_sites_to_csv)
 
-    # Load the site list from CSV
-    with open(csv_file, mode='r', encoding='utf-8') as file:
-        reader = list(csv.DictReader(file))
-        index_to_site = {i: row for i, row in enumerate(reader)}
-        name_to_site = {row["name"]: row for row in reader if "name" in row}
+    # Load the site list from CSV (parsed once and kept in memory while the file is unchanged)
+    reader = load_csv_rows_with_memory_cache(csv_file)
+    index_to_site = {i: row for i, row in enumerate(reader)}
+    name_to_site = {row["name"]: row for row in reader if "name" in row}
 
     # Display available sites to the user
     print("\nAvailable Sites:")
@@ -630,38 +1561,159 @@ def prompt_and_log_site_selection():
     else:
         logging.warning("❌ No site selected. User may have entered an invalid value or cancelled the prompt.")
 
+# Incremental (delta) sync for time-windowed logs (enabled with --delta-sync)
+delta_sync_enabled = False
+delta_sync_overlap_seconds = 120  # Re-request a little before the watermark to catch late-arriving records
+delta_sync_full_resync_hours = 6  # Periodically refetch the whole window so updated/resolved records are picked up
+delta_sync_window_hours = {
+    "OrgAlarms.csv": 24,
+    "OrgDeviceEvents.csv": 24,
+    "OrgAuditLogs.csv": 7 * 24,
+}
+
+def get_record_timestamp(record):
+    """
+    Returns the epoch timestamp of an API record or CSV row, or 0 when it is missing or malformed.
+    """
+    try:
+        return float(record.get("timestamp") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def sync_time_window_dataset_incrementally(file_name, api_call, id_fields, **query_parameters):
+    """
+    Keeps a time-windowed dataset (alarms, events, audit logs) up to date by only requesting
+    records newer than the watermark stored in the dataset manifest.
+    - New records are deduplicated on id_fields (or the whole record when None) and appended
+      to the existing CSV rows.
+    - Rows older than the dataset's window (delta_sync_window_hours) are trimmed locally.
+    - The whole window is refetched when there is no usable watermark, when the org or query
+      changed, or every delta_sync_full_resync_hours, because records that change after they
+      were first seen (e.g. alarms that get resolved) are not returned again by a delta query.
+    Returns the number of rows in the synced dataset, or None if the fetch failed.
+    """
+    org_id = get_cached_or_prompted_org_id()
+    now_epoch = time.time()
+    window_start_epoch = now_epoch - delta_sync_window_hours[file_name] * 3600
+    entry = load_dataset_manifest().get(file_name, {})
+    previous_watermark = entry.get("watermark_epoch")
+    last_full_sync_epoch = entry.get("full_sync_epoch", 0)
+    # The window is part of the recorded query: a wider window needs a full sync to backfill
+    recorded_query_parameters = dict(query_parameters, window_hours=delta_sync_window_hours[file_name])
+
+    is_delta = (
+        previous_watermark is not None
+        and os.path.exists(file_name)
+        and entry.get("org_id") == org_id
+        and entry.get("query_parameters") == recorded_query_parameters
+        and now_epoch - last_full_sync_epoch < delta_sync_full_resync_hours * 3600
+    )
+    start_epoch = max(window_start_epoch, previous_watermark - delta_sync_overlap_seconds) if is_delta else window_start_epoch
+    logging.info(f"{'Delta' if is_delta else 'Full'} sync of {file_name} from {datetime.fromtimestamp(start_epoch, timezone.utc).isoformat()}")
+
+    fetch_started = time.time()
+    fetched_records = fetch_time_range_in_shards(api_call, start_epoch, now_epoch, id_fields=id_fields, **query_parameters)
+    if fetched_records is None:
+        # Keep the old file and watermark so the next sync retries the same range
+        logging.warning(f"⚠️ Delta sync of {file_name} failed; keeping the existing data.")
+        return None
+    fetch_duration_seconds = time.time() - fetch_started
+    fetched_records = escape_multiline_strings_for_csv(flatten_nested_fields_in_list(fetched_records))
+
+    def record_key(record):
+        if id_fields:
+            return tuple(str(record.get(field, "")) for field in id_fields)
+        # CSV rows hold every value as a string and blanks for columns the record does not have
+        return tuple(sorted((field, str(value)) for field, value in record.items() if value not in (None, "")))
+
+    # Start from the rows already on disk when appending, otherwise from scratch
+    rows = [dict(row) for row in load_csv_rows_with_memory_cache(file_name)] if is_delta else []
+    known_keys = {record_key(row) for row in rows}
+    appended_count = 0
+    for record in fetched_records:
+        key = record_key(record)
+        if key in known_keys:
+            continue
+        known_keys.add(key)
+        rows.append(record)
+        appended_count += 1
+
+    # Trim to the configured window and keep the file in chronological order
+    rows = sorted(
+        (row for row in rows if get_record_timestamp(row) >= window_start_epoch),
+        key=get_record_timestamp
+    )
+    watermark_epoch = max([previous_watermark if is_delta else start_epoch] + [get_record_timestamp(row) for row in rows])
+
+    write_dict_list_to_csv(rows, file_name)
+    record_dataset_manifest_entry(
+        file_name,
+        endpoint=api_call.__name__,
+        query_parameters=recorded_query_parameters,
+        fetch_duration_seconds=fetch_duration_seconds,
+        extra_fields={
+            "watermark_epoch": watermark_epoch,
+            "full_sync_epoch": last_full_sync_epoch if is_delta else now_epoch,
+            "window_hours": delta_sync_window_hours[file_name],
+            "last_sync_records_fetched": len(fetched_records),
+            "last_sync_records_appended": appended_count,
+        }
+    )
+    logging.info(f"✅ {file_name}: fetched {len(fetched_records)} records, appended {appended_count}, {len(rows)} rows in window.")
+    return len(rows)
+
 def export_open_org_alarms_to_csv():
     """
-    Fetches all open organization alarms from the past 24 hours and writes them to OrgAlarms.csv.
+    Fetches all open organization alarms from the past 24 hours (--history-hours) and writes them to OrgAlarms.csv.
+    With --delta-sync only alarms newer than the last sync are requested and merged in.
     """
-    logging.info("Starting search for all open org alarms in the past 24 hours...")
+    if delta_sync_enabled:
+        sync_time_window_dataset_incrementally("OrgAlarms.csv", mistapi.api.v1.orgs.alarms.searchOrgAlarms, ["id"], status="open")
+        return
+    logging.info(f"Starting search for all open org alarms in the past {search_history_hours} hours...")
     fetch_and_display_api_data(
         title="Search all Org Alarms:",
         api_call=mistapi.api.v1.orgs.alarms.searchOrgAlarms,
         filename="OrgAlarms.csv",
+        time_range_hours=search_history_hours,
+        id_fields=["id"],
         limit=1000,
-        duration="24h",
         status="open"
     )
     logging.info("Completed export_open_org_alarms_to_csv and wrote results to OrgAlarms.csv.")
 
 def export_recent_device_events_to_csv():
     """
-    Export all device events from the past 24 hours to OrgDeviceEvents.csv.
+    Export all device events from the past 24 hours (--history-hours) to OrgDeviceEvents.csv.
+    The range is fetched as parallel time windows; with --delta-sync only events newer than the last sync are requested and merged in.
     """
+    if delta_sync_enabled:
+        # Device events carry no ID, and events on different ports can share device, time and type,
+        # so only identical records are treated as duplicates
+        sync_time_window_dataset_incrementally(
+            "OrgDeviceEvents.csv", mistapi.api.v1.orgs.devices.searchOrgDeviceEvents,
+            None, device_type="all"
+        )
+        return
     logging.info("Search Org Device Events:")
-    org_id = get_cached_or_prompted_org_id()
-    # Call the Mist API to search for device events in the last 24 hours
-    response = mistapi.api.v1.orgs.devices.searchOrgDeviceEvents(
-        apisession, org_id, device_type="all", limit=1000, last_by="-24h"
+    # Search the time range as parallel windows; only identical records at window boundaries are dropped
+    end_epoch = time.time()
+    events = fetch_time_range_in_shards(
+        mistapi.api.v1.orgs.devices.searchOrgDeviceEvents, end_epoch - search_history_hours * 3600, end_epoch,
+        id_fields=None, description="Device event windows", device_type="all"
     )
-    # Retrieve all paginated results
-    rawdata = mistapi.get_all(response=response, mist_session=apisession)
-    events = rawdata
-    logging.info(f"Fetched {len(events)} device events from the past 24 hours.")
+    if events is None:
+        logging.warning("⚠️ Device events could not be fetched completely. Keeping the existing OrgDeviceEvents.csv.")
+        return
+    logging.info(f"Fetched {len(events)} device events from the past {search_history_hours} hours.")
     # Write the events to a CSV file
     write_dict_list_to_csv(events, "OrgDeviceEvents.csv")
     logging.info(f"Device events written to OrgDeviceEvents.csv ({len(events)} rows).")
+    record_dataset_manifest_entry(
+        "OrgDeviceEvents.csv",
+        endpoint="searchOrgDeviceEvents",
+        query_parameters={"device_type": "all", "limit": 1000, "time_range_hours": search_history_hours}
+    )
     # Optionally log the first few events for debugging
     if events:
         logging.debug("Sample device events: %s", json.dumps(events[:3], indent=2))
@@ -670,7 +1722,11 @@ def export_audit_logs_to_csv():
     """
     Export organization audit logs to OrgAuditLogs.csv.
     Uses fetch_and_display_api_data to handle API call, CSV writing, and table display.
+    With --delta-sync only entries newer than the last sync are requested and merged in.
     """
+    if delta_sync_enabled:
+        sync_time_window_dataset_incrementally("OrgAuditLogs.csv", mistapi.api.v1.orgs.logs.listOrgAuditLogs, ["id"])
+        return
     logging.info("Starting export of organization audit logs...")
     fetch_and_display_api_data(
         title="List Audit Logs:",
@@ -820,9 +1876,70 @@ def export_all_devices_to_csv():
     )
     logging.info("Completed export_all_devices_to_csv and wrote results to OrgDevices.csv.")  # Log completion
 
+# Snapshots of per-object API results, used to only refetch objects whose change marker moved
+site_settings_snapshot_file = "site_settings_snapshot.json"
+site_settings_full_refresh_hours = 24  # Setting changes do not always bump the site's modified_time
+gateway_config_snapshot_file = "gateway_config_snapshot.json"
+gateway_config_full_refresh_hours = 24
+
+def load_change_marker_snapshot(snapshot_file, org_id):
+    """
+    Loads a change-marker snapshot for this org, or an empty one if missing, unreadable or from another org.
+    The snapshot maps object ID -> {"marker": <change marker>, "data": <last fetched API data>}.
+    """
+    try:
+        with open(snapshot_file, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        snapshot = {}
+    if snapshot.get("org_id") != org_id or not isinstance(snapshot.get("items"), dict):
+        return {"org_id": org_id, "full_refresh_epoch": 0, "items": {}}
+    return snapshot
+
+def save_change_marker_snapshot(snapshot_file, snapshot):
+    """
+    Writes a change-marker snapshot atomically.
+    """
+    with open_file_for_atomic_replace(snapshot_file) as f:
+        json.dump(snapshot, f)
+
+def split_objects_by_change_marker(snapshot, objects, get_marker, full_refresh_hours):
+    """
+    Splits objects into those that must be fetched (new, or marker changed) and the snapshot entries
+    that can be reused. All objects are fetched once the last full refresh is older than full_refresh_hours.
+    Returns (objects_to_fetch, reusable_items, is_full_refresh).
+    """
+    is_full_refresh = time.time() - snapshot.get("full_refresh_epoch", 0) >= full_refresh_hours * 3600
+    previous_items = {} if is_full_refresh else snapshot["items"]
+    objects_to_fetch = []
+    reusable_items = {}
+    for obj in objects:
+        previous = previous_items.get(obj.get("id"))
+        if previous and previous.get("marker") == get_marker(obj):
+            reusable_items[obj.get("id")] = previous
+        else:
+            objects_to_fetch.append(obj)
+    return objects_to_fetch, reusable_items, is_full_refresh
+
+def update_change_marker_snapshot(snapshot_file, snapshot, current_items, is_full_refresh, failed_ids):
+    """
+    Replaces the snapshot items with current_items (so deleted objects drop out) and saves it.
+    Objects whose fetch failed keep their previous data with a cleared marker, so they are retried next run.
+    """
+    for object_id in failed_ids:
+        if object_id in snapshot["items"]:
+            current_items[object_id] = dict(snapshot["items"][object_id], marker=None)
+    snapshot["items"] = current_items
+    if is_full_refresh and not failed_ids:
+        snapshot["full_refresh_epoch"] = time.time()
+    save_change_marker_snapshot(snapshot_file, snapshot)
+
 def fetch_all_site_settings_from_api(apisession, org_id, limit=1000):
     """
     Fetches configuration settings for all sites in the organization.
+    Only sites that are new or whose modified_time changed since the last run are fetched;
+    the others are served from site_settings_snapshot.json. Every site_settings_full_refresh_hours
+    all sites are fetched again.
 
     Args:
         apisession: The Mist API session object.
@@ -834,25 +1951,54 @@ def fetch_all_site_settings_from_api(apisession, org_id, limit=1000):
     """
     logging.info("Fetching all site settings...")
 
-    # Use mistapi.get_all to ensure pagination is handled for all sites
-    response = mistapi.api.v1.orgs.sites.listOrgSites(apisession, org_id)
-    sites = mistapi.get_all(response=response, mist_session=apisession)
+    # Sites come from the shared registry (paginated once per run)
+    try:
+        sites = get_shared_org_collection("sites", org_id, apisession)
+    except Exception as e:
+        # Without the complete site list the snapshot would drop the missing sites as deleted
+        logging.error(f"❌ Failed to fetch org sites: {e}")
+        return []
+
+    snapshot = load_change_marker_snapshot(site_settings_snapshot_file, org_id)
+    sites_to_fetch, current_sites, is_full_refresh = split_objects_by_change_marker(
+        snapshot, sites, lambda site: site.get("modified_time"), site_settings_full_refresh_hours
+    )
+    logging.info(f"Site settings: {len(sites_to_fetch)} new/changed sites to fetch, {len(current_sites)} unchanged from snapshot.")
 
-    all_configs = []
-    for site in tqdm(sites, desc="Sites", unit="site"):
+    def fetch_site_setting(site):
         site_id = site.get("id")
         site_name = site.get("name", "Unnamed Site")
         try:
             # Fetch the site settings using the Mist API
-            config = mistapi.api.v1.sites.setting.getSiteSetting(apisession, site_id).data
-            config["site_id"] = site_id
-            config["site_name"] = site_name
-            all_configs.append(config)
+            response = mistapi.api.v1.sites.setting.getSiteSetting(apisession, site_id)
+            if response.status_code != 200:
+                # Error bodies must not be stored in the snapshot as if they were settings
+                raise RuntimeError(f"HTTP {response.status_code}")
             logging.info(f"✅ Fetched config for site: {site_name} (ID: {site_id})")
+            return response.data
         except Exception as e:
             logging.warning(f"⚠️ Failed to fetch config for {site_name} (ID: {site_id}): {e}")
+            return None
+
+    failed_site_ids = []
+    fetched_settings = run_api_calls_concurrently(sites_to_fetch, fetch_site_setting, description="Sites", unit="site")
+    for site, config in zip(sites_to_fetch, fetched_settings):
+        if config is None:
+            failed_site_ids.append(site.get("id"))
+        else:
+            current_sites[site.get("id")] = {"marker": site.get("modified_time"), "data": config}
+    update_change_marker_snapshot(site_settings_snapshot_file, snapshot, current_sites, is_full_refresh, failed_site_ids)
 
-    logging.info(f"Fetched settings for {len(all_configs)} sites.")
+    all_configs = []
+    for site in sites:
+        entry = current_sites.get(site.get("id"))
+        if entry:
+            config = dict(entry["data"])
+            config["site_id"] = site.get("id")
+            config["site_name"] = site.get("name", "Unnamed Site")
+            all_configs.append(config)
+
+    logging.info(f"Fetched settings for {len(all_configs)} sites ({len(sites_to_fetch) - len(failed_site_ids)} from the API).")
     return all_configs
 
 def export_site_settings_to_csv():
@@ -972,45 +2118,118 @@ def export_alarm_definitions_to_csv():
         ])
     logging.info("\n" + table.get_string())  # Log the table output
 
+# Constant definition datasets (menus 4-10): output file -> (endpoint name, fetch function, sort key)
+constant_definition_exports = {
+    "NacEventDefinitions.csv": ("listNacEventsDefinitions", lambda session: mistapi.api.v1.const.nac_events.listNacEventsDefinitions(session), None),
+    "ClientEventDefinitions.csv": ("listClientEventsDefinitions", lambda session: mistapi.api.v1.const.client_events.listClientEventsDefinitions(session), None),
+    "DeviceEventDefinitions.csv": ("listDeviceEventsDefinitions", lambda session: mistapi.api.v1.const.device_events.listDeviceEventsDefinitions(session), None),
+    "MistEdgeEventDefinitions.csv": ("listMxEdgeEventsDefinitions", lambda session: mistapi.api.v1.const.mxedge_events.listMxEdgeEventsDefinitions(session), None),
+    "OtherEventDefinitions.csv": ("listOtherDeviceEventsDefinitions", lambda session: mistapi.api.v1.const.otherdevice_events.listOtherDeviceEventsDefinitions(session), None),
+    "SystemEventDefinitions.csv": ("listSystemEventsDefinitions", lambda session: mistapi.api.v1.const.system_events.listSystemEventsDefinitions(session), None),
+    "AlarmDefinitions.csv": ("listAlarmDefinitions", lambda session: mistapi.api.v1.const.alarm_defs.listAlarmDefinitions(session), "key"),
+}
+
+def sync_all_constant_definitions_to_csv(force=False):
+    """
+    Fetches all seven constant definition sets concurrently and writes them to their CSV files.
+    Definitions still within their multi-day TTL for the same mistapi version are skipped, and a
+    CSV is only rewritten when the content hash of the fetched definitions changed.
+    """
+    logging.info("📚 Syncing all event and alarm definitions...")
+    print("📚 Syncing all event and alarm definitions...")
+    mistapi_version = str(getattr(mistapi, "__version__", "unknown"))
+    manifest = load_dataset_manifest()
+
+    # Decide which definition sets are due for a refresh
+    due_file_names = []
+    for file_name in constant_definition_exports:
+        entry = manifest.get(file_name, {})
+        age_minutes = (time.time() - entry.get("generated_epoch", 0)) / 60
+        if force or not os.path.exists(file_name) or entry.get("mistapi_version") != mistapi_version or age_minutes >= get_dataset_cache_ttl_minutes(file_name):
+            due_file_names.append(file_name)
+        else:
+            logging.info(f"✅ {file_name} is within its {get_dataset_cache_ttl_minutes(file_name)} minute TTL for mistapi {mistapi_version}. Skipping.")
+
+    if not due_file_names:
+        print("✅ All definitions are fresh. Nothing to sync.")
+        return
+
+    def fetch_constant_definitions(file_name):
+        fetch_started = time.time()
+        response = constant_definition_exports[file_name][1](apisession)
+        return response, time.time() - fetch_started
+
+    # Fetch every due definition set at the same time
+    fetched_results = run_api_calls_concurrently(due_file_names, fetch_constant_definitions, description="Definitions", unit="set", max_workers=len(due_file_names))
+    fetched_definitions = {file_name: result for file_name, result in zip(due_file_names, fetched_results) if result}
+
+    changed_files, unchanged_files = [], []
+    for file_name, (response, fetch_duration_seconds) in fetched_definitions.items():
+        endpoint, _, sort_key = constant_definition_exports[file_name]
+        definitions = response.data
+        if getattr(response, "status_code", 200) != 200 or not isinstance(definitions, list):
+            logging.warning(f"⚠️ Unexpected response for {file_name} (status {getattr(response, 'status_code', None)}). Keeping existing file.")
+            continue
+        if sort_key:
+            definitions = sorted(definitions, key=lambda x: x.get(sort_key, ""))
+
+        # Hash before writing: write_dict_list_to_csv sanitizes the rows in place
+        content_hash = hashlib.sha256(json.dumps(definitions, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        previous_hash = manifest.get(file_name, {}).get("content_hash")
+        if content_hash == previous_hash and os.path.exists(file_name):
+            logging.info(f"✅ {file_name} unchanged (hash {content_hash[:12]}). Not rewriting.")
+            unchanged_files.append(file_name)
+        else:
+            write_dict_list_to_csv(definitions, file_name)
+            changed_files.append(file_name)
+
+        # Refresh the TTL and remember the hash/version for the next sync
+        record_dataset_manifest_entry(
+            file_name,
+            endpoint=endpoint,
+            row_count=len(definitions),
+            fetch_duration_seconds=fetch_duration_seconds,
+            extra_fields={"content_hash": content_hash, "mistapi_version": mistapi_version}
+        )
+
+    summary = f"✅ Definitions synced: {len(changed_files)} updated, {len(unchanged_files)} unchanged, {len(constant_definition_exports) - len(due_file_names)} still fresh."
+    logging.info(summary)
+    print(summary)
+
 def export_gateway_synthetic_tests_to_csv():
     """
     Collects and exports synthetic test stats for all gateways in the organization.
-    Iterates through all sites with gateways, fetches synthetic test stats for each gateway device,
-    and writes the results to AllGatewaySyntheticTests.csv.
+    The work list comes straight from the shared org inventory (no per-site device listing);
+    each gateway's synthetic test stats are then fetched concurrently within the rate budget,
+    and the results are written to AllGatewaySyntheticTests.csv.
     """
     logging.info("[INFO] Collecting synthetic test stats for all gateways in the org...")
     org_id = get_cached_or_prompted_org_id()
-    site_ids = get_site_ids_with_gateway_devices(apisession, org_id)
-    all_stats = []
-    smoothed = None
+    inventory = get_shared_org_collection("inventory", org_id, apisession)
+    work_items = [(device["site_id"], device) for device in inventory if device.get("type") == "gateway" and device.get("site_id") and device.get("id")]
 
-    if not site_ids:
-        logging.warning("[WARN] No sites with gateways found. Exiting export_gateway_synthetic_tests_to_csv.")
+    if not work_items:
+        logging.warning("[WARN] No gateways assigned to sites found. Exiting export_gateway_synthetic_tests_to_csv.")
         return
+    logging.info(f"[INFO] Found {len(work_items)} gateways across {len({site_id for site_id, _ in work_items})} sites in the org inventory.")
 
-    for site_id in tqdm(site_ids, desc="Sites", unit="site"):
+    def fetch_synthetic_test_stats(work_item):
+        site_id, device = work_item
+        device_id = device.get("id")
+        device_name = device.get("name", "")
         try:
-            response = mistapi.api.v1.sites.devices.listSiteDevices(apisession, site_id, type="gateway")
-            devices = mistapi.get_all(response=response, mist_session=apisession)
-            logging.info(f"[INFO] Found {len(devices)} gateway devices at site {site_id}.")
-            for device in tqdm(devices, desc=f"Site {site_id}", unit="device", leave=False):
-                device_id = device.get("id")
-                device_name = device.get("name", "")
-                try:
-                    stats = mistapi.api.v1.sites.devices.getSiteDeviceSyntheticTest(apisession, site_id, device_id).data
-                    stats["site_id"] = site_id
-                    stats["site_name"] = device.get("site_name", "")
-                    stats["device_id"] = device_id
-                    stats["device_name"] = device_name
-                    all_stats.append(stats)
-                    logging.info(f"[INFO] Collected synthetic test stats for device {device_name} ({device_id}) at site {site_id}.")
-                except Exception as e:
-                    logging.warning(f"⚠️ Failed to fetch test stats for device {device_id} at site {site_id}: {e}")
-                smoothed, delay = get_rate_limited_delay(smoothed)
-                logging.info(f"[INFO] Sleeping for {delay}.")
-                time.sleep(delay)
+            stats = mistapi.api.v1.sites.devices.getSiteDeviceSyntheticTest(apisession, site_id, device_id).data
+            stats["site_id"] = site_id
+            stats["site_name"] = device.get("site_name", "")
+            stats["device_id"] = device_id
+            stats["device_name"] = device_name
+            logging.info(f"[INFO] Collected synthetic test stats for device {device_name} ({device_id}) at site {site_id}.")
+            return stats
         except Exception as e:
-            logging.warning(f"⚠️ Failed to list devices for site {site_id}: {e}")
+            logging.warning(f"⚠️ Failed to fetch test stats for device {device_id} at site {site_id}: {e}")
+            return None
+
+    all_stats = [stats for stats in run_api_calls_concurrently(work_items, fetch_synthetic_test_stats, description="Gateways", unit="device") if stats]
 
     if all_stats:
         filename = "AllGatewaySyntheticTests.csv"
@@ -1033,9 +2252,8 @@ def get_site_ids_with_gateway_devices(apisession, org_id):
         List of site IDs that have at least one gateway device.
     """
     logging.info("[INFO] Fetching org inventory to find sites with gateways...")
-    # Fetch the full org inventory (all devices)
-    response = mistapi.api.v1.orgs.inventory.getOrgInventory(apisession, org_id, limit=1000)
-    devices = mistapi.get_all(response=response, mist_session=apisession)
+    # Fetch the full org inventory (all devices) from the shared registry
+    devices = get_shared_org_collection("inventory", org_id, apisession)
     logging.info(f"[INFO] Retrieved {len(devices)} devices from org inventory.")
 
     # Collect unique site_ids for devices of type 'gateway'
@@ -1052,14 +2270,12 @@ def export_gateway_test_results_by_site_to_csv():
     logging.info("[INFO] Searching all test results (including speed tests) for sites with gateways...")
     org_id = get_cached_or_prompted_org_id()
     site_ids = get_site_ids_with_gateway_devices(apisession, org_id)
-    all_results = []
-    smoothed = None  # Initialize smoothed variable for dynamic delay
 
     if not site_ids:
         logging.warning("⚠️ No sites with gateways found.")
         return
 
-    for site_id in tqdm(site_ids, desc="Sites", unit="site"):
+    def fetch_site_test_results(site_id):
         try:
             # Fetch synthetic test results for the current site
             response = mistapi.api.v1.sites.synthetic_test.searchSiteSyntheticTest(
@@ -1067,7 +2283,7 @@ def export_gateway_test_results_by_site_to_csv():
             )
             if not hasattr(response, "data"):
                 logging.warning(f"⚠️ No data attribute in response for site {site_id}")
-                continue
+                return []
 
             # Extract results from the response
             results = response.data.get("results", []) if isinstance(response.data, dict) else []
@@ -1075,11 +2291,14 @@ def export_gateway_test_results_by_site_to_csv():
 
             for result in results:
                 result["site_id"] = site_id  # Annotate result with site_id
-                all_results.append(result)
-            smoothed, delay = get_rate_limited_delay(smoothed)
-            time.sleep(delay)
+            return results
         except Exception as e:
             logging.warning(f"⚠️ Failed to fetch test results for site {site_id}: {e}")
+            return []
+
+    all_results = []
+    for results in run_api_calls_concurrently(site_ids, fetch_site_test_results, description="Sites", unit="site"):
+        all_results.extend(results or [])
     
     if all_results:
         filename = "AllGatewayTestResults.csv"
@@ -1101,9 +2320,8 @@ def export_sites_with_location_to_csv():
     org_id = get_cached_or_prompted_org_id()
     logging.debug(f"Using org_id: {org_id} for site location export.")
 
-    # Fetch all sites in the organization
-    response = mistapi.api.v1.orgs.sites.listOrgSites(apisession, org_id)
-    sites = mistapi.get_all(response=response, mist_session=apisession)
+    # Fetch all sites in the organization from the shared registry
+    sites = get_shared_org_collection("sites", org_id)
     logging.info(f"Fetched {len(sites)} sites from the organization.")
 
     # Flatten and sanitize all site data
@@ -1122,9 +2340,8 @@ def export_gateways_with_site_info_to_csv():
     logging.info("Fetching Gateways with Site Info...")
     org_id = get_cached_or_prompted_org_id()
 
-    # Fetch site list and build a lookup dictionary for site info
-    site_response = mistapi.api.v1.orgs.sites.listOrgSites(apisession, org_id)
-    sites = mistapi.get_all(response=site_response, mist_session=apisession)
+    # Fetch site list from the shared registry and build a lookup dictionary for site info
+    sites = get_shared_org_collection("sites", org_id)
     site_lookup = {
         site["id"]: {
             "name": site.get("name", ""),
@@ -1133,9 +2350,8 @@ def export_gateways_with_site_info_to_csv():
     }
     logging.debug(f"Loaded {len(site_lookup)} sites for lookup.")
 
-    # Fetch org inventory (all devices)
-    inv_response = mistapi.api.v1.orgs.inventory.getOrgInventory(apisession, org_id)
-    inventory = mistapi.get_all(response=inv_response, mist_session=apisession)
+    # Fetch org inventory (all devices) from the shared registry
+    inventory = get_shared_org_collection("inventory", org_id)
     logging.debug(f"Loaded {len(inventory)} devices from org inventory.")
 
     def split_address(address):
@@ -1160,6 +2376,7 @@ def export_gateways_with_site_info_to_csv():
     gateways = []
     for device in tqdm(inventory, desc="Processing Gateways", unit="device"):
         if device.get("type") == "gateway":
+            device = dict(device)  # Copy so the shared inventory stays untouched
             site_id = device.get("site_id")
             site_info = site_lookup.get(site_id, {"name": "Unknown", "address": "Unknown"})
             device["site_name"] = site_info["name"]
@@ -1206,9 +2423,8 @@ def export_devices_with_site_info_to_csv():
     logging.info("Fetching All Devices with Site Info...")  # Log start of function
     org_id = get_cached_or_prompted_org_id()
 
-    # Fetch all sites and build a lookup dictionary for site info
-    site_response = mistapi.api.v1.orgs.sites.listOrgSites(apisession, org_id)
-    sites = mistapi.get_all(response=site_response, mist_session=apisession)
+    # Fetch all sites from the shared registry and build a lookup dictionary for site info
+    sites = get_shared_org_collection("sites", org_id)
     site_lookup = {
         site["id"]: {
             "name": site.get("name", ""),
@@ -1217,9 +2433,8 @@ def export_devices_with_site_info_to_csv():
     }
     logging.debug(f"Loaded {len(site_lookup)} sites for lookup.")
 
-    # Fetch org inventory (all devices)
-    inv_response = mistapi.api.v1.orgs.inventory.getOrgInventory(apisession, org_id)
-    inventory = mistapi.get_all(response=inv_response, mist_session=apisession)
+    # Fetch org inventory (all devices) from the shared registry
+    inventory = get_shared_org_collection("inventory", org_id)
     logging.debug(f"Loaded {len(inventory)} devices from org inventory.")
 
     def split_address(address):
@@ -1242,6 +2457,7 @@ def export_devices_with_site_info_to_csv():
 
     enriched_devices = []
     for device in tqdm(inventory, desc="Processing Devices", unit="device"):
+        device = dict(device)  # Copy so the shared inventory stays untouched
         site_id = device.get("site_id")
         site_info = site_lookup.get(site_id, {"name": "Unknown", "address": "Unknown"})
         device["site_name"] = site_info["name"]
@@ -1298,10 +2514,10 @@ def generate_support_package():
     # Ensure all required files are fresh or regenerate them
     for filename, func in required_files:
         logging.debug(f"Checking freshness of {filename}...")
-        check_and_generate_csv(filename, func, freshness_minutes=15)
+        check_and_generate_csv(filename, func)
 
     # Ensure SiteList.csv is generated before loading
-    check_and_generate_csv('SiteList.csv', export_all_sites_to_csv, freshness_minutes=15)
+    check_and_generate_csv('SiteList.csv', export_all_sites_to_csv)
 
     # Load the pulled data into dictionaries
     logging.debug("Loading CSV data into dictionaries for support package assembly...")
@@ -1353,20 +2569,19 @@ def load_csv_grouped_by_key(filename, key):
     Adds logging for file loading and key distribution.
     """
     logging.info(f"Loading CSV file '{filename}' into dictionary keyed by '{key}'...")
-    with open(filename, mode='r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)  # Create a CSV reader
-        data_dict = {}  # Initialize an empty dictionary
-        row_count = 0
-        for row in reader:
-            data_key = row.get(key)  # Get the value to use as the key
-            if data_key is None:
-                logging.warning(f"Row missing key '{key}': {row}")
-                continue
-            if data_key not in data_dict:
-                data_dict[data_key] = []  # Initialize a list for this key
-            data_dict[data_key].append(row)  # Add the row to the dictionary
-            row_count += 1
-        logging.info(f"Loaded {row_count} rows from '{filename}'. Found {len(data_dict)} unique keys for '{key}'.")
+    reader = load_csv_rows_with_memory_cache(filename)  # Parsed rows, reused from memory when unchanged
+    data_dict = {}  # Initialize an empty dictionary
+    row_count = 0
+    for row in reader:
+        data_key = row.get(key)  # Get the value to use as the key
+        if data_key is None:
+            logging.warning(f"Row missing key '{key}': {row}")
+            continue
+        if data_key not in data_dict:
+            data_dict[data_key] = []  # Initialize a list for this key
+        data_dict[data_key].append(row)  # Add the row to the dictionary
+        row_count += 1
+    logging.info(f"Loaded {row_count} rows from '{filename}'. Found {len(data_dict)} unique keys for '{key}'.")
     return data_dict  # Return the dictionary
 
 def write_support_data_to_csv(data, filename):
@@ -1386,7 +2601,7 @@ def write_support_data_to_csv(data, filename):
 
     logging.debug(f"Final CSV fieldnames: {fieldnames}")
 
-    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+    with open_file_for_atomic_replace(filename, newline='') as file:
         writer = csv.DictWriter(file, fieldnames=fieldnames)  # Create a CSV writer
         writer.writeheader()  # Write the header row
         row_count = 0
@@ -1410,7 +2625,7 @@ def poll_marvis_actions():
 
     # Call the Mist API to get Marvis actions
     response = mistapi.api.v1.orgs.troubleshoot.troubleshootOrg(apisession, org_id)
-    rawdata = mistapi.get_all(response=response, mist_session=apisession)
+    rawdata = get_all_pages_concurrently(response=response, mist_session=apisession)
     logging.info(f"Fetched {len(rawdata)} Marvis actions from API.")
 
     # Filter only open actions (state == "open")
@@ -1437,7 +2652,7 @@ def export_current_guest_users_to_csv():
 
     # Call the Mist API to get current guest authorizations
     response = mistapi.api.v1.orgs.guests.searchOrgGuestAuthorization(apisession, org_id, limit=1000)
-    guests = mistapi.get_all(response=response, mist_session=apisession)
+    guests = get_all_pages_concurrently(response=response, mist_session=apisession)
     logging.info(f"Fetched {len(guests)} current guest users from API.")
 
     # Flatten nested fields for CSV compatibility
@@ -1454,16 +2669,17 @@ def export_historical_guest_users_to_csv():
     Export all guest users from the last 7 days to OrgHistoricalGuests.csv
     """
     logging.info("Exporting all guest users from the last 7 days...")  # Log start of function
-    org_id = get_cached_or_prompted_org_id()
     # Calculate epoch for 7 days ago
     end_time = int(time.time())
     start_time = end_time - 7 * 24 * 3600
     logging.debug(f"Fetching guest authorizations from {start_time} to {end_time} (epoch seconds).")
-    # Call the Mist API to get guest authorizations in the last 7 days
-    response = mistapi.api.v1.orgs.guests.searchOrgGuestAuthorization(
-        apisession, org_id, limit=1000, start=start_time, end=end_time
+    # Search the 7 days as parallel time windows rather than one long cursor
+    guests = fetch_time_range_in_shards(
+        mistapi.api.v1.orgs.guests.searchOrgGuestAuthorization, start_time, end_time, description="Guest windows"
     )
-    guests = mistapi.get_all(response=response, mist_session=apisession)
+    if guests is None:
+        logging.warning("⚠️ Guest authorizations could not be fetched completely. Keeping the existing OrgHistoricalGuests.csv.")
+        return
     logging.info(f"Fetched {len(guests)} historical guest users from API.")
     # Flatten nested fields for CSV compatibility
     guests = flatten_nested_fields_in_list(guests)
@@ -1473,27 +2689,67 @@ def export_historical_guest_users_to_csv():
     write_dict_list_to_csv(guests, "OrgHistoricalGuests.csv")
     logging.info("✅ Historical guests exported to OrgHistoricalGuests.csv")  # Log completion
 
+def find_virtual_chassis_member_switches(org_id, switches):
+    """
+    Uses one paginated org-level device stats call to tell which switches belong to a virtual chassis.
+    The org-level endpoint returns a reduced field set, so module_stat and vc_mac are requested explicitly.
+    A VC shows up as a stats entry whose module_stat lists more than one member with a vc_role;
+    its members are matched to inventory switches by device ID, MAC, serial or vc_mac.
+    Returns the set of inventory device IDs that are VC members, or None when the stats carry
+    no module_stat at all (membership unknown, so every switch must be checked individually).
+    """
+    response = mistapi.api.v1.orgs.stats.listOrgDevicesStats(apisession, org_id, type="switch", fields="module_stat,vc_mac", limit=1000)
+    if response.status_code != 200:
+        logging.warning(f"⚠️ Org switch stats returned status {response.status_code}; VC membership unknown.")
+        return None
+    try:
+        switch_stats = get_all_pages_concurrently(response=response, mist_session=apisession) or []
+    except IncompletePaginationError as e:
+        logging.warning(f"⚠️ Org switch stats are incomplete ({e}); VC membership unknown.")
+        return None
+    if not any(isinstance(stats, dict) and "module_stat" in stats for stats in switch_stats):
+        logging.warning("⚠️ Org switch stats carry no module_stat; VC membership unknown.")
+        return None
+
+    member_device_ids, member_macs, member_serials, vc_macs = set(), set(), set(), set()
+    for stats in switch_stats:
+        members = [module for module in stats.get("module_stat") or [] if isinstance(module, dict) and module.get("vc_role")]
+        if len(members) < 2:
+            continue  # Standalone switch
+        member_device_ids.add(stats.get("id"))
+        if stats.get("vc_mac"):
+            vc_macs.add(stats["vc_mac"])
+        for module in members:
+            member_macs.add(module.get("mac"))
+            member_serials.add(module.get("serial"))
+
+    return {
+        switch.get("id") for switch in switches
+        if switch.get("id") in member_device_ids
+        or (switch.get("mac") and switch.get("mac") in member_macs)
+        or (switch.get("serial") and switch.get("serial") in member_serials)
+        or (switch.get("vc_mac") and switch.get("vc_mac") in vc_macs)
+    }
+
 def export_switch_vc_stats_to_csv():
     """
     Export virtual chassis stats (including stacking cable info) for all switches in the org.
+    VC membership comes from bulk org switch stats, so getSiteDeviceVirtualChassis is only called
+    for switches that are VC members; standalone switches are listed without VC details.
     """
     logging.info("Exporting all switch virtual chassis stats...")
 
     # Ensure OrgInventory.csv is fresh
-    check_and_generate_csv("OrgInventory.csv", export_device_inventory_to_csv, freshness_minutes=15)
+    check_and_generate_csv("OrgInventory.csv", export_device_inventory_to_csv)
 
     # Load OrgInventory.csv and filter for switches
-    with open("OrgInventory.csv", mode="r", encoding="utf-8") as file:
-        reader = csv.DictReader(file)
-        switches = [row for row in reader if row.get("type") == "switch"]
+    switches = [row for row in load_csv_rows_with_memory_cache("OrgInventory.csv") if row.get("type") == "switch"]
 
     if not switches:
         logging.warning("No switches found in OrgInventory.csv.")
         return
 
-    all_vc_stats = []
-
-    for switch in tqdm(switches, desc="Switches", unit="switch"):
+    def fetch_switch_vc_stats(switch):
         site_id = switch.get("site_id")
         device_id = switch.get("id")
         name = switch.get("name", "")
@@ -1504,25 +2760,45 @@ def export_switch_vc_stats_to_csv():
         # Log which switch is being processed
         logging.debug(f"Processing switch: name={name}, id={device_id}, site_id={site_id}, mac={mac}, model={model}, serial={serial}")
 
-        if not site_id or not device_id:
-            logging.warning(f"Skipping switch with missing site_id or device_id: name={name}, mac={mac}")
-            continue
-
         try:
             # Get VC stats for this switch (returns a flat dict)
             vc_stats = mistapi.api.v1.sites.devices.getSiteDeviceVirtualChassis(apisession, site_id, device_id).data
             logging.debug(f"Fetched VC stats for switch {name} ({device_id}): {vc_stats}")
             # Merge all switch info and VC info into a single dictionary
-            entry = {**switch, **vc_stats}
-            all_vc_stats.append(entry)
+            return {**switch, **vc_stats}
         except Exception as e:
             logging.warning(f"Failed to fetch VC stats for switch {name} ({device_id}): {e}")
+            return None
 
-    # Flatten and write to CSV
-    logging.info(f"Flattening and sanitizing {len(all_vc_stats)} VC stats entries for CSV export.")
-    all_vc_stats = flatten_nested_fields_in_list(all_vc_stats)
-    all_vc_stats = escape_multiline_strings_for_csv(all_vc_stats)
-    write_dict_list_to_csv(all_vc_stats, "OrgSwitchVCStats.csv")
+    fetchable_switches = []
+    for switch in switches:
+        if not switch.get("site_id") or not switch.get("id"):
+            logging.warning(f"Skipping switch with missing site_id or device_id: name={switch.get('name', '')}, mac={switch.get('mac', '')}")
+            continue
+        fetchable_switches.append(switch)
+
+    # Only VC members need the per-device call; without membership data every switch is checked
+    vc_member_ids = find_virtual_chassis_member_switches(get_cached_or_prompted_org_id(), fetchable_switches)
+    if vc_member_ids is None:
+        vc_member_switches, standalone_switches = fetchable_switches, []
+    else:
+        vc_member_switches = [switch for switch in fetchable_switches if switch.get("id") in vc_member_ids]
+        standalone_switches = [switch for switch in fetchable_switches if switch.get("id") not in vc_member_ids]
+    logging.info(f"{len(vc_member_switches)} switches need VC details, {len(standalone_switches)} are standalone.")
+
+    # Each switch's result is journaled as it completes so an interrupted run can --resume
+    with collection_journal("OrgSwitchVCStats") as journal:
+        all_vc_stats = [entry for entry in run_api_calls_concurrently(
+            vc_member_switches, fetch_switch_vc_stats, description="Switches", unit="switch",
+            journal=journal, journal_key=lambda switch: switch.get("id")
+        ) if entry]
+        all_vc_stats += [dict(switch) for switch in standalone_switches]
+
+        # Flatten and write to CSV
+        logging.info(f"Flattening and sanitizing {len(all_vc_stats)} VC stats entries for CSV export.")
+        all_vc_stats = flatten_nested_fields_in_list(all_vc_stats)
+        all_vc_stats = escape_multiline_strings_for_csv(all_vc_stats)
+        write_dict_list_to_csv(all_vc_stats, "OrgSwitchVCStats.csv")
     logging.info(f"✅ Switch VC stats exported to OrgSwitchVCStats.csv ({len(all_vc_stats)} records).")
     # Optionally log a preview of the data
     if all_vc_stats:
@@ -1814,7 +3090,8 @@ def _save_output_to_file(compiled_output, filename="arp_output_raw.txt"):
 def trigger_arp_command(mist_host, mist_apitoken, site_id, device_id):
     url = f"https://{mist_host}/api/v1/sites/{site_id}/devices/{device_id}/arp"
     headers = {'Authorization': f'Token {mist_apitoken}'}
-    response = requests.post(url, headers=headers, json={})
+    # Reuse the pooled keep-alive connections of the API session instead of a fresh connection
+    response = get_shared_http_session().post(url, headers=headers, json={})
 
     if response.status_code == 200:
         session_id = response.json().get("session")
@@ -1855,26 +3132,39 @@ def loop_refresh_core_datasets(delay=None, debug=False):
     get_cached_or_prompted_org_id()  # Ensure org_id is loaded from .env if not already
 
     try:
-        while True:
-            if os.path.exists("stop_loop.txt"):
-                logging.info("🛑 Stop signal detected (stop_loop.txt). Exiting loop.")
-                break
-
-            export_all_sites_to_csv()
-            export_device_inventory_to_csv()
-            export_device_stats_to_csv()
-            export_device_port_stats_to_csv()
-            export_vpn_peer_stats_to_csv()
-            logging.info("✅ All datasets refreshed.")
-
-            # Determine delay
-            if delay is not None:
-                actual_delay = delay
-            else:
-                smoothed, actual_delay = get_rate_limited_delay(smoothed)
+        # Loop mode is background work: it pauses while the budget is tight, leaving the rest to operators and exports
+        with api_call_priority("background"):
+            while True:
+                if os.path.exists("stop_loop.txt"):
+                    logging.info("🛑 Stop signal detected (stop_loop.txt). Exiting loop.")
+                    break
+
+                pause_seconds = get_background_budget_pause_seconds()
+                if pause_seconds > 0:
+                    logging.info(f"⏸️ API budget is tight. Background refresh paused for {pause_seconds:.0f} seconds.")
+                    time.sleep(pause_seconds)
+                    continue
+
+                # Hold each dataset's lock while refreshing it so other processes wait and reuse the result
+                for file_name, generate_function in [
+                    ("SiteList.csv", export_all_sites_to_csv),
+                    ("OrgInventory.csv", export_device_inventory_to_csv),
+                    ("OrgDeviceStats.csv", export_device_stats_to_csv),
+                    ("OrgDevicePortStats.csv", export_device_port_stats_to_csv),
+                    ("OrgVPNPeerStats.csv", export_vpn_peer_stats_to_csv),
+                ]:
+                    with dataset_generation_lock(file_name):
+                        generate_function()
+                logging.info("✅ All datasets refreshed.")
+
+                # Determine delay
+                if delay is not None:
+                    actual_delay = delay
+                else:
+                    smoothed, actual_delay = get_rate_limited_delay(smoothed)
 
-            logging.info(f"⏳ Sleeping for {actual_delay:.2f} seconds...")
-            time.sleep(actual_delay)
+                logging.info(f"⏳ Sleeping for {actual_delay:.2f} seconds...")
+                time.sleep(actual_delay)
 
     except KeyboardInterrupt:
         logging.info("🛑 Loop interrupted by user (Ctrl+C). Exiting gracefully.")
@@ -1886,12 +3176,98 @@ def load_pid_tuning_data():
                 return json.load(f)
         except json.JSONDecodeError as e:
             logging.warning(f"⚠️ Failed to parse tuning_data.json: {e}. Using defaults.")
-    return {"k_p": 0.1, "k_i": 0.0005, "error": [], "integral": 0.0}
+    return {**default_pid_tuning_data, "error": []}
 
 def save_pid_tuning_data(data):
-    with open(tuning_data_file, 'w') as f:
+    with open_file_for_atomic_replace(tuning_data_file) as f:
         json.dump(data, f, indent=2)
 
+def get_pid_tuning_state():
+    """
+    Returns the in-memory PID tuning state, loading it from tuning_data.json on first use.
+    Callers change it in place and call mark_controller_state_changed().
+    """
+    global _pid_tuning_state
+    with _api_usage_lock:
+        if _pid_tuning_state is None:
+            _pid_tuning_state = load_pid_tuning_data()
+        return _pid_tuning_state
+
+def mark_controller_state_changed():
+    """
+    Notes that the tuning state changed and flushes it once the flush interval has passed.
+    """
+    global _pid_tuning_state_dirty
+    with _api_usage_lock:
+        _pid_tuning_state_dirty = True
+        if time.monotonic() - _controller_state_last_flush >= controller_state_flush_interval_seconds:
+            flush_controller_state()
+
+def record_delay_metrics(delay_metrics):
+    """
+    Folds one delay calculation into the aggregate for the current UTC minute.
+    """
+    minute = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M")
+    with _api_usage_lock:
+        aggregate = _pending_delay_metrics.setdefault(minute, {
+            "minute": minute, "count": 0,
+            "final_delay_sum": 0.0, "final_delay_min": None, "final_delay_max": None,
+            "error_sum": 0.0, "error_min": None, "error_max": None,
+        })
+        aggregate["count"] += 1
+        for name in ("final_delay", "error"):
+            value = delay_metrics[name]
+            aggregate[f"{name}_sum"] += value
+            aggregate[f"{name}_min"] = value if aggregate[f"{name}_min"] is None else min(aggregate[f"{name}_min"], value)
+            aggregate[f"{name}_max"] = value if aggregate[f"{name}_max"] is None else max(aggregate[f"{name}_max"], value)
+        aggregate["used"] = delay_metrics["used"]
+        aggregate["limit"] = delay_metrics["limit"]
+        aggregate["alpha"] = delay_metrics["alpha"]
+
+def merge_delay_metric_aggregates(stored, pending):
+    """
+    Combines two aggregates of the same minute (e.g. from earlier and current runs).
+    """
+    merged = dict(pending)
+    merged["count"] = stored["count"] + pending["count"]
+    for name in ("final_delay", "error"):
+        merged[f"{name}_sum"] = stored[f"{name}_sum"] + pending[f"{name}_sum"]
+        merged[f"{name}_min"] = min(stored[f"{name}_min"], pending[f"{name}_min"])
+        merged[f"{name}_max"] = max(stored[f"{name}_max"], pending[f"{name}_max"])
+    return merged
+
+def flush_controller_state():
+    """
+    Writes the PID tuning state (if changed) and the pending per-minute delay metrics.
+    Metrics older than delay_metrics_retention_minutes are dropped, so the file stays bounded.
+    Runs on the flush interval and at exit.
+    """
+    global _pid_tuning_state_dirty, _controller_state_last_flush
+    with _api_usage_lock:
+        _controller_state_last_flush = time.monotonic()
+        try:
+            if _pid_tuning_state_dirty and _pid_tuning_state is not None:
+                save_pid_tuning_data(_pid_tuning_state)
+                _pid_tuning_state_dirty = False
+
+            if _pending_delay_metrics:
+                try:
+                    with open(delay_metrics_file, 'r', encoding='utf-8') as f:
+                        stored_minutes = {entry["minute"]: entry for entry in json.load(f).get("minutes", [])}
+                except (OSError, ValueError):
+                    stored_minutes = {}
+                for minute, aggregate in _pending_delay_metrics.items():
+                    stored_minutes[minute] = merge_delay_metric_aggregates(stored_minutes[minute], aggregate) if minute in stored_minutes else aggregate
+                oldest_kept = (datetime.now(timezone.utc) - timedelta(minutes=delay_metrics_retention_minutes)).strftime("%Y-%m-%dT%H:%M")
+                minutes = [stored_minutes[minute] for minute in sorted(stored_minutes) if minute >= oldest_kept]
+                with open_file_for_atomic_replace(delay_metrics_file) as f:
+                    json.dump({"retention_minutes": delay_metrics_retention_minutes, "minutes": minutes}, f)
+                _pending_delay_metrics.clear()
+        except OSError as e:
+            logging.warning(f"⚠️ Failed to write rate controller state: {e}")
+
+atexit.register(flush_controller_state)
+
 def adjust_gains(data):
     """
     Adjusts PID gains based on the trend of recent errors.
@@ -2125,24 +3501,6 @@ def extract_json_from_ws_log_to_csv(log_file, output_csv):
     except Exception as e:
         print(f"❌ Failed to clean {log_file}: {e}")
 
-def append_delay_metrics_log(delay_metrics, api_cache, tuning_data, filename="delay_metrics.json"):
-    """
-    Appends delay metrics, API cache, and tuning data to a JSON file.
-    Each call writes a new line with a timestamped entry.
-    """
-    log_entry = {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "delay_metrics": delay_metrics,
-        "api_cache": api_cache,
-        "tuning_data": tuning_data
-    }
-    try:
-        with open(filename, "a", encoding="utf-8") as f:
-            json.dump(log_entry, f)
-            f.write("\n")
-    except Exception as e:
-        logging.warning(f"⚠️ Failed to write delay metrics to {filename}: {e}")
-
 def export_gateway_device_configs_to_csv(debug=False, fast=False):
     """
     Fetches and exports configuration details for all gateway devices across all sites in the organization
@@ -2181,7 +3539,7 @@ def export_gateway_device_configs_to_csv(debug=False, fast=False):
     # Write filtered dataset to CSV
     if not filtered_rows:
         logging.warning("⚠️ No rows matched the port config filter. FilteredGatewayPortConfigs.csv will be empty.")
-        with open("FilteredGatewayPortConfigs.csv", "w", newline="", encoding="utf-8") as f:
+        with open_file_for_atomic_replace("FilteredGatewayPortConfigs.csv", newline="") as f:
             f.write("No matching data found.\n")
     else:
         if debug:
@@ -2192,21 +3550,22 @@ def export_gateway_device_configs_to_csv(debug=False, fast=False):
 def fetch_gateway_device_configs_from_api(apisession, org_id, fast=False, max_workers=None):
     """
     Fetches configuration details for all gateway devices in the org using org inventory.
-    If `fast` is True, fetches each device config concurrently using a thread per device.
+    Configs are fetched through the shared rate-paced executor; `fast` raises the worker count.
+    Only gateways that are new, or whose inventory modified_time or site changed since the last
+    run, are fetched; the others are served from gateway_config_snapshot.json.
     
     Args:
         apisession: Authenticated Mist API session.
         org_id: Organization ID.
-        fast (bool): If True, enables high-concurrency mode.
-        max_workers (int): Optional override for number of concurrent threads.
+        fast (bool): If True, uses max_workers (or one worker per CPU) instead of --workers.
+        max_workers (int): Optional override for number of concurrent threads in fast mode.
     
     Returns:
         List of device configuration dictionaries.
     """
     logging.info("Fetching org inventory to find gateway devices...")
     try:
-        response = mistapi.api.v1.orgs.inventory.getOrgInventory(apisession, org_id, limit=1000)
-        inventory = mistapi.get_all(response=response, mist_session=apisession)
+        inventory = get_shared_org_collection("inventory", org_id, apisession)
     except Exception as e:
         logging.error(f"❌ Failed to fetch org inventory: {e}")
         return []
@@ -2216,63 +3575,175 @@ def fetch_gateway_device_configs_from_api(apisession, org_id, fast=False, max_wo
     # Load site names from SiteList.csv for enrichment
     site_name_lookup = {}
     try:
-        with open("SiteList.csv", mode="r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            site_name_lookup = {row.get("id"): row.get("name", "Unnamed Site") for row in reader}
+        site_name_lookup = {row.get("id"): row.get("name", "Unnamed Site") for row in load_csv_rows_with_memory_cache("SiteList.csv")}
     except Exception as e:
         logging.warning(f"⚠️ Failed to load SiteList.csv for site names: {e}")
 
-    # Filter for gateway devices and build work list
+    # Gateways assigned to a site, with the marker that tells whether their config may have changed
+    gateways = [device for device in inventory if device.get("type") == "gateway" and device.get("site_id") and device.get("id")]
+    get_marker = lambda device: [device.get("modified_time"), device.get("site_id")]
+    snapshot = load_change_marker_snapshot(gateway_config_snapshot_file, org_id)
+    gateways_to_fetch, current_configs, is_full_refresh = split_objects_by_change_marker(
+        snapshot, gateways, get_marker, gateway_config_full_refresh_hours
+    )
+    marker_by_device_id = {device.get("id"): get_marker(device) for device in gateways_to_fetch}
+
+    # Build the work list from the new/changed gateways only
     work_items = []
-    for device in inventory:
-        if device.get("type") == "gateway":
-            site_id = device.get("site_id")
-            device_id = device.get("id")
-            if site_id and device_id:
-                site_name = site_name_lookup.get(site_id, "Unknown")
-                work_items.append((site_id, device_id, site_name))
+    for device in gateways_to_fetch:
+        site_id = device.get("site_id")
+        site_name = site_name_lookup.get(site_id, "Unknown")
+        work_items.append((site_id, device.get("id"), site_name))
 
-    logging.info(f"Prepared {len(work_items)} gateway device config API calls.")
+    logging.info(f"Prepared {len(work_items)} gateway device config API calls ({len(current_configs)} unchanged gateways served from snapshot).")
 
     def fetch_config(site_id, device_id, site_name):
         try:
-            config = mistapi.api.v1.sites.devices.getSiteDevice(apisession, site_id, device_id).data
-            config["site_id"] = site_id
-            config["site_name"] = site_name
+            response = mistapi.api.v1.sites.devices.getSiteDevice(apisession, site_id, device_id)
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
             logging.info(f"✅ Fetched config for device {device_id} at site {site_name}")
-            return config
+            return response.data
         except Exception as e:
             logging.warning(f"⚠️ Failed to fetch config for device {device_id} at site {site_name}: {e}")
             return None
-    all_device_configs = []
 
-    if fast:
-        max_threads = max_workers or os.cpu_count() or 8
-        logging.info(f"🚀 Fast mode enabled: launching {len(work_items)} tasks with up to {max_threads} threads.")
-        with ThreadPoolExecutor(max_workers=max_threads) as executor:
-            futures = [executor.submit(fetch_config, sid, did, sname) for sid, did, sname in work_items]
-            for future in tqdm(as_completed(futures), total=len(futures), desc="Fetching Configs", unit="device"):
-                result = future.result()
-                if result:
-                    all_device_configs.append(result)
-    else:
-        logging.info("🐢 Fast mode disabled: using sequential rate-limited execution.")
-        smoothed = None
-        for site_id, device_id, site_name in tqdm(work_items, desc="Fetching Configs", unit="device"):
-            smoothed, delay = get_rate_limited_delay(smoothed)
-            logging.info(f"[INFO] Sleeping for {delay:.2f} seconds.")
-            time.sleep(delay)
-            result = fetch_config(site_id, device_id, site_name)
-            if result:
-                all_device_configs.append(result)
-
-    logging.info(f"✅ Completed fetching {len(all_device_configs)} gateway device configs.")
+    worker_count = (max_workers or os.cpu_count() or 8) if fast else None
+    # Each config is journaled as it completes so an interrupted run can --resume
+    with collection_journal("GatewayDeviceConfigs") as journal:
+        fetched_configs = run_api_calls_concurrently(
+            work_items, lambda work_item: fetch_config(*work_item), description="Fetching Configs", unit="device",
+            max_workers=worker_count, journal=journal, journal_key=lambda work_item: work_item[1]
+        )
+        failed_device_ids = []
+        for (site_id, device_id, site_name), config in zip(work_items, fetched_configs):
+            if config is None:
+                failed_device_ids.append(device_id)
+            else:
+                current_configs[device_id] = {"marker": marker_by_device_id[device_id], "data": config}
+
+        update_change_marker_snapshot(gateway_config_snapshot_file, snapshot, current_configs, is_full_refresh, failed_device_ids)
+
+    # Assemble the full result in inventory order, enriched with the current site details
+    all_device_configs = []
+    for device in gateways:
+        entry = current_configs.get(device.get("id"))
+        if entry:
+            config = dict(entry["data"])
+            config["site_id"] = device.get("site_id")
+            config["site_name"] = site_name_lookup.get(device.get("site_id"), "Unknown")
+            all_device_configs.append(config)
+
+    logging.info(f"✅ Completed fetching {len(all_device_configs)} gateway device configs ({len(work_items) - len(failed_device_ids)} from the API).")
     return all_device_configs
 
-def get_rate_limited_delay(smoothed_delay=None):
-    global _api_usage_cache
-    tuning_data = load_pid_tuning_data()
+def normalize_api_endpoint(method, url):
+    """
+    Returns "METHOD /path" with IDs and MACs replaced by placeholders, so requests to the same
+    endpoint for different objects are counted together.
+    """
+    path = urlsplit(url).path
+    path = re.sub(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}", "{id}", path)
+    path = re.sub(r"/[0-9a-fA-F]{12}(?=/|$)", "/{mac}", path)
+    return f"{method} {path}"
+
+def count_outgoing_api_request(response, *args, **kwargs):
+    """
+    requests response hook: counts every request that actually went out (retries included,
+    response cache hits excluded) by endpoint, for exact local usage accounting.
+    """
+    endpoint = normalize_api_endpoint(getattr(response.request, "method", "GET"), response.url)
+    with _api_usage_lock:
+        _api_request_counts[endpoint] += 1
+        _api_usage_cache["requests_since_reconcile"] += 1
+    if shared_budget_enabled:
+        try:
+            get_shared_budget_ledger().record_request()
+        except sqlite3.Error as e:
+            logging.debug(f"Could not record request in the shared budget ledger: {e}")
+
+def install_request_accounting_hook(http_session):
+    """
+    Adds the request-counting hook to a requests session (once).
+    """
+    if http_session is not None and count_outgoing_api_request not in http_session.hooks["response"]:
+        http_session.hooks["response"].append(count_outgoing_api_request)
+
+def report_api_request_counts(counts_before):
+    """
+    Logs the requests sent since counts_before, busiest endpoints first.
+    """
+    with _api_usage_lock:
+        sent = _api_request_counts - counts_before
+    if sent:
+        busiest = ", ".join(f"{endpoint}: {count}" for endpoint, count in sent.most_common(5))
+        logging.info(f"📊 API requests sent: {sum(sent.values())} ({busiest})")
+
+def refresh_api_usage_estimate():
+    """
+    Returns the hourly API usage as (used, limit): the last getSelfApiUsage reading plus the
+    requests this process has sent since, as counted by the session hook.
+    getSelfApiUsage is only polled to reconcile with other clients of the same token: on first
+    use, when the hour rolls over (the server counter resets) and every api_usage_reconcile_interval_seconds.
+    With --shared-budget the reading and the counts come from the ledger shared by all processes.
+    Safe to call from several threads.
+    """
+    if shared_budget_enabled:
+        try:
+            used, limit = get_shared_budget_ledger().read_usage()
+            with _api_usage_lock:
+                _api_usage_cache.update(used=used, limit=limit, last_updated=time.time(), requests_since_reconcile=0, initialized=True)
+            return used, limit
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ Shared budget ledger unavailable ({e}). Using this process's own usage estimate.")
+    with _api_usage_lock:
+        now = datetime.now(timezone.utc)
+        current_time = time.time()
+        current_hour = now.strftime("%Y-%m-%dT%H")
+        _api_usage_cache["last_updated"] = current_time
 
+        reconcile_due = (
+            not _api_usage_cache["initialized"]
+            or _api_usage_cache["reconciled_hour"] != current_hour
+            or current_time - _api_usage_cache["last_reconciled"] >= api_usage_reconcile_interval_seconds
+        )
+        if not reconcile_due or _api_usage_cache["reconcile_in_progress"]:
+            used = _api_usage_cache["used"] + _api_usage_cache["requests_since_reconcile"]
+            return min(used, _api_usage_cache["limit"]), _api_usage_cache["limit"]
+        _api_usage_cache["reconcile_in_progress"] = True
+        requests_counted_before_poll = _api_usage_cache["requests_since_reconcile"]
+
+    # Poll without holding the lock, so response hooks in worker threads are not held up by the round-trip
+    try:
+        usage = mistapi.api.v1.self.usage.getSelfApiUsage(apisession).data
+    finally:
+        with _api_usage_lock:
+            _api_usage_cache["reconcile_in_progress"] = False
+
+    with _api_usage_lock:
+        counted_used = _api_usage_cache["used"] + requests_counted_before_poll
+        _api_usage_cache["used"] = usage.get("requests", 0)
+        _api_usage_cache["limit"] = usage.get("request_limit", 5000)
+        if _api_usage_cache["initialized"] and _api_usage_cache["reconciled_hour"] == current_hour:
+            logging.debug(f"API usage reconciled: counted {counted_used}, server reports {_api_usage_cache['used']}.")
+        _api_usage_cache["last_reconciled"] = current_time
+        _api_usage_cache["reconciled_hour"] = current_hour
+        # Requests sent while the poll was in flight may be missing from the reading, so keep counting them
+        _api_usage_cache["requests_since_reconcile"] = max(_api_usage_cache["requests_since_reconcile"] - requests_counted_before_poll, 0)
+        _api_usage_cache["initialized"] = True
+
+        used = _api_usage_cache["used"] + _api_usage_cache["requests_since_reconcile"]
+        return min(used, _api_usage_cache["limit"]), _api_usage_cache["limit"]
+
+def compute_rate_limited_delay(tuning_data, used, limit, seconds_elapsed, previous_elapsed, smoothed_delay=None):
+    """
+    One step of the PID pacing controller for a point in the hour, without clock or API access, so
+    get_rate_limited_delay and the offline simulator run the same code.
+    - seconds_elapsed is the position in the current hour; a value below previous_elapsed means
+      the hour rolled over.
+    - tuning_data (gains, integral, error history) is updated in place.
+    Returns (smoothed_delay, delay_in_seconds, delay_metrics).
+    """
     # Reset gains if out of bounds
     if tuning_data["k_p"] < 1e-6 or tuning_data["k_i"] < 1e-8 or tuning_data["k_p"] > 1.0 or tuning_data["k_i"] > 0.01:
         tuning_data["k_p"] = 0.1
@@ -2283,92 +3754,1017 @@ def get_rate_limited_delay(smoothed_delay=None):
     delay_integral = tuning_data.get("integral", 0.0)
     error_history = tuning_data.get("error", [])
 
-    try:
-        now = datetime.now(timezone.utc)
-        current_time = time.time()
-        elapsed = current_time - _api_usage_cache["last_updated"]
-        previous_elapsed = _api_usage_cache.get("previous_elapsed", elapsed)
+    seconds_remaining = max(3600 - seconds_elapsed, 1)
+    ideal_used = (seconds_elapsed / 3600) * limit
+    error = used - ideal_used
 
-        # Hybrid refresh trigger: every 60s, every 100 requests, or top of the hour
-        if (
-            not _api_usage_cache["initialized"]
-            or _api_usage_cache["perceived_requests"] >= 100
-            or elapsed > 60
-            or (now.minute == 0 and now.second < 5)
-        ):
-            usage = mistapi.api.v1.self.usage.getSelfApiUsage(apisession).data
-            _api_usage_cache["used"] = usage.get("requests", 0)
-            _api_usage_cache["limit"] = usage.get("request_limit", 5000)
-            _api_usage_cache["last_updated"] = current_time
-            _api_usage_cache["perceived_requests"] = 0
-            _api_usage_cache["initialized"] = True
-        else:
-            estimated_growth = round((_api_usage_cache["limit"] / 3600) * elapsed)
-            _api_usage_cache["used"] += estimated_growth
-            _api_usage_cache["last_updated"] = current_time
-            _api_usage_cache["perceived_requests"] += 1
-
-        used = min(_api_usage_cache["used"], _api_usage_cache["limit"])
-        limit = _api_usage_cache["limit"]
-
-        seconds_elapsed = now.minute * 60 + now.second + now.microsecond / 1_000_000
-        seconds_remaining = max(3600 - seconds_elapsed, 1)
-        ideal_used = (seconds_elapsed / 3600) * limit
-        error = used - ideal_used
-
-        # Detect hour boundary and decay integral
-        if seconds_elapsed < previous_elapsed:
-            logging.info("🕒 Hour boundary crossed. Resetting integral.")
-            delay_integral *= 0.5
-
-        _api_usage_cache["previous_elapsed"] = seconds_elapsed
-
-        remaining_requests = max(limit - used, 1)
-        base_delay = min(seconds_remaining / remaining_requests, 10)
-
-        unsat_delay = base_delay + k_p * error + k_i * delay_integral
-        sat_delay = max(min(unsat_delay, 10), 0.2)
-
-        # Adaptive back_calc_gain
-        back_calc_gain = min(max(abs(sat_delay - unsat_delay) / 10, 0.01), 0.5)
-
-        # Decaying integral update
-        decay_factor = 0.98
-        delay_integral = delay_integral * decay_factor + back_calc_gain * (sat_delay - unsat_delay)
-        delay_integral = max(min(delay_integral, 1000), -1000)
-
-        error_history.append(error)
-        alpha = compute_dynamic_alpha(error_history)
-
-        smoothed_delay = sat_delay if smoothed_delay is None else alpha * sat_delay + (1 - alpha) * smoothed_delay
-        delay_in_seconds = max(smoothed_delay, 0.2)
-
-        logging.info(f"Sleeping for {delay_in_seconds:.3f} seconds")
-
-        # Save updated tuning data
-        tuning_data["error"] = error_history[-20:]
-        tuning_data["integral"] = delay_integral
-        tuning_data["back_calc_gain"] = back_calc_gain
-        adjust_gains(tuning_data)
-        save_pid_tuning_data(tuning_data)
-
-        delay_metrics = {
-            "used": used,
-            "limit": limit,
-            "error": error,
-            "base_delay": base_delay,
-            "unsat_delay": unsat_delay,
-            "final_delay": delay_in_seconds,
-            "alpha": alpha
-        }
-        append_delay_metrics_log(delay_metrics, _api_usage_cache, tuning_data)
+    # Detect hour boundary and decay integral
+    if seconds_elapsed < previous_elapsed:
+        logging.debug("🕒 Hour boundary crossed. Resetting integral.")
+        delay_integral *= 0.5
+
+    remaining_requests = max(limit - used, 1)
+    base_delay = min(seconds_remaining / remaining_requests, 10)
+
+    unsat_delay = base_delay + k_p * error + k_i * delay_integral
+    sat_delay = max(min(unsat_delay, 10), 0.2)
+
+    # Adaptive back_calc_gain
+    back_calc_gain = min(max(abs(sat_delay - unsat_delay) / 10, 0.01), 0.5)
+
+    # Decaying integral update
+    decay_factor = 0.98
+    delay_integral = delay_integral * decay_factor + back_calc_gain * (sat_delay - unsat_delay)
+    delay_integral = max(min(delay_integral, 1000), -1000)
+
+    error_history.append(error)
+    alpha = compute_dynamic_alpha(error_history)
 
-        return smoothed_delay, delay_in_seconds
+    smoothed_delay = sat_delay if smoothed_delay is None else alpha * sat_delay + (1 - alpha) * smoothed_delay
+    delay_in_seconds = max(smoothed_delay, 0.2)
 
+    tuning_data["error"] = error_history[-20:]
+    tuning_data["integral"] = delay_integral
+    tuning_data["back_calc_gain"] = back_calc_gain
+    adjust_gains(tuning_data)
+
+    delay_metrics = {
+        "used": used,
+        "limit": limit,
+        "error": error,
+        "base_delay": base_delay,
+        "unsat_delay": unsat_delay,
+        "final_delay": delay_in_seconds,
+        "alpha": alpha
+    }
+    return smoothed_delay, delay_in_seconds, delay_metrics
+
+def get_rate_limited_delay(smoothed_delay=None):
+    # Read the usage first: refreshing it may poll the API, which must not happen under _api_usage_lock
+    try:
+        with _api_usage_lock:
+            previous_elapsed = _api_usage_cache.get("previous_elapsed", time.time() - _api_usage_cache["last_updated"])
+        used, limit = refresh_api_usage_estimate()
     except Exception as e:
         logging.warning(f"⚠️ Failed to calculate dynamic delay: {e}. Using default 500 ms delay.")
         return smoothed_delay, 0.5
 
+    # One caller at a time: the PID state in _api_usage_cache and tuning_data.json is shared
+    with _api_usage_lock:
+        tuning_data = get_pid_tuning_state()
+
+        try:
+            now = datetime.now(timezone.utc)
+            limit = round(get_priority_request_limit(limit))  # Pace against this priority class's share
+
+            seconds_elapsed = now.minute * 60 + now.second + now.microsecond / 1_000_000
+            if seconds_elapsed < previous_elapsed:
+                logging.info("🕒 Hour boundary crossed. Resetting integral.")
+            _api_usage_cache["previous_elapsed"] = seconds_elapsed
+
+            smoothed_delay, delay_in_seconds, delay_metrics = compute_rate_limited_delay(
+                tuning_data, used, limit, seconds_elapsed, previous_elapsed, smoothed_delay
+            )
+            logging.info(f"Sleeping for {delay_in_seconds:.3f} seconds")
+
+            # The in-memory tuning data is written out on the flush interval and at exit
+            mark_controller_state_changed()
+            record_delay_metrics(delay_metrics)
+
+            return smoothed_delay, delay_in_seconds
+
+        except Exception as e:
+            logging.warning(f"⚠️ Failed to calculate dynamic delay: {e}. Using default 500 ms delay.")
+            return smoothed_delay, 0.5
+
+# Offline backtests of the pacing controller (--simulate-controller)
+controller_simulation_iterations = 2000  # Loop iterations in a synthetic job
+controller_simulation_max_hours = 24  # Give up on a job that has not finished by then
+controller_simulation_request_limit = 5000
+# Synthetic workloads: per-minute segments (cycled) with the cost of one loop iteration and other clients' load
+synthetic_controller_workloads = {
+    "steady": [{"requests_per_iteration": 5, "iteration_seconds": 2.0, "background_rps": 0.2}],
+    "heavy": [{"requests_per_iteration": 12, "iteration_seconds": 4.0, "background_rps": 0.5}],
+    "bursty": [
+        {"requests_per_iteration": 5, "iteration_seconds": 2.0, "background_rps": 1.5 if 20 <= minute < 30 else 0.1}
+        for minute in range(60)
+    ],
+}
+
+def load_recorded_delay_metrics(metrics_file):
+    """
+    Returns per-minute delay metric aggregates from delay_metrics_by_minute.json, or from a
+    legacy delay_metrics.json (one JSON line per delay calculation), oldest first.
+    """
+    with open(metrics_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    try:
+        return json.loads(content)["minutes"]
+    except (ValueError, TypeError, KeyError):
+        pass
+    minutes = {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        minute = entry["timestamp"][:16]
+        metrics = entry["delay_metrics"]
+        aggregate = minutes.setdefault(minute, {"minute": minute, "count": 0, "final_delay_sum": 0.0})
+        aggregate["count"] += 1
+        aggregate["final_delay_sum"] += metrics["final_delay"]
+        aggregate["used"] = metrics["used"]
+        aggregate["limit"] = metrics["limit"]
+    return [minutes[minute] for minute in sorted(minutes)]
+
+def build_workload_from_delay_metrics(minutes):
+    """
+    Turns recorded per-minute metrics into a workload: the requests one loop iteration cost
+    (growth of the hourly usage divided by the iterations that minute) and the time the iteration
+    itself took (the minute minus the recorded sleeps). Returns (workload, recorded_iterations).
+    """
+    workload = []
+    for previous, current in zip(minutes, minutes[1:]):
+        used_growth = current["used"] - previous["used"]
+        if used_growth < 0 or previous["minute"][:13] != current["minute"][:13]:
+            continue  # Hour rollover or a gap in the recording
+        count = current["count"]
+        mean_delay = current["final_delay_sum"] / count
+        workload.append({
+            "requests_per_iteration": used_growth / count,
+            "iteration_seconds": max(60 / count - mean_delay, 0.1),
+            "background_rps": 0.0,
+        })
+    return workload, sum(minute["count"] for minute in minutes[1:])
+
+def simulate_rate_controller(workload, pacing="pid", tuning_data=None, fixed_delay=1.0, iterations=None, limit=None, start_seconds_in_hour=0):
+    """
+    Runs a loop-mode job through a pacing algorithm against a simulated clock and hourly budget,
+    much faster than real time and without any API calls.
+    - workload: per-minute segments (cycled) with requests_per_iteration, iteration_seconds and
+      background_rps (requests of other clients sharing the token).
+    - pacing: "pid" (compute_rate_limited_delay with a copy of tuning_data), "even" (spread the
+      remaining budget evenly over the rest of the hour) or "fixed" (fixed_delay seconds).
+    Returns a report: completion time, requests over the limit, idle budget at each hour boundary
+    and the delays used.
+    """
+    iterations = iterations or controller_simulation_iterations
+    limit = limit or controller_simulation_request_limit
+    tuning_data = json.loads(json.dumps(tuning_data or default_pid_tuning_data))
+    end_seconds = controller_simulation_max_hours * 3600
+    state = {"clock": float(start_seconds_in_hour), "used": 0.0, "over_limit": 0.0, "idle_at_hour_end": []}
+
+    def advance(seconds):
+        # Moves the clock minute by minute, adding background requests and closing finished hours
+        while seconds > 0:
+            segment = workload[int(state["clock"] // 60) % len(workload)]
+            step = min(seconds, 60 - state["clock"] % 60)
+            state["used"] += segment["background_rps"] * step
+            state["clock"] += step
+            seconds -= step
+            if state["clock"] % 3600 == 0:
+                state["idle_at_hour_end"].append(max(limit - state["used"], 0))
+                state["over_limit"] += max(state["used"] - limit, 0)
+                state["used"] = 0.0
+
+    smoothed_delay = None
+    previous_elapsed = state["clock"] % 3600
+    completed = 0
+    requests_sent = 0.0
+    delays = []
+    while completed < iterations and state["clock"] - start_seconds_in_hour < end_seconds:
+        segment = workload[int(state["clock"] // 60) % len(workload)]
+        state["used"] += segment["requests_per_iteration"]
+        requests_sent += segment["requests_per_iteration"]
+        advance(segment["iteration_seconds"])
+        completed += 1
+
+        seconds_elapsed = state["clock"] % 3600
+        used = min(int(state["used"]), limit)
+        if pacing == "pid":
+            smoothed_delay, delay, _ = compute_rate_limited_delay(tuning_data, used, limit, seconds_elapsed, previous_elapsed, smoothed_delay)
+        elif pacing == "even":
+            iterations_affordable = max(limit - used, 1) / max(segment["requests_per_iteration"], 1)
+            delay = max((3600 - seconds_elapsed) / iterations_affordable - segment["iteration_seconds"], 0.2)
+        else:
+            delay = fixed_delay
+        previous_elapsed = seconds_elapsed
+        delays.append(delay)
+        advance(delay)
+
+    finished = completed >= iterations
+    state["over_limit"] += max(state["used"] - limit, 0)  # Requests already over the limit in the unfinished hour
+    return {
+        "pacing": pacing,
+        "iterations": completed,
+        "requests": round(requests_sent),
+        "completion_seconds": round(state["clock"] - start_seconds_in_hour) if finished else None,
+        "hours_closed": len(state["idle_at_hour_end"]),
+        "over_limit_requests": round(state["over_limit"]),
+        "idle_budget_at_hour_end": [round(idle) for idle in state["idle_at_hour_end"]],
+        "mean_delay": round(sum(delays) / len(delays), 3) if delays else None,
+        "max_delay": round(max(delays), 3) if delays else None,
+        "k_p": tuning_data["k_p"] if pacing == "pid" else None,
+        "k_i": tuning_data["k_i"] if pacing == "pid" else None,
+    }
+
+def run_rate_controller_backtest(workload_source, iterations=None, fixed_delay=None, gain_settings=None):
+    """
+    Compares pacing algorithms and PID gains on a synthetic workload (see
+    synthetic_controller_workloads) or on a recorded delay metrics file, and prints the results.
+    gain_settings is a list of (k_p, k_i) pairs to try in addition to the current and default gains.
+    """
+    if workload_source in synthetic_controller_workloads:
+        workload = synthetic_controller_workloads[workload_source]
+    else:
+        workload, recorded_iterations = build_workload_from_delay_metrics(load_recorded_delay_metrics(workload_source))
+        if not workload:
+            raise ValueError(f"{workload_source} does not contain two consecutive recorded minutes to replay")
+        iterations = iterations or recorded_iterations
+
+    candidates = [("pid, default gains", "pid", default_pid_tuning_data)]
+    if os.path.exists(tuning_data_file):
+        candidates.insert(0, (f"pid, {tuning_data_file}", "pid", load_pid_tuning_data()))
+    for k_p, k_i in gain_settings or []:
+        candidates.append((f"pid, k_p={k_p} k_i={k_i}", "pid", {**default_pid_tuning_data, "k_p": k_p, "k_i": k_i}))
+    candidates.append(("even", "even", None))
+    if fixed_delay is not None:
+        candidates.append((f"fixed {fixed_delay}s", "fixed", None))
+
+    fields = ["controller", "iterations", "requests", "completion", "over_limit_requests", "mean_idle_budget_at_hour_end", "mean_delay", "max_delay"]
+    table = PrettyTable()
+    table.field_names = fields
+    reports = []
+    for name, pacing, tuning_data in candidates:
+        report = simulate_rate_controller(workload, pacing, tuning_data=tuning_data, fixed_delay=fixed_delay, iterations=iterations)
+        report["controller"] = name
+        reports.append(report)
+        idle = report["idle_budget_at_hour_end"]
+        table.add_row([
+            name,
+            report["iterations"],
+            report["requests"],
+            str(timedelta(seconds=report["completion_seconds"])) if report["completion_seconds"] is not None else f"not done in {controller_simulation_max_hours}h",
+            report["over_limit_requests"],
+            round(sum(idle) / len(idle)) if idle else "-",
+            report["mean_delay"],
+            report["max_delay"],
+        ])
+    print(f"Rate controller backtest: {workload_source}, limit {controller_simulation_request_limit} requests/hour")
+    print(table)
+    logging.info(f"Rate controller backtest of {workload_source}:\n{table.get_string()}")
+    return reports
+
+# Priority classes for the hourly API budget: interactive work preempts bulk exports and background refresh
+api_priority_classes = ("interactive", "bulk", "background")  # Highest first
+api_budget_reserve_fractions = {"interactive": 0.0, "bulk": 0.1, "background": 0.3}  # Share of the hourly limit a class leaves to higher classes
+background_budget_recheck_seconds = 60
+interactive_menu_actions = {"0", "16", "17", "18", "19", "33", "34", "38", "39", "40"}
+_api_call_priority = threading.local()
+
+def get_current_api_priority():
+    """
+    Returns the priority class of this thread's API calls ("bulk" unless tagged otherwise).
+    """
+    return getattr(_api_call_priority, "priority", "bulk")
+
+@contextmanager
+def api_call_priority(priority):
+    """
+    Tags the API calls made by this thread, and the fan-out workers it starts, with a priority class.
+    """
+    previous_priority = get_current_api_priority()
+    _api_call_priority.priority = priority
+    try:
+        yield
+    finally:
+        _api_call_priority.priority = previous_priority
+
+def get_priority_request_limit(limit, priority=None):
+    """
+    Returns the part of the hourly limit a priority class may use; the rest is kept for higher classes.
+    """
+    return limit * (1 - api_budget_reserve_fractions[priority or get_current_api_priority()])
+
+def get_background_budget_pause_seconds():
+    """
+    Returns how long background work should wait before checking again, or 0 while the hourly
+    usage is still below the background share of the limit.
+    """
+    try:
+        used, limit = refresh_api_usage_estimate()
+    except Exception as e:
+        logging.warning(f"⚠️ Could not read API usage ({e}). Not pausing background work.")
+        return 0
+    if used < get_priority_request_limit(limit, "background"):
+        return 0
+    now = datetime.now(timezone.utc)
+    return min(background_budget_recheck_seconds, max(3600 - (now.minute * 60 + now.second), 1))
+
+def get_menu_action_priority(func):
+    """
+    Returns the priority class for a menu action: operator-facing actions are interactive.
+    """
+    for key, (action, _) in menu_actions.items():
+        if action is func:
+            return "interactive" if key in interactive_menu_actions else "bulk"
+    return "bulk"
+
+# Shared executor for per-site/per-device fan-outs (--workers / --max-rps)
+fan_out_worker_count = 4
+fan_out_max_requests_per_second = None  # Optional cap on top of the rate the hourly budget allows
+fan_out_minimum_requests_per_second = 0.1  # Never stall completely, even with the budget used up
+_api_rate_token_buckets = {}  # Priority class -> ApiRequestTokenBucket
+_api_rate_token_bucket_lock = threading.Lock()
+
+def get_budget_requests_per_second(priority=None):
+    """
+    Returns the request rate that spreads the remaining hourly API budget of a priority class
+    (the limit minus the headroom reserved for higher classes) over the rest of the hour.
+    Background work gets 0 once its share is used up; other classes keep a minimal rate.
+    """
+    priority = priority or get_current_api_priority()
+    try:
+        used, limit = refresh_api_usage_estimate()
+    except Exception as e:
+        logging.warning(f"⚠️ Could not read API usage ({e}). Pacing at the average hourly rate.")
+        used, limit = 0, _api_usage_cache["limit"]
+    now = datetime.now(timezone.utc)
+    seconds_remaining = max(3600 - (now.minute * 60 + now.second), 1)
+    rate = (get_priority_request_limit(limit, priority) - used) / seconds_remaining
+    if priority == "background":
+        return max(rate, 0)
+    return max(rate, fan_out_minimum_requests_per_second)
+
+class ApiRequestTokenBucket:
+    """
+    Token bucket shared by all fan-out workers. Each API call takes one token; tokens refill at the
+    rate the remaining hourly budget allows (re-evaluated every few seconds), capped by --max-rps.
+    The capacity (burst size) equals the worker count, so idle time does not build up a flood.
+    There is one bucket per priority class; a background bucket pauses while its rate is 0.
+    """
+    rate_refresh_seconds = 5
+
+    def __init__(self, capacity, priority="bulk"):
+        self.capacity = capacity
+        self.priority = priority
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.rate = None
+        self.rate_updated = 0
+        self.granted = 0
+        self.granted_at_rate_update = 0
+        self.waited = False  # A caller had to wait for a token since the last rate update
+        self.lock = threading.Lock()
+
+    def current_demand(self, now):
+        """
+        Returns the rate this process would use: unlimited while callers queue for tokens,
+        otherwise the rate it actually drew tokens at since the last update.
+        """
+        if self.rate is None or self.waited:
+            demand = float("inf")
+        else:
+            demand = (self.granted - self.granted_at_rate_update) / max(now - self.rate_updated, 0.001)
+            demand = max(demand, fan_out_minimum_requests_per_second)
+        if fan_out_max_requests_per_second:
+            demand = min(demand, fan_out_max_requests_per_second)
+        return demand
+
+    def current_rate(self, now=None):
+        rate = get_budget_requests_per_second(self.priority)
+        if shared_budget_enabled:
+            rate = claim_shared_budget_share(rate, self.current_demand(now or time.monotonic()), self.priority)
+        if fan_out_max_requests_per_second:
+            rate = min(rate, fan_out_max_requests_per_second)
+        return rate
+
+    def acquire(self):
+        """
+        Blocks until a token is available, then takes it.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.rate is None or now - self.rate_updated >= self.rate_refresh_seconds:
+                    self.rate = self.current_rate(now)
+                    self.rate_updated = now
+                    self.granted_at_rate_update = self.granted
+                    self.waited = False
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1 and self.rate > 0:
+                    self.tokens -= 1
+                    self.granted += 1
+                    return
+                # A paused (rate 0) bucket waits for the next rate update
+                wait_seconds = (1 - self.tokens) / self.rate if self.rate > 0 else self.rate_refresh_seconds
+                self.waited = True
+            time.sleep(wait_seconds)
+
+def get_api_rate_token_bucket(priority=None):
+    """
+    Returns the process-wide token bucket of a priority class (default: this thread's), creating it
+    on first use (after CLI options are applied).
+    """
+    priority = priority or get_current_api_priority()
+    with _api_rate_token_bucket_lock:
+        if priority not in _api_rate_token_buckets:
+            _api_rate_token_buckets[priority] = ApiRequestTokenBucket(capacity=fan_out_worker_count, priority=priority)
+        return _api_rate_token_buckets[priority]
+
+# Budget ledger shared by concurrent MistHelper processes using the same token (--shared-budget)
+shared_budget_enabled = False
+shared_budget_ledger_file = "api_budget_ledger.sqlite"
+shared_budget_active_seconds = 30  # A process counts towards the fair share while it drew tokens this recently
+shared_budget_reconcile_claim_seconds = 60  # Another process may retry a reconciliation that did not finish
+shared_budget_ledger_schema_version = 2  # Older ledgers are recreated; they only hold the current hour's state
+shared_budget_process_label = "interactive menu"
+_shared_budget_ledger = None
+_shared_budget_ledger_lock = threading.Lock()
+
+def allocate_fair_budget_shares(total_rate, demands, priorities=None):
+    """
+    Splits total_rate between consumers, serving priority classes in api_priority_classes order:
+    higher classes take what they need first and lower classes share what is left.
+    Within a class the split is max-min fair: a consumer that needs less than an equal share gets
+    what it needs, and what it leaves is divided among the others.
+    demands maps consumer -> requested rate (float("inf") while it is queueing); priorities maps
+    consumer -> priority class (default "bulk").
+    """
+    priorities = priorities or {}
+    shares = {}
+    remaining_rate = total_rate
+    for priority in api_priority_classes:
+        pending = sorted((consumer for consumer in demands if priorities.get(consumer, "bulk") == priority), key=demands.get)
+        while pending:
+            equal_share = remaining_rate / len(pending)
+            if demands[pending[0]] > equal_share:
+                shares.update({consumer: equal_share for consumer in pending})
+                remaining_rate = 0
+                break
+            consumer = pending.pop(0)
+            shares[consumer] = demands[consumer]
+            remaining_rate -= demands[consumer]
+    return shares
+
+class SharedApiBudgetLedger:
+    """
+    SQLite ledger next to the cached datasets, shared by every MistHelper process of this working
+    directory (loop mode, exports and operator sessions).
+    - usage: the last getSelfApiUsage reading plus the requests all processes sent since, so each
+      process paces against the token's real consumption and only one of them polls the API.
+    - processes: per-process requests this hour.
+    - demands: per process and priority class, the current demand and share of the budget rate.
+    """
+    def __init__(self, ledger_file):
+        self.ledger_file = ledger_file
+        self.pid = os.getpid()
+        with self.transaction() as db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != shared_budget_ledger_schema_version:
+                for table in ("usage", "processes", "demands"):
+                    db.execute(f"DROP TABLE IF EXISTS {table}")
+                db.execute(f"PRAGMA user_version = {shared_budget_ledger_schema_version}")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 1), hour TEXT, used INTEGER, "
+                "request_limit INTEGER, requests_since_reconcile INTEGER, last_reconciled REAL, reconcile_claimed REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS processes (pid INTEGER PRIMARY KEY, label TEXT, started REAL, last_seen REAL, "
+                "hour TEXT, requests_this_hour INTEGER)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS demands (pid INTEGER, priority TEXT, last_active REAL, demand_rps REAL, "
+                "share_rps REAL, PRIMARY KEY (pid, priority))"
+            )
+            db.execute("INSERT OR IGNORE INTO usage VALUES (1, '', 0, ?, 0, 0, 0)", (_api_usage_cache["limit"],))
+            db.execute(
+                "INSERT OR REPLACE INTO processes VALUES (?, ?, ?, ?, ?, 0)",
+                (self.pid, shared_budget_process_label, time.time(), time.time(), self.current_hour()),
+            )
+            db.execute("DELETE FROM demands WHERE pid = ?", (self.pid,))
+
+    @staticmethod
+    def current_hour():
+        return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H")
+
+    @contextmanager
+    def transaction(self):
+        # A short-lived connection per call: safe from any thread, and BEGIN IMMEDIATE serializes writers across processes
+        with closing(sqlite3.connect(self.ledger_file, timeout=10, isolation_level=None)) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def record_request(self):
+        """
+        Counts one request sent by this process.
+        """
+        hour = self.current_hour()
+        with self.transaction() as db:
+            db.execute("UPDATE usage SET requests_since_reconcile = requests_since_reconcile + 1 WHERE id = 1")
+            db.execute(
+                "UPDATE processes SET requests_this_hour = CASE WHEN hour = ? THEN requests_this_hour + 1 ELSE 1 END, "
+                "hour = ?, last_seen = ? WHERE pid = ?",
+                (hour, hour, time.time(), self.pid),
+            )
+
+    def read_usage(self):
+        """
+        Returns (used, limit) for the token across all processes. When a reconciliation is due
+        (new hour or api_usage_reconcile_interval_seconds passed), this process claims it, polls
+        getSelfApiUsage outside the transaction and stores the reading for everyone.
+        """
+        now = time.time()
+        hour = self.current_hour()
+        with self.transaction() as db:
+            stored_hour, used, limit, since_reconcile, last_reconciled, reconcile_claimed = db.execute(
+                "SELECT hour, used, request_limit, requests_since_reconcile, last_reconciled, reconcile_claimed FROM usage WHERE id = 1"
+            ).fetchone()
+            reconcile_due = stored_hour != hour or now - last_reconciled >= api_usage_reconcile_interval_seconds
+            claim_reconcile = reconcile_due and now - reconcile_claimed >= shared_budget_reconcile_claim_seconds
+            if claim_reconcile:
+                db.execute("UPDATE usage SET reconcile_claimed = ? WHERE id = 1", (now,))
+        if not claim_reconcile:
+            return min(used + since_reconcile, limit), limit
+
+        usage = mistapi.api.v1.self.usage.getSelfApiUsage(apisession).data
+        used = usage.get("requests", 0)
+        limit = usage.get("request_limit", 5000)
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE usage SET hour = ?, used = ?, request_limit = ?, requests_since_reconcile = 0, last_reconciled = ? WHERE id = 1",
+                (hour, used, limit, now),
+            )
+        return min(used, limit), limit
+
+    def claim_fair_share(self, total_rate, demand_rate, priority="bulk"):
+        """
+        Records this process's demand in a priority class and returns its share of total_rate among
+        the consumers drawing tokens right now (higher classes first, fair within a class).
+        Every active consumer's share is stored for --budget-status.
+        """
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("UPDATE processes SET last_seen = ? WHERE pid = ?", (now, self.pid))
+            db.execute("INSERT OR REPLACE INTO demands VALUES (?, ?, ?, ?, 0)", (self.pid, priority, now, demand_rate))
+            active_demands = [
+                ((pid, demand_priority), demand) for pid, demand_priority, demand in db.execute(
+                    "SELECT pid, priority, demand_rps FROM demands WHERE last_active >= ?", (now - shared_budget_active_seconds,)
+                )
+                if pid == self.pid or is_lock_owner_process_alive(pid)
+            ]
+            shares = allocate_fair_budget_shares(
+                total_rate,
+                dict(active_demands),
+                priorities={consumer: consumer[1] for consumer, _ in active_demands},
+            )
+            db.executemany(
+                "UPDATE demands SET share_rps = ? WHERE pid = ? AND priority = ?",
+                [(share, pid, demand_priority) for (pid, demand_priority), share in shares.items()],
+            )
+        return shares[(self.pid, priority)]
+
+    def list_processes(self):
+        """
+        Returns one dict per process that sent requests this hour or is still running, with its
+        active demands and shares by priority class.
+        """
+        now = time.time()
+        hour = self.current_hour()
+        with self.transaction() as db:
+            rows = db.execute("SELECT pid, label, started, last_seen, hour, requests_this_hour FROM processes").fetchall()
+            stale_pids = [(row[0],) for row in rows if row[0] != self.pid and row[4] != hour and not is_lock_owner_process_alive(row[0])]
+            db.executemany("DELETE FROM processes WHERE pid = ?", stale_pids)
+            db.executemany("DELETE FROM demands WHERE pid = ?", stale_pids)
+            active_demands = db.execute(
+                "SELECT pid, priority, demand_rps, share_rps FROM demands WHERE last_active >= ?", (now - shared_budget_active_seconds,)
+            ).fetchall()
+        processes = []
+        for pid, label, started, last_seen, row_hour, requests_this_hour in rows:
+            if (pid,) in stale_pids:
+                continue
+            demands = sorted(
+                (api_priority_classes.index(priority), priority, demand_rps, share_rps)
+                for demand_pid, priority, demand_rps, share_rps in active_demands if demand_pid == pid
+            )
+            processes.append({
+                "pid": pid,
+                "label": label,
+                "state": "running" if is_lock_owner_process_alive(pid) else "exited",
+                "requests_this_hour": requests_this_hour if row_hour == hour else 0,
+                "priority": ", ".join(priority for _, priority, _, _ in demands) or "-",
+                "demand_rps": ", ".join("queueing" if math.isinf(demand_rps) else str(round(demand_rps, 2)) for _, _, demand_rps, _ in demands) or "-",
+                "share_rps": ", ".join(str(round(share_rps, 2)) for _, _, _, share_rps in demands) or "-",
+                "last_seen": datetime.fromtimestamp(last_seen, timezone.utc).strftime("%H:%M:%S"),
+                "started": datetime.fromtimestamp(started, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+            })
+        return processes
+
+def get_shared_budget_ledger():
+    """
+    Returns this process's handle on the shared ledger, registering the process on first use.
+    """
+    global _shared_budget_ledger
+    with _shared_budget_ledger_lock:
+        if _shared_budget_ledger is None:
+            _shared_budget_ledger = SharedApiBudgetLedger(shared_budget_ledger_file)
+        return _shared_budget_ledger
+
+def claim_shared_budget_share(total_rate, demand_rate, priority="bulk"):
+    """
+    Returns this process's share of total_rate for a priority class, or total_rate if the ledger
+    cannot be used.
+    """
+    try:
+        share = get_shared_budget_ledger().claim_fair_share(total_rate, demand_rate, priority)
+    except sqlite3.Error as e:
+        logging.warning(f"⚠️ Shared budget ledger unavailable ({e}). Pacing without the other processes.")
+        return total_rate
+    if priority == "background":
+        return share
+    return max(share, fan_out_minimum_requests_per_second)
+
+def show_shared_budget_status():
+    """
+    Prints the token's API usage this hour and what each MistHelper process is consuming.
+    """
+    ledger = get_shared_budget_ledger()
+    used, limit = ledger.read_usage()
+    fields = ["pid", "label", "state", "requests_this_hour", "priority", "demand_rps", "share_rps", "last_seen", "started"]
+    table = PrettyTable()
+    table.field_names = fields
+    for process in sorted(ledger.list_processes(), key=lambda process: process["requests_this_hour"], reverse=True):
+        table.add_row([process[field] for field in fields])
+    print(f"API usage this hour: {used} of {limit} requests (ledger: {shared_budget_ledger_file})")
+    print(table)
+    logging.info(f"Shared API budget status: {used} of {limit} requests used.\n{table.get_string()}")
+
+# Journals of completed fan-out items, so an interrupted collection can continue with --resume
+resume_enabled = False
+
+class CollectionJournal:
+    """
+    Append-only JSON Lines journal of the items a long collection job has finished.
+    The first line records the org; every completed item is appended and flushed as soon as it is done.
+    """
+    def __init__(self, job_name):
+        self.journal_file = f"{job_name}.journal.jsonl"
+        self.lock = threading.Lock()
+        self.completed = self.load() if resume_enabled else {}
+        if self.completed:
+            logging.info(f"⏯️ Resuming {job_name}: {len(self.completed)} items already collected in {self.journal_file}.")
+            self.file = open(self.journal_file, 'a', encoding='utf-8')
+            self.file.write("\n")  # Terminate a line the interrupted run may have cut short
+        else:
+            self.file = open(self.journal_file, 'w', encoding='utf-8')
+            self.file.write(json.dumps({"job": job_name, "org_id": org_id, "started_at": datetime.now(timezone.utc).isoformat()}) + "\n")
+        self.file.flush()
+
+    def load(self):
+        """
+        Returns {item key: result} from a journal written for the current org, or {}.
+        """
+        completed = {}
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline() or "{}")
+                if header.get("org_id") != org_id:
+                    logging.info(f"Ignoring {self.journal_file}: it was written for org {header.get('org_id')}.")
+                    return {}
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Blank or partially written line
+                    completed[entry["key"]] = entry["result"]
+        except (OSError, ValueError):
+            return {}
+        return completed
+
+    def record(self, key, result):
+        with self.lock:
+            self.file.write(json.dumps({"key": key, "result": result}, default=str) + "\n")
+            self.file.flush()
+            self.completed[key] = result
+
+    def close(self):
+        self.file.close()
+
+@contextmanager
+def collection_journal(job_name):
+    """
+    Yields a CollectionJournal for a long per-device collection job.
+    The journal is deleted when the block completes (the job wrote its output), and kept when the
+    job fails or is interrupted so --resume can skip the items it already collected.
+    """
+    journal = CollectionJournal(job_name)
+    try:
+        yield journal
+    except BaseException:
+        journal.close()
+        logging.warning(f"⚠️ {job_name} interrupted. {len(journal.completed)} collected items kept in {journal.journal_file}; rerun with --resume to continue.")
+        raise
+    journal.close()
+    os.remove(journal.journal_file)
+
+# Retries of throttled fan-out calls
+fan_out_max_attempts = 4
+fan_out_retry_base_seconds = 1.0  # Backoff when a throttled response carries no Retry-After
+
+class AdaptiveConcurrencyLimit:
+    """
+    AIMD concurrency limit for a fan-out. The limit grows by one slot for every limit's worth of
+    clean calls and is cut multiplicatively when the API throttles (429/5xx) or when latency climbs
+    well above the best seen. A Retry-After delay pauses every worker, since the whole client is
+    being throttled, not just one request.
+    """
+    throttle_decrease_factor = 0.5
+    latency_decrease_factor = 0.8
+    latency_congestion_ratio = 3.0
+    decrease_cooldown_seconds = 1.0  # A burst of concurrent 429s counts as one congestion signal
+
+    def __init__(self, max_limit):
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.pause_until = 0
+        self.last_decrease = 0
+        self.latency_average = None
+        self.best_latency_average = None
+        self.throttled_count = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Blocks until a slot is free under the current limit and no Retry-After pause is active.
+        """
+        with self.condition:
+            while True:
+                pause_seconds = self.pause_until - time.monotonic()
+                if pause_seconds > 0:
+                    self.condition.wait(pause_seconds)
+                elif self.in_flight < max(1, int(self.limit)):
+                    self.in_flight += 1
+                    return
+                else:
+                    self.condition.wait()
+
+    def release(self, latency_seconds, throttled=False, retry_after_seconds=None):
+        """
+        Frees a slot and adapts the limit to the outcome of the call.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttled_count += 1
+                if retry_after_seconds:
+                    self.pause_until = max(self.pause_until, now + retry_after_seconds)
+                self.decrease(self.throttle_decrease_factor, now)
+            else:
+                self.latency_average = latency_seconds if self.latency_average is None else 0.8 * self.latency_average + 0.2 * latency_seconds
+                self.best_latency_average = min(self.best_latency_average or self.latency_average, self.latency_average)
+                if self.latency_average > self.latency_congestion_ratio * self.best_latency_average:
+                    self.decrease(self.latency_decrease_factor, now)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def decrease(self, factor, now):
+        if now - self.last_decrease >= self.decrease_cooldown_seconds:
+            self.limit = max(1.0, self.limit * factor)
+            self.last_decrease = now
+            logging.info(f"📉 Fan-out concurrency reduced to {int(self.limit)}.")
+
+def run_api_calls_concurrently(work_items, call_function, description="Requests", unit="call", max_workers=None, journal=None, journal_key=None):
+    """
+    Runs call_function(work_item) for every work item on a thread pool, each call first taking a
+    token from the shared API rate bucket. I/O-bound calls overlap while the overall request rate
+    stays within the hourly budget.
+    - A call whose requests were throttled (429) or hit a server error (5xx) is retried (whether
+      it returned or raised) up to fan_out_max_attempts times, after the Retry-After delay or an exponential backoff.
+    - Concurrency adapts (AIMD) to throttling and latency, between 1 and the worker count.
+    - Workers inherit the caller's API priority class and draw from that class's token bucket.
+    - With a journal, every successful result is recorded under journal_key(work_item) as it
+      completes, and items already in the journal are not fetched again.
+    Returns the results in work-item order; a call that raises or keeps failing yields None.
+    """
+    results = [None] * len(work_items)
+    pending_indexes = list(range(len(work_items)))
+    if journal is not None:
+        pending_indexes = []
+        for index, work_item in enumerate(work_items):
+            key = journal_key(work_item)
+            if key in journal.completed:
+                results[index] = journal.completed[key]
+            else:
+                pending_indexes.append(index)
+        if len(pending_indexes) < len(work_items):
+            logging.info(f"⏯️ {description}: {len(work_items) - len(pending_indexes)} items taken from the journal, {len(pending_indexes)} left to fetch.")
+    if not pending_indexes:
+        return results
+    worker_count = max(1, min(max_workers or fan_out_worker_count, len(pending_indexes)))
+    ensure_http_connection_pool_size(worker_count)
+    priority = get_current_api_priority()
+    token_bucket = get_api_rate_token_bucket(priority)
+    concurrency_limit = AdaptiveConcurrencyLimit(worker_count)
+    retry_counts = Counter()
+    logging.info(f"🚦 Running {len(pending_indexes)} {unit} requests on up to {worker_count} workers ({priority} priority, rate paced by the API budget).")
+
+    def run_with_retries(index):
+        with api_call_priority(priority):
+            return run_attempts(index)
+
+    def run_attempts(index):
+        for attempt in range(1, fan_out_max_attempts + 1):
+            concurrency_limit.acquire()
+            token_bucket.acquire()
+            _api_call_observations.throttled_status = None
+            _api_call_observations.retry_after_seconds = None
+            started = time.monotonic()
+            result, call_error = None, None
+            try:
+                result = call_function(work_items[index])
+            except Exception as e:
+                # Callers that raise on a non-200 response are retried like any other throttled call
+                call_error = e
+            finally:
+                throttled_status = _api_call_observations.throttled_status
+                retry_after_seconds = _api_call_observations.retry_after_seconds
+                concurrency_limit.release(time.monotonic() - started, throttled_status is not None, retry_after_seconds)
+            if throttled_status is None:
+                if call_error is not None:
+                    raise call_error
+                if journal is not None and result is not None:
+                    journal.record(journal_key(work_items[index]), result)
+                return result
+            if attempt == fan_out_max_attempts:
+                logging.warning(f"⚠️ {description} request for {work_items[index]} still failing with {throttled_status} after {attempt} attempts.")
+                return None
+            retry_counts["retries"] += 1
+            if retry_after_seconds is None:
+                # Without Retry-After only this item backs off; with it, acquire() pauses everyone
+                time.sleep(fan_out_retry_base_seconds * 2 ** (attempt - 1))
+            elif retry_after_seconds > 60:
+                logging.warning(f"⏸️ API asked to retry after {retry_after_seconds:.0f} seconds. Waiting.")
+
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        futures = {executor.submit(run_with_retries, index): index for index in pending_indexes}
+        for future in tqdm(as_completed(futures), total=len(futures), desc=description, unit=unit):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                logging.warning(f"⚠️ {description} request for {work_items[index]} failed: {e}")
+
+    if concurrency_limit.throttled_count:
+        logging.info(
+            f"🔁 {description}: {concurrency_limit.throttled_count} throttled/5xx responses, {retry_counts['retries']} retries, "
+            f"final concurrency {int(concurrency_limit.limit)} of {worker_count}."
+        )
+    return results
+
+def build_page_uri(response_url, page_number):
+    """
+    Returns the URI of another page of the request that produced `response_url`.
+    """
+    uri = f"/api/{response_url.split('/api/', 1)[1]}"
+    if re.search(r"(?<=[?&])page=\d+(?=&|$)", uri):
+        return re.sub(r"(?<=[?&])page=\d+(?=&|$)", f"page={page_number}", uri)
+    separator = "&" if "?" in uri else "?"
+    return f"{uri}{separator}page={page_number}"
+
+class IncompletePaginationError(RuntimeError):
+    """
+    Raised when some pages of a collection could not be fetched, so the partial list must not be used as complete.
+    """
+
+def get_all_pages_concurrently(response, mist_session=None):
+    """
+    Drop-in replacement for mistapi.get_all for page-numbered endpoints.
+    The X-Page-Total / X-Page-Limit / X-Page-Page headers of the first response give the page
+    count, so the remaining pages are fetched concurrently through the shared rate-paced executor
+    and concatenated in page order. Cursor-paginated responses (search endpoints returning "next"
+    in the body) can only be walked one page at a time and are handed to mistapi.get_all.
+    Raises IncompletePaginationError if any page could not be fetched after retries.
+    """
+    mist_session = mist_session or apisession
+    headers = getattr(response, "headers", None) or {}
+    try:
+        total = int(headers.get("X-Page-Total"))
+        limit = int(headers.get("X-Page-Limit"))
+        page = int(headers.get("X-Page-Page"))
+    except (TypeError, ValueError):
+        return mistapi.get_all(response=response, mist_session=mist_session)
+    if getattr(response, "status_code", None) != 200 or not isinstance(response.data, list) or limit <= 0:
+        return mistapi.get_all(response=response, mist_session=mist_session)
+
+    page_count = math.ceil(total / limit)
+    page_uris = [build_page_uri(response.url, page_number) for page_number in range(page + 1, page_count + 1)]
+    if not page_uris:
+        return list(response.data)
+    logging.info(f"📄 Fetching {len(page_uris)} more pages ({total} items) concurrently.")
+
+    def fetch_page(page_uri):
+        page_response = mist_session.mist_get(page_uri)
+        if page_response.status_code != 200 or not isinstance(page_response.data, list):
+            raise RuntimeError(f"HTTP {page_response.status_code}")
+        return page_response.data
+
+    data = list(response.data)
+    missing_page_uris = []
+    for page_uri, page_data in zip(page_uris, run_api_calls_concurrently(page_uris, fetch_page, description="Pages", unit="page")):
+        if page_data is None:
+            missing_page_uris.append(page_uri)
+        else:
+            data += page_data
+    if missing_page_uris:
+        logging.error(f"❌ {len(missing_page_uris)} of {page_count} pages could not be fetched (first: {missing_page_uris[0]}).")
+        raise IncompletePaginationError(f"{len(missing_page_uris)} of {page_count} pages missing for {response.url}")
+    return data
+
+# Time-window sharding for cursor-paginated search endpoints
+search_history_hours = 24  # Time range of the device event and alarm exports (--history-hours)
+search_shard_initial_seconds = 3600
+search_shard_min_seconds = 300
+search_shard_max_seconds = 24 * 3600
+search_shard_target_records = 1000  # Aim for about one page per shard
+
+def deduplicate_records(records, id_fields=None):
+    """
+    Returns records without duplicates, keyed on id_fields (or the whole record when None), keeping the first.
+    """
+    seen_keys = set()
+    unique_records = []
+    for record in records:
+        if id_fields:
+            key = tuple(str(record.get(field, "")) for field in id_fields)
+        else:
+            key = json.dumps(record, sort_keys=True, default=str)
+        if key not in seen_keys:
+            seen_keys.add(key)
+            unique_records.append(record)
+    return unique_records
+
+def fetch_time_range_in_shards(api_call, start_epoch, end_epoch, id_fields=None, description="Time windows", **query_parameters):
+    """
+    Fetches a time range from a search endpoint as many smaller start/end windows run in parallel,
+    instead of one long sequential cursor. Windows are planned in waves from the newest backwards;
+    after each wave the window size is re-derived from the records per second just seen so that each
+    window holds about search_shard_target_records (within the min/max window size).
+    Records are merged, deduplicated on id_fields (windows share their boundary second) and
+    sorted newest first. Returns None if any window could not be fetched.
+    """
+    org_id = get_cached_or_prompted_org_id()
+    query_parameters = {"limit": 1000, **query_parameters}
+
+    def fetch_window(window):
+        window_start, window_end = window
+        response = api_call(apisession, org_id, start=int(window_start), end=int(math.ceil(window_end)), **query_parameters)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return get_all_pages_concurrently(response=response, mist_session=apisession) or []
+
+    records = []
+    failed_windows = []
+    window_seconds = search_shard_initial_seconds
+    wave_size = max(2, fan_out_worker_count * 2)
+    next_window_end = end_epoch
+    while next_window_end > start_epoch:
+        windows = []
+        while next_window_end > start_epoch and len(windows) < wave_size:
+            window_start = max(start_epoch, next_window_end - window_seconds)
+            windows.append((window_start, next_window_end))
+            next_window_end = window_start
+
+        wave_records = 0
+        for window, window_records in zip(windows, run_api_calls_concurrently(windows, fetch_window, description=description, unit="window")):
+            if window_records is None:
+                failed_windows.append(window)
+                continue
+            records.extend(window_records)
+            wave_records += len(window_records)
+
+        # Size the next wave's windows from the record density of this one
+        wave_seconds = sum(window_end - window_start for window_start, window_end in windows)
+        if wave_records:
+            window_seconds = search_shard_target_records * wave_seconds / wave_records
+        else:
+            window_seconds *= 4
+        window_seconds = min(max(window_seconds, search_shard_min_seconds), search_shard_max_seconds)
+
+    if failed_windows:
+        logging.error(f"❌ {len(failed_windows)} time windows could not be fetched: {failed_windows}")
+        return None
+    records = deduplicate_records([record for record in records if isinstance(record, dict)], id_fields)
+    records.sort(key=get_record_timestamp, reverse=True)
+    logging.info(f"Fetched {len(records)} records in time windows from {datetime.fromtimestamp(start_epoch, timezone.utc).isoformat()}.")
+    return records
+
 def export_combined_inventory_with_site_info():
     """
     Combines fresh AllDevicesWithSiteInfo data into multiple CSV files
@@ -2382,12 +4778,11 @@ def export_combined_inventory_with_site_info():
     END_CUSTOMER_NAME = os.getenv("END_CUSTOMER_NAME")
     END_CUSTOMER_ACCOUNT_ID = os.getenv("END_CUSTOMER_ACCOUNT_ID")
 
-    # Always regenerate fresh data
-    export_devices_with_site_info_to_csv()
+    # Always regenerate fresh data (freshness of 0 minutes, never a stale copy), except in offline mode where the cached copy is used
+    check_and_generate_csv("AllDevicesWithSiteInfo.csv", export_devices_with_site_info_to_csv, freshness_minutes=0, stale_while_revalidate=False)
 
     # Load the enriched device + site info
-    with open("AllDevicesWithSiteInfo.csv", mode="r", encoding="utf-8") as f:
-        site_configs = list(csv.DictReader(f))
+    site_configs = load_csv_rows_with_memory_cache("AllDevicesWithSiteInfo.csv")
 
     # Create a subfolder for weekly CSV files
     output_folder = "CombinedInventory_ByWeek"
@@ -2433,14 +4828,14 @@ def export_combined_inventory_with_site_info():
     # Write weekly CSV files
     for week_key, rows in weekly_data.items():
         output_file = os.path.join(output_folder, f"{week_key}.csv")
-        with open(output_file, mode="w", newline="", encoding="utf-8") as f:
+        with open_file_for_atomic_replace(output_file, newline="") as f:
             writer = csv.DictWriter(f, fieldnames=fieldnames)
             writer.writeheader()
             writer.writerows(rows)
 
     # Write summary report
     summary_file = os.path.join(output_folder, "CombinedInventory_Summary.csv")
-    with open(summary_file, mode="w", newline="", encoding="utf-8") as f:
+    with open_file_for_atomic_replace(summary_file, newline="") as f:
         writer = csv.writer(f)
         writer.writerow(["Year", "Week", "Device Count"])
         for (year, week), count in sorted(summary_data.items()):
@@ -2448,6 +4843,150 @@ def export_combined_inventory_with_site_info():
 
     print("✅ CombinedInventory_ByWeek folder and summary report have been generated.")
 
+# Speculative prefetch while the interactive menu waits for input (enabled with --prefetch)
+prefetch_enabled = False
+prefetch_api_call_budget = 5  # Maximum estimated API calls spent on prefetching per menu prompt
+menu_history_file = "menu_history.json"
+menu_history_length = 50
+
+# Cached datasets each menu action reads, directly or through the site/device selection prompts
+menu_action_dataset_dependencies = {
+    "0": ["SiteList.csv"],
+    "16": ["SiteList.csv"],
+    "17": ["SiteList.csv"],
+    "18": ["SiteList.csv"],
+    "19": ["SiteList.csv"],
+    "23": ["SiteList.csv"],
+    "28": ["OrgDevicePortStats.csv", "AllDevicesWithSiteInfo.csv"],
+    "29": ["OrgAlarms.csv", "OrgDeviceEvents.csv", "SiteList.csv", "OrgDevices.csv", "OrgDeviceStats.csv", "OrgDevicePortStats.csv"],
+    "32": ["OrgInventory.csv"],
+    "33": ["SiteList.csv"],
+    "34": ["SiteList.csv"],
+    "38": ["SiteList.csv"],
+    "39": ["SiteList.csv"],
+    "40": ["SiteList.csv"],
+}
+
+# Datasets that may be prefetched and the function that generates each of them
+prefetchable_dataset_generators = {
+    "SiteList.csv": export_all_sites_to_csv,
+    "OrgInventory.csv": export_device_inventory_to_csv,
+    "OrgDevices.csv": export_all_devices_to_csv,
+    "OrgDeviceStats.csv": export_device_stats_to_csv,
+    "OrgDevicePortStats.csv": export_device_port_stats_to_csv,
+    "OrgAlarms.csv": export_open_org_alarms_to_csv,
+    "OrgDeviceEvents.csv": export_recent_device_events_to_csv,
+    "AllDevicesWithSiteInfo.csv": export_devices_with_site_info_to_csv,
+}
+
+# Datasets fetched as time-sharded searches (one call per window at least) and datasets built from
+# several org collections (one paginated fetch per source dataset's rows)
+time_sharded_datasets = {"OrgAlarms.csv", "OrgDeviceEvents.csv"}
+dataset_fetch_sources = {
+    "AllDevicesWithSiteInfo.csv": ["SiteList.csv", "OrgInventory.csv"],
+}
+
+def load_menu_history():
+    """
+    Returns the list of recent menu selections (oldest first) from menu_history.json.
+    """
+    try:
+        with open(menu_history_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def record_menu_selection(selection):
+    """
+    Appends a menu selection to menu_history.json, keeping only the most recent entries.
+    """
+    history = load_menu_history()
+    history.append({"selection": selection, "timestamp": datetime.now(timezone.utc).isoformat()})
+    try:
+        with open_file_for_atomic_replace(menu_history_file) as f:
+            json.dump(history[-menu_history_length:], f, indent=2)
+    except OSError as e:
+        logging.debug(f"Could not save menu history: {e}")
+
+def estimate_dataset_api_calls(file_name):
+    """
+    Estimates how many API calls regenerating a dataset costs, following its fetch path:
+    - time-sharded searches make at least one call per initial window over the range they fetch
+      (with --delta-sync only the range since the watermark, until the next full resync);
+    - datasets built from several org collections page through each of them;
+    - everything else pages through its own last recorded row count.
+    """
+    manifest = load_dataset_manifest()
+    if file_name in time_sharded_datasets:
+        entry = manifest.get(file_name, {})
+        range_seconds = search_history_hours * 3600
+        now_epoch = time.time()
+        if (
+            delta_sync_enabled
+            and entry.get("watermark_epoch") is not None
+            and now_epoch - entry.get("full_sync_epoch", 0) < delta_sync_full_resync_hours * 3600
+        ):
+            range_seconds = min(range_seconds, now_epoch - entry["watermark_epoch"] + delta_sync_overlap_seconds)
+        return max(1, math.ceil(range_seconds / search_shard_initial_seconds))
+    return sum(
+        max(1, math.ceil((manifest.get(source_file, {}).get("row_count") or 0) / 1000))
+        for source_file in dataset_fetch_sources.get(file_name, [file_name])
+    )
+
+def choose_datasets_to_prefetch(api_call_budget=None):
+    """
+    Ranks datasets by how often (and how recently) the menu actions that read them were selected,
+    then returns the stale ones that fit within the API call budget. Without history the site list
+    and org inventory are used, since almost every interactive path starts with them.
+    """
+    api_call_budget = prefetch_api_call_budget if api_call_budget is None else api_call_budget
+    recent_selections = [entry.get("selection") for entry in load_menu_history()[-20:]]
+
+    # Newer selections weigh more than older ones
+    dataset_scores = Counter()
+    for recency_weight, selection in enumerate(recent_selections, start=1):
+        for file_name in menu_action_dataset_dependencies.get(selection, []):
+            dataset_scores[file_name] += recency_weight
+    if not dataset_scores:
+        dataset_scores = Counter({"SiteList.csv": 2, "OrgInventory.csv": 1})
+
+    chosen_datasets = []
+    for file_name, _ in dataset_scores.most_common():
+        if file_name not in prefetchable_dataset_generators:
+            continue
+        if get_dataset_staleness_reason(file_name) is None:
+            continue  # Already fresh, nothing to do
+        estimated_calls = estimate_dataset_api_calls(file_name)
+        if estimated_calls > api_call_budget:
+            continue
+        api_call_budget -= estimated_calls
+        chosen_datasets.append(file_name)
+    return chosen_datasets
+
+def start_speculative_prefetch():
+    """
+    Starts background refreshes of the datasets the next menu action most likely needs.
+    Does nothing unless --prefetch is on and both org_id and API credentials are available without
+    prompting, because the foreground is busy waiting for the user's menu selection.
+    """
+    global org_id
+    if not prefetch_enabled or offline_mode:
+        return []
+    if not (read_env_file_value("MIST_HOST") and read_env_file_value("MIST_APITOKEN")):
+        logging.debug("Prefetch skipped: no non-interactive API credentials available.")
+        return []
+    org_id = org_id or read_env_file_value("org_id")
+    if not org_id:
+        logging.debug("Prefetch skipped: org_id is not known yet.")
+        return []
+
+    chosen_datasets = choose_datasets_to_prefetch()
+    for file_name in chosen_datasets:
+        refresh_dataset_in_background(file_name, prefetchable_dataset_generators[file_name])
+    if chosen_datasets:
+        logging.info(f"🔮 Prefetching while waiting for input: {chosen_datasets}")
+    return chosen_datasets
+
 menu_actions = {
     # 🗂️ Setup & Core Logs
     "0": (prompt_and_log_site_selection, "Select a site (used by other functions)"),
@@ -2500,9 +5039,76 @@ menu_actions = {
     "39": (lambda: run_shell_command_and_log(command="show dhcp-security binding | display json | no-more\nDONE!",log_filename="ws_dhcp.log",csv_output="DhcpSecurityBindings.csv",description="Show DHCP security bindings"), "Run 'show dhcp-security binding' on a selected device via shell session"),
     "40": (lambda: run_shell_command_and_log(command="show vlans | display json | no-more\nDONE! ",log_filename="ws_vlans.log",csv_output="Vlans.csv",description="Show VLANs"), "Run 'show vlans' on a selected device via shell session"),
     "41": (export_combined_inventory_with_site_info, "Export combined inventory with site and address info by calendar week"),
+    "42": (sync_all_constant_definitions_to_csv, "Sync all event and alarm definitions (4-10) at once, rewriting only CSVs whose content changed"),
 }
 
+# Menu actions that can run entirely from cached CSV files and are therefore allowed with --offline
+offline_capable_menu_actions = {"28", "29", "41"}
+
+def run_menu_action(func, **kwargs):
+    """
+    Runs one menu action with a fresh shared dataset registry and reports the API calls it saved,
+    the requests it sent per endpoint, the response cache hit rate and how well the HTTP connection pool was reused.
+    Operator-facing actions run at interactive API priority, everything else as bulk.
+    """
+    reset_org_collection_registry()
+    pool_stats_before = get_http_connection_pool_stats()
+    with _api_response_cache_lock:
+        response_cache_stats_before = dict(_api_response_cache_stats)
+    with _api_usage_lock:
+        request_counts_before = Counter(_api_request_counts)
+    try:
+        with api_call_priority(get_menu_action_priority(func)):
+            return func(**kwargs)
+    finally:
+        report_org_collection_registry_savings()
+        report_http_connection_pool_stats(pool_stats_before)
+        report_api_response_cache_stats(response_cache_stats_before)
+        report_api_request_counts(request_counts_before)
+
+def run_persistent_interactive_menu_loop():
+    """
+    Interactive menu that keeps running after each selection instead of exiting.
+    The logged-in API session, org_id and parsed CSV datasets stay in memory between actions,
+    so a sequence of selections costs one login and one load of each dataset.
+    """
+    logging.info("🔁 Starting persistent interactive menu session.")
+    while True:
+        print("\nAvailable Options:")
+        for key, (func, description) in menu_actions.items():
+            print(f"{key}: {description}")
+        start_speculative_prefetch()  # Use the idle prompt time to warm likely datasets
+        iwant = input("\nEnter your selection number now (q to quit): ").strip()
+
+        # Leave the loop on an explicit quit command
+        if iwant.lower() in {"q", "quit", "exit"}:
+            logging.info("User ended the persistent interactive menu session.")
+            break
+
+        selected = menu_actions.get(iwant)
+        if not selected:
+            logging.warning(f"Invalid selection '{iwant}' entered by user.")
+            print("Invalid selection. Please try again.")
+            continue
+
+        func, _ = selected
+        logging.info(f"User selected menu option '{iwant}'. Executing associated function.")
+        if prefetch_enabled:
+            record_menu_selection(iwant)
+        try:
+            run_menu_action(func)
+        except KeyboardInterrupt:
+            # Ctrl+C cancels the running action but keeps the session alive
+            logging.info(f"🛑 Menu option '{iwant}' interrupted by user. Returning to menu.")
+            print("\n🛑 Action interrupted. Returning to menu.")
+        except Exception as e:
+            # A failing action should not throw away the warm session
+            logging.error(f"❌ Menu option '{iwant}' failed: {e}")
+            print(f"❌ Menu option '{iwant}' failed: {e}")
+
 def main():
+    global fan_out_worker_count, fan_out_max_requests_per_second, search_history_hours
+
     # --- CLI Argument Parsing ---
     parser = argparse.ArgumentParser(description="MistHelper CLI Interface")
     parser.add_argument("-O", "--org", help="Organization ID")
@@ -2512,15 +5118,76 @@ def main():
     parser.add_argument("-P", "--port", help="Port ID")
     parser.add_argument("--debug", action="store_true", help="Enable debug output")
     parser.add_argument("--delay", type=int, help="Fixed delay between loop iterations (in seconds). If omitted, delay is dynamic.")
-    parser.add_argument("--fast", action="store_true", help="Enable fast mode with multithreading (bypasses rate limiting)")
+    parser.add_argument("--fast", action="store_true", help="Use one worker per CPU for gateway config fetches (still paced by the API budget)")
+    parser.add_argument("--workers", type=int, help=f"Concurrent workers for per-site/per-device fan-outs (default: {fan_out_worker_count})")
+    parser.add_argument("--max-rps", type=float, help="Upper limit on API requests per second for fan-outs (default: derived from the remaining hourly budget)")
+    parser.add_argument("--shared-budget", action="store_true", help=f"Share the hourly API budget fairly with other MistHelper processes in this directory ({shared_budget_ledger_file})")
+    parser.add_argument("--budget-status", action="store_true", help="Show this hour's API usage per MistHelper process from the shared budget ledger and exit")
+    parser.add_argument("--simulate-controller", metavar="WORKLOAD", help=f"Backtest the loop pacing controller offline on a synthetic workload ({', '.join(synthetic_controller_workloads)}) or a recorded {delay_metrics_file} / delay_metrics.json, then exit")
+    parser.add_argument("--simulate-iterations", type=int, help=f"Loop iterations in the simulated job (default: {controller_simulation_iterations}, or the recorded count when replaying)")
+    parser.add_argument("--simulate-gains", action="append", metavar="K_P,K_I", help="Extra PID gains to compare in the backtest, e.g. 0.05,0.0002 (repeatable)")
+    parser.add_argument("--offline", action="store_true", help="Run cache-only actions from existing CSVs without logging in or calling the API")
+    parser.add_argument("--repl", action="store_true", help="Keep the interactive menu running between selections, reusing the API session and loaded datasets")
+    parser.add_argument("--stale-while-revalidate", action="store_true", help="Serve expired cached CSVs immediately and refresh them in the background")
+    parser.add_argument("--response-cache", action="store_true", help="Cache GET responses per endpoint TTL (in memory and api_response_cache/) and coalesce identical concurrent requests")
+    parser.add_argument("--prefetch", action="store_true", help="Refresh likely-needed datasets in the background while the interactive menu waits for input")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted switch VC stats or gateway config collection from its journal")
+    parser.add_argument("--history-hours", type=int, help=f"Time range of the device event and alarm exports in hours, e.g. 720 for a 30 day backfill (default: {search_history_hours})")
+    parser.add_argument("--delta-sync", action="store_true", help="Only fetch alarms, device events and audit logs newer than the last sync and append them")
     args = parser.parse_args()
 
-    global org_id
-    if len(sys.argv) > 1:
+    global org_id, offline_mode, stale_while_revalidate_enabled, api_response_cache_enabled, prefetch_enabled, delta_sync_enabled, resume_enabled
+    global shared_budget_enabled, shared_budget_process_label
+    if args.shared_budget or args.budget_status:
+        shared_budget_enabled = True
+        shared_budget_process_label = " ".join(sys.argv[1:]) or "interactive menu"
+        logging.info(f"🤝 Shared API budget enabled ({shared_budget_ledger_file}).")
+    if args.budget_status:
+        show_shared_budget_status()
+        sys.exit(0)
+    if args.simulate_controller:
+        gain_settings = [tuple(float(gain) for gain in gains.split(",")) for gains in args.simulate_gains or []]
+        run_rate_controller_backtest(args.simulate_controller, iterations=args.simulate_iterations, fixed_delay=args.delay, gain_settings=gain_settings)
+        sys.exit(0)
+    if args.resume:
+        resume_enabled = True
+        logging.info("⏯️ Resume enabled: interrupted collections continue from their journals.")
+    if args.history_hours:
+        search_history_hours = args.history_hours
+        delta_sync_window_hours["OrgAlarms.csv"] = delta_sync_window_hours["OrgDeviceEvents.csv"] = search_history_hours
+    if args.workers:
+        fan_out_worker_count = max(1, args.workers)
+    if args.max_rps:
+        fan_out_max_requests_per_second = args.max_rps
+    if args.delta_sync:
+        delta_sync_enabled = True
+        logging.info("🔁 Delta sync enabled for alarms, device events and audit logs.")
+    if args.prefetch:
+        prefetch_enabled = True
+        logging.info(f"🔮 Speculative prefetch enabled (budget: {prefetch_api_call_budget} API calls per prompt).")
+    if args.response_cache:
+        api_response_cache_enabled = True
+        logging.info("📦 HTTP response cache enabled.")
+        prune_expired_api_response_cache()
+    if args.stale_while_revalidate:
+        stale_while_revalidate_enabled = True
+        logging.info("⏩ Stale-while-revalidate enabled for cached datasets.")
+    if args.offline:
+        offline_mode = True
+        logging.info(f"📴 Offline mode enabled. Only cache-only menu actions are available: {sorted(offline_capable_menu_actions, key=int)}")
+
+    if args.menu is not None:
         logging.info("CLI arguments detected, running in non-interactive mode.")
+        if offline_mode and args.menu not in offline_capable_menu_actions:
+            logging.error(f"❌ Menu option {args.menu} needs the Mist API and cannot run in offline mode.")
+            print(f"❌ Menu option {args.menu} needs the Mist API and cannot run in offline mode.")
+            sys.exit(1)
         if args.org:
             org_id = args.org
             logging.info(f"Overriding org_id with CLI argument: {org_id}")
+        elif offline_mode:
+            # Cache-only actions work without an org; prompting for one would need the API
+            org_id = read_env_file_value("org_id")
         else:
             org_id = get_cached_or_prompted_org_id()
 
@@ -2564,7 +5231,12 @@ def main():
             }
             sig = inspect.signature(func)
             accepted_args = {k: v for k, v in func_args.items() if k in sig.parameters and v is not None}
-            func(**accepted_args)
+            try:
+                run_menu_action(func, **accepted_args)
+            except OfflineModeError as e:
+                logging.error(f"❌ {e}")
+                print(f"❌ {e}")
+                sys.exit(1)
         else:
             logging.error(f"❌ Invalid menu option: {args.menu}")
             print(f"❌ Invalid menu option: {args.menu}")
@@ -2573,17 +5245,33 @@ def main():
         logging.info("CLI execution complete. Exiting.")
         sys.exit(0)
 
+    # --- Persistent Interactive Session ---
+    if args.repl:
+        if args.org:
+            org_id = args.org
+            logging.info(f"Overriding org_id with CLI argument: {org_id}")
+        run_persistent_interactive_menu_loop()
+        sys.exit(0)
+
     # --- Interactive Menu Fallback ---
     logging.info("No CLI arguments detected, running in interactive menu mode.")
     print("\nAvailable Options:")
     for key, (func, description) in menu_actions.items():
         print(f"{key}: {description}")
+    start_speculative_prefetch()  # Use the idle prompt time to warm likely datasets
     iwant = input("\nEnter your selection number now: ").strip()
     selected = menu_actions.get(iwant)
     if selected:
         func, _ = selected
         logging.info(f"User selected menu option '{iwant}'. Executing associated function.")
-        func()
+        if prefetch_enabled:
+            record_menu_selection(iwant)
+        try:
+            run_menu_action(func)
+        except OfflineModeError as e:
+            logging.error(f"❌ {e}")
+            print(f"❌ {e}")
+            sys.exit(1)
         sys.exit(0)
     else:
         logging.warning(f"Invalid selection '{iwant}' entered by user.")
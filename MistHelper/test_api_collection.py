@@ -0,0 +1,580 @@
+import pytest
+from MistHelper import MistHelper
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+
+@pytest.fixture
+def unthrottled(monkeypatch):
+    # Plenty of API budget and fresh token buckets, so rate limiting never slows a test down
+    monkeypatch.setattr(MistHelper, "get_budget_requests_per_second", lambda priority=None: 1000)
+    monkeypatch.setattr(MistHelper, "_api_rate_token_buckets", {})
+
+@pytest.fixture
+def fake_org_api(monkeypatch, tmp_path, unthrottled):
+    # Serve org collections from memory and count how often each is fetched
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(MistHelper, "org_id", "org-a")
+    fetch_counts = {"sites": 0, "inventory": 0}
+    collections = {
+        "sites": [{"id": "s1", "name": "SiteA", "address": "1 Main St, Town, CA 90000, US"}],
+        "inventory": [
+            {"id": "d1", "type": "gateway", "site_id": "s1", "name": "gw1", "mac": "aa"},
+            {"id": "d2", "type": "switch", "site_id": "s1", "name": "sw1", "mac": "bb"},
+        ],
+    }
+    def make_fetcher(name):
+        def fetch(session, collection_org_id):
+            fetch_counts[name] += 1
+            return FakeResponse(collections[name])
+        return fetch
+    for name in collections:
+        monkeypatch.setitem(MistHelper.org_collection_fetchers, name, make_fetcher(name))
+    monkeypatch.setattr(MistHelper.mistapi, "get_all", lambda response, mist_session: list(response.data))
+    MistHelper.reset_org_collection_registry()
+    return fetch_counts
+
+def test_registry_fetches_each_collection_once(fake_org_api):
+    MistHelper.export_devices_with_site_info_to_csv()
+    MistHelper.export_gateways_with_site_info_to_csv()
+    assert MistHelper.get_site_ids_with_gateway_devices(MistHelper.apisession, "org-a") == ["s1"]
+    assert fake_org_api == {"sites": 1, "inventory": 1}
+    assert MistHelper._org_collection_registry_stats["api_calls_saved"] == 3
+
+def test_registry_items_are_not_modified_by_enrichment(fake_org_api):
+    MistHelper.export_devices_with_site_info_to_csv()
+    assert "site_name" not in MistHelper.get_shared_org_collection("inventory")[0]
+
+def test_registry_is_reset_between_menu_actions(fake_org_api):
+    MistHelper.run_menu_action(lambda: MistHelper.get_shared_org_collection("sites"))
+    MistHelper.run_menu_action(lambda: MistHelper.get_shared_org_collection("sites"))
+    assert fake_org_api["sites"] == 2
+
+def test_combined_inventory_regenerates_even_with_stale_while_revalidate(fake_org_api, monkeypatch):
+    MistHelper.export_devices_with_site_info_to_csv()
+    MistHelper.reset_org_collection_registry()
+    monkeypatch.setattr(MistHelper, "stale_while_revalidate_enabled", True)
+    monkeypatch.setattr(MistHelper, "_background_dataset_refresh_threads", {})
+    MistHelper.export_combined_inventory_with_site_info()
+    assert fake_org_api["inventory"] == 2
+    assert MistHelper._background_dataset_refresh_threads == {}
+
+class FakeMistSession:
+    # Counts GETs and answers each one slowly so concurrent callers overlap
+    def __init__(self):
+        self.calls = []
+    def mist_get(self, uri, query=None):
+        import time
+        self.calls.append(uri)
+        time.sleep(0.2)
+        response = FakeResponse({"uri": uri})
+        response.url = "https://api.mist.com" + uri
+        response.next = None
+        response.headers = {}
+        return response
+
+@pytest.fixture
+def response_cache(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    session = FakeMistSession()
+    monkeypatch.setattr(MistHelper, "_authenticated_api_session", session)
+    monkeypatch.setattr(MistHelper, "api_response_cache_enabled", True)
+    monkeypatch.setattr(MistHelper, "_api_response_memory_cache", {})
+    return session
+
+def test_response_cache_coalesces_concurrent_requests(response_cache):
+    from concurrent.futures import ThreadPoolExecutor
+    uri = "/api/v1/sites/s1/devices/d1"
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: MistHelper.apisession.mist_get(uri), range(4)))
+    assert response_cache.calls == [uri]
+    assert all(result.data == {"uri": uri} for result in results)
+
+def test_response_cache_replays_from_disk(response_cache, monkeypatch):
+    uri = "/api/v1/sites/s1/stats/devices/d1"
+    MistHelper.apisession.mist_get(uri)
+    monkeypatch.setattr(MistHelper, "_api_response_memory_cache", {})
+    assert MistHelper.apisession.mist_get(uri).data == {"uri": uri}
+    assert response_cache.calls == [uri]
+
+def test_response_cache_drops_expired_disk_entries(response_cache, monkeypatch, caplog):
+    import logging, os
+    MistHelper.apisession.mist_get("/api/v1/sites/s1/stats/devices/d1")
+    MistHelper.apisession.mist_get("/api/v1/sites/s1/devices/d1")
+    monkeypatch.setattr(MistHelper, "api_response_cache_ttl_seconds", [(r"^/api/v1/sites/[^/]+/stats/", -1)])
+    MistHelper.apisession.mist_get("/api/v1/sites/s1/stats/devices/d2")
+    assert len(os.listdir("api_response_cache")) == 3
+    with caplog.at_level(logging.INFO):
+        MistHelper.prune_expired_api_response_cache()
+    assert len(os.listdir("api_response_cache")) == 2
+    assert "Pruned 1 expired" in caplog.text
+
+def test_response_cache_stats_are_logged_per_action(response_cache, caplog):
+    import logging
+    uri = "/api/v1/sites/s1/devices/d1"
+    with caplog.at_level(logging.INFO):
+        MistHelper.run_menu_action(lambda: [MistHelper.apisession.mist_get(uri) for _ in range(2)])
+    assert "Response cache: 1 memory hits, 0 disk hits, 1 misses" in caplog.text
+
+def test_response_cache_skips_unlisted_endpoints(response_cache):
+    MistHelper.apisession.mist_get("/api/v1/self/usage")
+    MistHelper.apisession.mist_get("/api/v1/self/usage")
+    assert len(response_cache.calls) == 2
+
+@pytest.fixture
+def alarm_feed(monkeypatch, tmp_path):
+    # Alarm search endpoint that answers from an in-memory list and records the requested start times
+    import time
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(MistHelper, "org_id", "org-a")
+    monkeypatch.setattr(MistHelper, "_dataset_manifest_cache", None)
+    monkeypatch.setattr(MistHelper.mistapi, "get_all", lambda response, mist_session: list(response.data))
+    now = time.time()
+    feed = {"alarms": [{"id": "a1", "timestamp": now - 3600}, {"id": "old", "timestamp": now - 30 * 3600}], "starts": []}
+    def searchOrgAlarms(session, alarm_org_id, start, end, limit, **query):
+        feed["starts"].append(start)
+        return FakeResponse([alarm for alarm in feed["alarms"] if start <= alarm["timestamp"] <= end])
+    feed["api_call"] = searchOrgAlarms
+    return feed
+
+def test_delta_sync_appends_new_records_after_watermark(alarm_feed):
+    import time
+    sync = lambda: MistHelper.sync_time_window_dataset_incrementally("OrgAlarms.csv", alarm_feed["api_call"], ["id"], status="open")
+    assert sync() == 1
+    alarm_feed["alarms"].append({"id": "a2", "timestamp": time.time() - 10})
+    alarm_feed["starts"].clear()
+    assert sync() == 2
+    watermark = MistHelper.load_dataset_manifest()["OrgAlarms.csv"]["watermark_epoch"]
+    # Only the range after the first alarm (minus the overlap) is requested again
+    assert min(alarm_feed["starts"]) >= time.time() - 3600 - MistHelper.delta_sync_overlap_seconds - 5
+    assert sync() == 2
+    assert [row["id"] for row in MistHelper.load_csv_rows_with_memory_cache("OrgAlarms.csv")] == ["a1", "a2"]
+    assert MistHelper.load_dataset_manifest()["OrgAlarms.csv"]["watermark_epoch"] == watermark
+
+def test_device_events_sharing_device_time_and_type_are_kept(alarm_feed, monkeypatch):
+    import time
+    event_time = time.time() - 3600
+    alarm_feed["alarms"][:] = [
+        {"mac": "aa", "timestamp": event_time, "type": "SW_PORT_DOWN", "port_id": "ge-0/0/1"},
+        {"mac": "aa", "timestamp": event_time, "type": "SW_PORT_DOWN", "port_id": "ge-0/0/2"},
+    ]
+    monkeypatch.setattr(MistHelper.mistapi.api.v1.orgs.devices, "searchOrgDeviceEvents", alarm_feed["api_call"])
+    MistHelper.export_recent_device_events_to_csv()
+    assert len(MistHelper.load_csv_rows_with_memory_cache("OrgDeviceEvents.csv")) == 2
+    monkeypatch.setattr(MistHelper, "delta_sync_enabled", True)
+    MistHelper.export_recent_device_events_to_csv()
+    MistHelper.export_recent_device_events_to_csv()  # Delta sync refetches the overlap
+    assert [row["port_id"] for row in MistHelper.load_csv_rows_with_memory_cache("OrgDeviceEvents.csv")] == ["ge-0/0/1", "ge-0/0/2"]
+
+def test_delta_sync_trims_rows_outside_window(alarm_feed, monkeypatch):
+    sync = lambda: MistHelper.sync_time_window_dataset_incrementally("OrgAlarms.csv", alarm_feed["api_call"], ["id"], status="open")
+    sync()
+    monkeypatch.setitem(MistHelper.delta_sync_window_hours, "OrgAlarms.csv", 0.5)
+    assert sync() == 0
+
+def test_site_settings_refetch_only_changed_sites(fake_org_api, monkeypatch):
+    fetched = []
+    def getSiteSetting(session, site_id):
+        fetched.append(site_id)
+        return FakeResponse({"vars": {"site": site_id}})
+    monkeypatch.setattr(MistHelper.mistapi.api.v1.sites.setting, "getSiteSetting", getSiteSetting)
+    sites = MistHelper.get_shared_org_collection("sites")
+    sites[0]["modified_time"] = 100
+    sites.append({"id": "s2", "name": "SiteB", "modified_time": 100})
+    MistHelper.fetch_all_site_settings_from_api(MistHelper.apisession, "org-a")
+    assert fetched == ["s1", "s2"]
+
+    sites[1]["modified_time"] = 200
+    configs = MistHelper.fetch_all_site_settings_from_api(MistHelper.apisession, "org-a")
+    assert fetched == ["s1", "s2", "s2"]
+    assert [config["site_id"] for config in configs] == ["s1", "s2"]
+    assert configs[0]["vars"] == {"site": "s1"}
+
+def test_gateway_configs_refetch_only_modified_gateways(fake_org_api, monkeypatch):
+    fetched = []
+    def getSiteDevice(session, site_id, device_id):
+        fetched.append(device_id)
+        return FakeResponse({"id": device_id, "port_config": {}})
+    monkeypatch.setattr(MistHelper.mistapi.api.v1.sites.devices, "getSiteDevice", getSiteDevice)
+    inventory = MistHelper.get_shared_org_collection("inventory")
+    inventory.append({"id": "d3", "type": "gateway", "site_id": "s1", "name": "gw2", "modified_time": 1})
+    MistHelper.fetch_gateway_device_configs_from_api(MistHelper.apisession, "org-a", fast=True)
+    assert sorted(fetched) == ["d1", "d3"]
+
+    inventory[-1]["modified_time"] = 2
+    configs = MistHelper.fetch_gateway_device_configs_from_api(MistHelper.apisession, "org-a", fast=True)
+    assert sorted(fetched) == ["d1", "d3", "d3"]
+    assert [config["id"] for config in configs] == ["d1", "d3"]
+
+def test_fan_out_keeps_order_and_respects_rate_cap(unthrottled, monkeypatch):
+    import time
+    monkeypatch.setattr(MistHelper, "fan_out_max_requests_per_second", 20)
+    def call(item):
+        if item == 3:
+            raise RuntimeError("boom")
+        return item * 2
+    started = time.monotonic()
+    results = MistHelper.run_api_calls_concurrently(list(range(10)), call, max_workers=4)
+    assert results == [0, 2, 4, None, 8, 10, 12, 14, 16, 18]
+    # The first 4 calls use the burst; the other 6 wait for tokens at 20 per second
+    assert time.monotonic() - started >= 0.25
+
+class ThrottlingMistSession:
+    # Answers 429 with Retry-After the first time each URI is requested, then 200
+    def __init__(self):
+        self.calls = []
+    def mist_get(self, uri, query=None):
+        response = FakeResponse({"uri": uri}, status_code=429 if uri not in self.calls else 200)
+        self.calls.append(uri)
+        response.headers = {"Retry-After": "0.1"} if response.status_code == 429 else {}
+        response.url = uri
+        return response
+
+def test_fan_out_retries_throttled_items_after_retry_after(unthrottled, monkeypatch):
+    session = ThrottlingMistSession()
+    monkeypatch.setattr(MistHelper, "_authenticated_api_session", session)
+    uris = [f"/api/v1/sites/s{i}/devices" for i in range(5)]
+    results = MistHelper.run_api_calls_concurrently(uris, lambda uri: MistHelper.apisession.mist_get(uri).data, max_workers=4)
+    assert results == [{"uri": uri} for uri in uris]
+    assert len(session.calls) == 10
+
+def test_fan_out_retries_calls_that_raise_on_throttling(unthrottled, monkeypatch):
+    session = ThrottlingMistSession()
+    monkeypatch.setattr(MistHelper, "_authenticated_api_session", session)
+    def fetch(uri):
+        response = MistHelper.apisession.mist_get(uri)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return response.data
+    uris = [f"/api/v1/sites/s{i}/devices" for i in range(2)]
+    assert MistHelper.run_api_calls_concurrently(uris, fetch, max_workers=2) == [{"uri": uri} for uri in uris]
+    assert len(session.calls) == 4
+
+def test_adaptive_concurrency_halves_on_throttle_and_grows_back():
+    limit = MistHelper.AdaptiveConcurrencyLimit(8)
+    limit.acquire()
+    limit.release(0.1, throttled=True)
+    assert int(limit.limit) == 4
+    for _ in range(30):
+        limit.acquire()
+        limit.release(0.1)
+    assert int(limit.limit) == 8
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert MistHelper.parse_retry_after_seconds({"Retry-After": "7"}) == 7
+    assert MistHelper.parse_retry_after_seconds({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+    assert MistHelper.parse_retry_after_seconds({}) is None
+
+def test_interrupted_vc_collection_resumes_from_journal(fake_org_api, monkeypatch):
+    import os
+    monkeypatch.setattr(MistHelper, "_dataset_manifest_cache", None)
+    monkeypatch.setattr(MistHelper, "fan_out_worker_count", 1)
+    switches = [{"id": f"sw{i}", "type": "switch", "site_id": "s1", "name": f"switch{i}"} for i in range(3)]
+    MistHelper.write_dict_list_to_csv(switches, "OrgInventory.csv")
+    fetched, interrupt_at = [], {"sw1"}
+    def getSiteDeviceVirtualChassis(session, site_id, device_id):
+        if device_id in interrupt_at:
+            interrupt_at.clear()
+            raise KeyboardInterrupt
+        fetched.append(device_id)
+        return FakeResponse({"status": "present"})
+    monkeypatch.setattr(MistHelper.mistapi.api.v1.sites.devices, "getSiteDeviceVirtualChassis", getSiteDeviceVirtualChassis)
+    monkeypatch.setattr(MistHelper.mistapi.api.v1.orgs.stats, "listOrgDevicesStats", lambda *args, **kwargs: FakeResponse([]))
+
+    with pytest.raises(KeyboardInterrupt):
+        MistHelper.export_switch_vc_stats_to_csv()
+    assert os.path.exists("OrgSwitchVCStats.journal.jsonl")
+
+    monkeypatch.setattr(MistHelper, "resume_enabled", True)
+    MistHelper.export_switch_vc_stats_to_csv()
+    assert sorted(fetched) == ["sw0", "sw1", "sw2"]  # Each switch fetched exactly once across both runs
+    assert [row["id"] for row in MistHelper.load_csv_rows_with_memory_cache("OrgSwitchVCStats.csv")] == ["sw0", "sw1", "sw2"]
+    assert not os.path.exists("OrgSwitchVCStats.journal.jsonl")
+
+class PagedMistSession:
+    # Serves 5 pages of 2 items; later pages answer faster so they complete out of order
+    def __init__(self):
+        self.calls = []
+    def page(self, number):
+        import time
+        time.sleep(0.05 * (5 - number))
+        response = FakeResponse([f"item{number}a", f"item{number}b"])
+        response.url = f"https://api.mist.com/api/v1/orgs/org-a/inventory?limit=2&page={number}"
+        response.headers = {"X-Page-Total": "10", "X-Page-Limit": "2", "X-Page-Page": str(number)}
+        response.next = None
+        return response
+    def mist_get(self, uri, query=None):
+        self.calls.append(uri)
+        return self.page(int(uri.rsplit("page=", 1)[1]))
+
+def test_pages_are_fetched_concurrently_in_page_order(unthrottled):
+    session = PagedMistSession()
+    items = MistHelper.get_all_pages_concurrently(session.page(1), mist_session=session)
+    assert items == [f"item{n}{s}" for n in range(1, 6) for s in "ab"]
+    assert sorted(session.calls) == [f"/api/v1/orgs/org-a/inventory?limit=2&page={n}" for n in range(2, 6)]
+
+class PartlyFailingPagedMistSession(PagedMistSession):
+    # Page 3 keeps failing with a server error
+    def page(self, number):
+        response = super().page(number)
+        if number == 3:
+            response.status_code = 500
+        return response
+
+def test_missing_pages_are_neither_cached_nor_snapshotted(fake_org_api, monkeypatch):
+    monkeypatch.setattr(MistHelper.mistapi.api.v1.sites.setting, "getSiteSetting", lambda session, site_id: FakeResponse({"vars": {}}))
+    MistHelper.fetch_all_site_settings_from_api(MistHelper.apisession, "org-a")
+    with open(MistHelper.site_settings_snapshot_file, "rb") as f:
+        snapshot = f.read()
+
+    session = PartlyFailingPagedMistSession()
+    monkeypatch.setattr(MistHelper, "_authenticated_api_session", session)
+    monkeypatch.setattr(MistHelper, "fan_out_max_attempts", 1)
+    monkeypatch.setitem(MistHelper.org_collection_fetchers, "sites", lambda mist_session, collection_org_id: session.page(1))
+    MistHelper.reset_org_collection_registry()
+    with pytest.raises(MistHelper.IncompletePaginationError):
+        MistHelper.get_shared_org_collection("sites")
+    assert MistHelper.fetch_all_site_settings_from_api(MistHelper.apisession, "org-a") == []
+    with open(MistHelper.site_settings_snapshot_file, "rb") as f:
+        assert f.read() == snapshot
+    assert len(session.calls) == 8  # Retried by each consumer instead of served truncated
+
+def test_time_range_shards_are_merged_deduplicated_and_resized(alarm_feed, unthrottled, monkeypatch):
+    import time
+    monkeypatch.setattr(MistHelper, "search_shard_target_records", 2)
+    monkeypatch.setattr(MistHelper, "fan_out_worker_count", 1)  # Waves of two windows
+    now = time.time()
+    alarm_feed["alarms"] = [{"id": f"a{i}", "timestamp": now - i * 600} for i in range(48)]
+    alarm_feed["alarms"].append({"id": "a3", "timestamp": now - 1800})  # Same alarm reported twice
+    records = MistHelper.fetch_time_range_in_shards(alarm_feed["api_call"], now - 12 * 3600, now, id_fields=["id"])
+    assert [record["id"] for record in records] == [f"a{i}" for i in range(48)]
+    # The first wave used hourly windows; later waves shrank them to about 2 records each
+    assert len(alarm_feed["starts"]) > 12
+
+def test_http_pool_reuses_connections_across_workers(monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    class KeepAliveHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+        def log_message(self, *args):
+            pass
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(MistHelper, "_http_pool_adapters", [])
+    monkeypatch.setattr(MistHelper, "fan_out_worker_count", 12)
+    session = MistHelper.requests.Session()
+    MistHelper.configure_http_connection_pool(session)
+    url = f"http://127.0.0.1:{server.server_port}/"
+    try:
+        with ThreadPoolExecutor(max_workers=12) as executor:
+            list(executor.map(lambda _: session.get(url).status_code, range(48)))
+    finally:
+        server.shutdown()
+    stats = MistHelper.get_http_connection_pool_stats()
+    assert stats["requests"] == 48
+    assert stats["misses"] <= 12  # No connection was discarded and re-opened
+    assert stats["hits"] == 48 - stats["misses"]
+
+def test_vc_details_are_only_fetched_for_vc_members(fake_org_api, monkeypatch):
+    monkeypatch.setattr(MistHelper, "_dataset_manifest_cache", None)
+    switches = [{"id": f"sw{i}", "type": "switch", "site_id": "s1", "mac": f"m{i}", "serial": f"S{i}"} for i in range(4)]
+    MistHelper.write_dict_list_to_csv(switches, "OrgInventory.csv")
+    org_stats = [
+        {"id": "sw0", "module_stat": [{"vc_role": "master", "mac": "m0"}, {"vc_role": "backup", "serial": "S1"}]},
+        {"id": "sw2", "module_stat": [{"vc_role": "master", "mac": "m2"}]},
+        {"id": "sw3", "module_stat": []},
+    ]
+    def listOrgDevicesStats(session, org_id, fields=None, **kwargs):
+        # Like the real endpoint, the org-level stats omit module_stat unless it is requested
+        requested = (fields or "").split(",")
+        return FakeResponse([{key: value for key, value in stats.items() if key == "id" or fields == "*" or key in requested} for stats in org_stats])
+    monkeypatch.setattr(MistHelper.mistapi.api.v1.orgs.stats, "listOrgDevicesStats", listOrgDevicesStats)
+    fetched = []
+    def getSiteDeviceVirtualChassis(session, site_id, device_id):
+        fetched.append(device_id)
+        return FakeResponse({"vc_mac": "m0"})
+    monkeypatch.setattr(MistHelper.mistapi.api.v1.sites.devices, "getSiteDeviceVirtualChassis", getSiteDeviceVirtualChassis)
+    MistHelper.export_switch_vc_stats_to_csv()
+    assert sorted(fetched) == ["sw0", "sw1"]
+    rows = MistHelper.load_csv_rows_with_memory_cache("OrgSwitchVCStats.csv")
+    assert sorted(row["id"] for row in rows) == ["sw0", "sw1", "sw2", "sw3"]
+
+def test_synthetic_tests_use_inventory_without_site_listing(fake_org_api, monkeypatch):
+    fetched = []
+    def getSiteDeviceSyntheticTest(session, site_id, device_id):
+        fetched.append((site_id, device_id))
+        return FakeResponse({"status": "ok"})
+    def listSiteDevices(*args, **kwargs):
+        raise AssertionError("per-site device listing should not be needed")
+    monkeypatch.setattr(MistHelper.mistapi.api.v1.sites.devices, "getSiteDeviceSyntheticTest", getSiteDeviceSyntheticTest)
+    monkeypatch.setattr(MistHelper.mistapi.api.v1.sites.devices, "listSiteDevices", listSiteDevices)
+    MistHelper.export_gateway_synthetic_tests_to_csv()
+    assert fetched == [("s1", "d1")]
+    assert fake_org_api["inventory"] == 1
+
+def test_request_hook_counts_sent_requests_by_endpoint(monkeypatch):
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+        def log_message(self, *args):
+            pass
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(MistHelper, "_api_request_counts", MistHelper.Counter())
+    monkeypatch.setitem(MistHelper._api_usage_cache, "requests_since_reconcile", 0)
+    session = MistHelper.requests.Session()
+    MistHelper.install_request_accounting_hook(session)
+    MistHelper.install_request_accounting_hook(session)
+    base = f"http://127.0.0.1:{server.server_port}/api/v1"
+    try:
+        for site_id in ("6f4bf402-45f9-4d3e-9a51-5e1a2b3c4d5e", "0a1b2c3d-0000-1111-2222-333344445555"):
+            session.get(f"{base}/sites/{site_id}/devices/00000000-0000-0000-1000-5c5b35aabbcc/stats")
+        session.get(f"{base}/sites/6f4bf402-45f9-4d3e-9a51-5e1a2b3c4d5e/stats/clients/5c5b35aabbcc?limit=10")
+    finally:
+        server.shutdown()
+    assert MistHelper._api_request_counts == {
+        "GET /api/v1/sites/{id}/devices/{id}/stats": 2,
+        "GET /api/v1/sites/{id}/stats/clients/{mac}": 1,
+    }
+    assert MistHelper._api_usage_cache["requests_since_reconcile"] == 3
+
+def test_api_usage_is_counted_locally_and_reconciled_rarely(monkeypatch):
+    polls = []
+    def getSelfApiUsage(session):
+        polls.append(1)
+        return FakeResponse({"requests": 40, "request_limit": 5000})
+    monkeypatch.setattr(MistHelper.mistapi.api.v1.self.usage, "getSelfApiUsage", getSelfApiUsage)
+    monkeypatch.setattr(MistHelper, "_api_usage_cache", dict(MistHelper._api_usage_cache, initialized=False, requests_since_reconcile=0))
+    assert MistHelper.refresh_api_usage_estimate() == (40, 5000)
+    for _ in range(150):
+        MistHelper._api_usage_cache["requests_since_reconcile"] += 1
+        used, limit = MistHelper.refresh_api_usage_estimate()
+    assert (used, limit) == (190, 5000)
+    assert len(polls) == 1
+    MistHelper._api_usage_cache["last_reconciled"] -= MistHelper.api_usage_reconcile_interval_seconds
+    assert MistHelper.refresh_api_usage_estimate() == (40, 5000)
+    assert len(polls) == 2
+
+def test_fair_shares_give_unused_budget_to_busy_processes():
+    shares = MistHelper.allocate_fair_budget_shares(3.0, {1: float("inf"), 2: 0.5, 3: float("inf")})
+    assert shares == {1: 1.25, 2: 0.5, 3: 1.25}
+    assert MistHelper.allocate_fair_budget_shares(1.0, {1: 0.2, 2: 0.3}) == {1: 0.2, 2: 0.3}
+
+def test_processes_share_one_budget_ledger(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    polls = []
+    def getSelfApiUsage(session):
+        polls.append(1)
+        return FakeResponse({"requests": 1000, "request_limit": 5000})
+    monkeypatch.setattr(MistHelper.mistapi.api.v1.self.usage, "getSelfApiUsage", getSelfApiUsage)
+    loop_process = MistHelper.SharedApiBudgetLedger(MistHelper.shared_budget_ledger_file)
+    monkeypatch.setattr(MistHelper.os, "getpid", MistHelper.os.getppid)  # A second, live process
+    operator_process = MistHelper.SharedApiBudgetLedger(MistHelper.shared_budget_ledger_file)
+    assert loop_process.read_usage() == (1000, 5000)
+    for _ in range(3):
+        loop_process.record_request()
+    operator_process.record_request()
+    assert operator_process.read_usage() == (1004, 5000)
+    assert len(polls) == 1
+
+    assert loop_process.claim_fair_share(2.0, 0.4) == 0.4
+    assert operator_process.claim_fair_share(2.0, float("inf")) == 1.6
+    processes = {process["pid"]: process for process in operator_process.list_processes()}
+    assert processes[loop_process.pid]["requests_this_hour"] == 3
+    assert processes[loop_process.pid]["share_rps"] == "0.4"
+    assert processes[operator_process.pid]["demand_rps"] == "queueing"
+
+def test_budget_rate_keeps_headroom_for_higher_priorities(monkeypatch):
+    monkeypatch.setattr(MistHelper, "refresh_api_usage_estimate", lambda: (3600, 5000))
+    rates = {priority: MistHelper.get_budget_requests_per_second(priority) for priority in MistHelper.api_priority_classes}
+    assert rates["interactive"] > rates["bulk"] > 0
+    assert rates["background"] == 0
+    assert MistHelper.get_background_budget_pause_seconds() > 0
+    monkeypatch.setattr(MistHelper, "refresh_api_usage_estimate", lambda: (1000, 5000))
+    assert MistHelper.get_background_budget_pause_seconds() == 0
+
+def test_paused_background_bucket_waits_for_budget(monkeypatch):
+    import threading
+    rate = {"background": 0}
+    monkeypatch.setattr(MistHelper, "get_budget_requests_per_second", lambda priority=None: rate[priority])
+    monkeypatch.setattr(MistHelper.ApiRequestTokenBucket, "rate_refresh_seconds", 0.05)
+    bucket = MistHelper.ApiRequestTokenBucket(capacity=2, priority="background")
+    acquired = threading.Event()
+    threading.Thread(target=lambda: (bucket.acquire(), acquired.set()), daemon=True).start()
+    assert not acquired.wait(0.3)
+    rate["background"] = 100
+    assert acquired.wait(2)
+
+def test_shares_serve_interactive_before_bulk_and_background():
+    demands = {"operator": 0.5, "export": float("inf"), "loop": float("inf")}
+    priorities = {"operator": "interactive", "export": "bulk", "loop": "background"}
+    assert MistHelper.allocate_fair_budget_shares(2.0, demands, priorities) == {"operator": 0.5, "export": 1.5, "loop": 0}
+    demands["operator"] = float("inf")
+    assert MistHelper.allocate_fair_budget_shares(2.0, demands, priorities) == {"operator": 2.0, "export": 0, "loop": 0}
+
+def test_interactive_menu_actions_tag_their_fan_out_workers(unthrottled, monkeypatch):
+    seen = []
+    def show_device_stats():
+        seen.append(MistHelper.get_current_api_priority())
+        MistHelper.run_api_calls_concurrently([1, 2], lambda item: seen.append(MistHelper.get_current_api_priority()))
+    monkeypatch.setitem(MistHelper.menu_actions, "17", (show_device_stats, "desc"))
+    MistHelper.run_menu_action(show_device_stats)
+    assert seen == ["interactive"] * 3
+    assert set(MistHelper._api_rate_token_buckets) == {"interactive"}
+    assert MistHelper.get_current_api_priority() == "bulk"
+
+class PasswordLoginApiSession:
+    # Like mistapi's password login, login() replaces the requests session
+    def __init__(self, **kwargs):
+        self._session = MistHelper.requests.Session()
+    def login(self):
+        self._session = MistHelper.requests.Session()
+
+def test_http_pool_is_sized_on_the_session_left_after_login(monkeypatch):
+    monkeypatch.setattr(MistHelper.mistapi, "APISession", PasswordLoginApiSession)
+    monkeypatch.setattr(MistHelper, "_authenticated_api_session", None)
+    monkeypatch.setattr(MistHelper, "_http_pool_adapters", [])
+    monkeypatch.setattr(MistHelper, "_http_pool_sizes", {})
+    http_session = MistHelper.get_authenticated_api_session()._session
+    assert http_session.get_adapter("https://api.mist.com") in MistHelper._http_pool_adapters
+    assert MistHelper.count_outgoing_api_request in http_session.hooks["response"]
+
+def test_fast_fan_out_grows_the_http_pool(monkeypatch):
+    monkeypatch.setattr(MistHelper, "_http_pool_adapters", [])
+    monkeypatch.setattr(MistHelper, "_http_pool_sizes", {})
+    monkeypatch.setattr(MistHelper, "fan_out_worker_count", 4)
+    session = MistHelper.requests.Session()
+    MistHelper.configure_http_connection_pool(session)
+    assert MistHelper._http_pool_sizes[session] == 10
+    MistHelper.ensure_http_connection_pool_size(16)
+    assert MistHelper._http_pool_sizes[session] == 32
+    assert session.get_adapter("https://api.mist.com")._pool_maxsize == 32
+
+def test_usage_poll_does_not_hold_the_usage_lock(monkeypatch):
+    import threading
+    lock_free_during_poll = []
+    def getSelfApiUsage(session):
+        other_thread = threading.Thread(target=lambda: lock_free_during_poll.append(MistHelper._api_usage_lock.acquire(timeout=1) and MistHelper._api_usage_lock.release() is None))
+        other_thread.start()
+        other_thread.join()
+        return FakeResponse({"requests": 40, "request_limit": 5000})
+    monkeypatch.setattr(MistHelper.mistapi.api.v1.self.usage, "getSelfApiUsage", getSelfApiUsage)
+    monkeypatch.setattr(MistHelper, "_api_usage_cache", dict(MistHelper._api_usage_cache, initialized=False, requests_since_reconcile=0))
+    monkeypatch.setattr(MistHelper, "_pid_tuning_state", {**MistHelper.default_pid_tuning_data, "error": []})
+    monkeypatch.setattr(MistHelper, "mark_controller_state_changed", lambda: None)
+    monkeypatch.setattr(MistHelper, "record_delay_metrics", lambda delay_metrics: None)
+    MistHelper.get_rate_limited_delay()
+    assert lock_free_during_poll == [True]
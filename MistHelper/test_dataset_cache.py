@@ -0,0 +1,273 @@
+import os
+import sys
+import time
+import pytest
+from MistHelper import MistHelper
+
+@pytest.fixture
+def offline(monkeypatch, tmp_path):
+    # Run each test in an empty working directory with offline mode switched on
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(MistHelper, "offline_mode", True)
+    return tmp_path
+
+def test_import_does_not_log_in():
+    # The API session is only created on first use
+    assert MistHelper._authenticated_api_session is None
+
+def test_offline_uses_stale_cached_csv(offline):
+    with open("SiteList.csv", "w") as f:
+        f.write("id,name\n1,SiteA\n")
+    old = time.time() - 24 * 3600
+    os.utime("SiteList.csv", (old, old))
+    called = {}
+    MistHelper.check_and_generate_csv("SiteList.csv", lambda: called.setdefault("ran", True))
+    assert "ran" not in called
+
+def test_offline_missing_csv_raises(offline):
+    with pytest.raises(MistHelper.OfflineModeError):
+        MistHelper.check_and_generate_csv("SiteList.csv", lambda: None)
+
+def test_offline_api_session_raises(offline):
+    with pytest.raises(MistHelper.OfflineModeError):
+        MistHelper.apisession.mist_get("/api/v1/self")
+
+def test_cli_offline_rejects_api_menu_action(offline, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["MistHelper.py", "--offline", "-M", "11"])
+    with pytest.raises(SystemExit) as e:
+        MistHelper.main()
+    assert e.value.code == 1
+    assert "offline mode" in capsys.readouterr().out
+
+def test_cli_offline_action_runs_without_org(offline, monkeypatch):
+    monkeypatch.setattr(MistHelper, "org_id", None)
+    monkeypatch.setattr(sys, "argv", ["MistHelper.py", "--offline", "-M", "28"])
+    calls = []
+    monkeypatch.setitem(MistHelper.menu_actions, "28", (lambda: calls.append("28"), "desc"))
+    with pytest.raises(SystemExit) as e:
+        MistHelper.main()
+    assert e.value.code == 0
+    assert calls == ["28"]
+
+def test_repl_runs_several_actions_then_quits(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["MistHelper.py", "--repl"])
+    answers = iter(["11", "99", "11", "q"])
+    monkeypatch.setattr("builtins.input", lambda _: next(answers))
+    calls = []
+    monkeypatch.setitem(MistHelper.menu_actions, "11", (lambda: calls.append("11"), "desc"))
+    with pytest.raises(SystemExit) as e:
+        MistHelper.main()
+    assert e.value.code == 0
+    assert calls == ["11", "11"]
+    assert not os.path.exists(MistHelper.menu_history_file)  # Only recorded with --prefetch
+
+def test_csv_rows_are_reused_until_file_changes(offline, monkeypatch):
+    with open("SiteList.csv", "w") as f:
+        f.write("id,name\n1,SiteA\n")
+    first = MistHelper.load_csv_rows_with_memory_cache("SiteList.csv")
+    assert MistHelper.load_csv_rows_with_memory_cache("SiteList.csv") is first
+    with open("SiteList.csv", "w") as f:
+        f.write("id,name\n1,SiteA\n2,SiteB\n")
+    assert len(MistHelper.load_csv_rows_with_memory_cache("SiteList.csv")) == 2
+
+@pytest.fixture
+def online(monkeypatch, tmp_path):
+    # Empty working directory with a fresh in-memory manifest and a known org
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(MistHelper, "_dataset_manifest_cache", None)
+    monkeypatch.setattr(MistHelper, "org_id", "org-a")
+    monkeypatch.setattr(MistHelper, "get_budget_requests_per_second", lambda priority=None: 1000)
+    return tmp_path
+
+def write_site_list():
+    MistHelper.write_dict_list_to_csv([{"id": "1", "name": "SiteA"}], "SiteList.csv")
+
+def test_manifest_records_org_and_row_count(online):
+    write_site_list()
+    entry = MistHelper.load_dataset_manifest()["SiteList.csv"]
+    assert entry["org_id"] == "org-a"
+    assert entry["row_count"] == 1
+    assert entry["ttl_minutes"] == MistHelper.dataset_cache_ttl_minutes["SiteList.csv"]
+
+def test_cached_csv_for_other_org_is_regenerated(online, monkeypatch):
+    write_site_list()
+    calls = []
+    MistHelper.check_and_generate_csv("SiteList.csv", lambda: calls.append("gen"))
+    assert calls == []
+    monkeypatch.setattr(MistHelper, "org_id", "org-b")
+    MistHelper.check_and_generate_csv("SiteList.csv", lambda: (calls.append("gen"), write_site_list()))
+    assert calls == ["gen"]
+
+def test_failed_regeneration_keeps_other_org_dataset_stale(online, monkeypatch):
+    write_site_list()
+    monkeypatch.setattr(MistHelper, "org_id", "org-b")
+    MistHelper.check_and_generate_csv("SiteList.csv", lambda: None)  # Generator that logged an API error and wrote nothing
+    assert MistHelper.load_dataset_manifest()["SiteList.csv"]["org_id"] == "org-a"
+    assert "org-a" in MistHelper.get_dataset_staleness_reason("SiteList.csv")
+
+def test_dataset_specific_ttl(online, monkeypatch):
+    MistHelper.write_dict_list_to_csv([{"id": "1"}], "OrgDeviceStats.csv")
+    write_site_list()
+    manifest = MistHelper.load_dataset_manifest()
+    for entry in manifest.values():
+        entry["generated_epoch"] -= 30 * 60
+    assert MistHelper.get_dataset_staleness_reason("OrgDeviceStats.csv") is not None
+    assert MistHelper.get_dataset_staleness_reason("SiteList.csv") is None
+
+def test_stale_while_revalidate_serves_stale_and_refreshes(online):
+    write_site_list()
+    MistHelper.load_dataset_manifest()["SiteList.csv"]["generated_epoch"] -= 24 * 3600
+    def regenerate():
+        MistHelper.write_dict_list_to_csv([{"id": "1", "name": "SiteA"}, {"id": "2", "name": "SiteB"}], "SiteList.csv")
+    MistHelper.check_and_generate_csv("SiteList.csv", regenerate, stale_while_revalidate=True)
+    MistHelper._background_dataset_refresh_threads["SiteList.csv"].join(5)
+    assert len(MistHelper.load_csv_rows_with_memory_cache("SiteList.csv")) == 2
+    assert MistHelper.get_dataset_staleness_reason("SiteList.csv") is None
+
+def test_failed_background_refresh_leaves_dataset_stale(online):
+    write_site_list()
+    MistHelper.load_dataset_manifest()["SiteList.csv"]["generated_epoch"] -= 24 * 3600
+    MistHelper.check_and_generate_csv("SiteList.csv", lambda: None, stale_while_revalidate=True)
+    MistHelper._background_dataset_refresh_threads["SiteList.csv"].join(5)
+    assert "older than" in MistHelper.get_dataset_staleness_reason("SiteList.csv")
+
+def test_concurrent_checks_generate_dataset_once(online):
+    import threading
+    calls = []
+    def slow_generate():
+        calls.append("gen")
+        time.sleep(0.3)
+        write_site_list()
+    threads = [threading.Thread(target=MistHelper.check_and_generate_csv, args=("SiteList.csv", slow_generate)) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert calls == ["gen"]
+    assert not os.path.exists("SiteList.csv.lock")
+
+def test_abandoned_lock_from_dead_process_is_removed(online):
+    import json
+    with open("SiteList.csv.lock", "w") as f:
+        json.dump({"pid": 2 ** 22 + 12345}, f)
+    with MistHelper.dataset_generation_lock("SiteList.csv", timeout_seconds=5) as acquired:
+        assert acquired
+
+def test_sync_definitions_rewrites_only_changed_files(online, monkeypatch):
+    definitions = {name: [{"key": name, "display": "x"}] for name in MistHelper.constant_definition_exports}
+    for name, (endpoint, _, sort_key) in list(MistHelper.constant_definition_exports.items()):
+        fake = lambda session, name=name: type("Response", (), {"status_code": 200, "data": [dict(d) for d in definitions[name]]})()
+        monkeypatch.setitem(MistHelper.constant_definition_exports, name, (endpoint, fake, sort_key))
+    MistHelper.sync_all_constant_definitions_to_csv()
+    assert all(os.path.exists(name) for name in definitions)
+    signatures = {name: MistHelper.get_file_signature(name) for name in definitions}
+
+    definitions["AlarmDefinitions.csv"] = [{"key": "new", "display": "y"}]
+    MistHelper.sync_all_constant_definitions_to_csv(force=True)
+    changed = [name for name in definitions if MistHelper.get_file_signature(name) != signatures[name]]
+    assert changed == ["AlarmDefinitions.csv"]
+
+def test_prefetch_follows_menu_history_and_budget(online, monkeypatch):
+    MistHelper.record_menu_selection("32")
+    MistHelper.record_menu_selection("28")
+    # The device/site join pages through two org collections
+    assert MistHelper.choose_datasets_to_prefetch(api_call_budget=3) == ["OrgDevicePortStats.csv", "AllDevicesWithSiteInfo.csv"]
+    MistHelper.write_dict_list_to_csv([{"id": str(i)} for i in range(2500)], "OrgDevicePortStats.csv")
+    assert MistHelper.choose_datasets_to_prefetch(api_call_budget=3) == ["AllDevicesWithSiteInfo.csv", "OrgInventory.csv"]
+
+def test_prefetch_skips_time_sharded_searches_over_budget(online, monkeypatch):
+    monkeypatch.setattr(MistHelper, "search_history_hours", 24)
+    assert MistHelper.estimate_dataset_api_calls("OrgAlarms.csv") == 24
+    MistHelper.record_menu_selection("29")
+    assert "OrgAlarms.csv" not in MistHelper.choose_datasets_to_prefetch(api_call_budget=5)
+
+def test_prefetch_defaults_to_site_list_and_inventory(online):
+    assert MistHelper.choose_datasets_to_prefetch() == ["SiteList.csv", "OrgInventory.csv"]
+
+@pytest.fixture
+def controller(monkeypatch, tmp_path):
+    # Fresh in-memory controller state with a fixed API usage reading
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(MistHelper, "_pid_tuning_state", None)
+    monkeypatch.setattr(MistHelper, "_pid_tuning_state_dirty", False)
+    monkeypatch.setattr(MistHelper, "_pending_delay_metrics", {})
+    monkeypatch.setattr(MistHelper, "_controller_state_last_flush", time.monotonic())
+    monkeypatch.setattr(MistHelper, "refresh_api_usage_estimate", lambda: (100, 5000))
+    return tmp_path
+
+def test_rate_controller_state_is_flushed_in_batches(controller):
+    import json
+    for _ in range(5):
+        MistHelper.get_rate_limited_delay()
+    assert not os.path.exists(MistHelper.tuning_data_file)
+    assert not os.path.exists(MistHelper.delay_metrics_file)
+
+    MistHelper.flush_controller_state()
+    MistHelper.get_rate_limited_delay()
+    MistHelper.flush_controller_state()
+    assert len(MistHelper.load_pid_tuning_data()["error"]) == 6
+    with open(MistHelper.delay_metrics_file) as f:
+        minutes = json.load(f)["minutes"]
+    assert sum(entry["count"] for entry in minutes) == 6
+    assert len(minutes) <= 2
+
+def test_controller_simulation_paces_job_within_budget():
+    workload = MistHelper.synthetic_controller_workloads["steady"]
+    paced = MistHelper.simulate_rate_controller(workload, "pid", iterations=1500)
+    unpaced = MistHelper.simulate_rate_controller(workload, "fixed", fixed_delay=0.2, iterations=1500)
+    assert paced["iterations"] == unpaced["iterations"] == 1500
+    assert paced["over_limit_requests"] == 0
+    assert unpaced["over_limit_requests"] > 0
+    assert paced["completion_seconds"] > unpaced["completion_seconds"]
+    assert len(paced["idle_budget_at_hour_end"]) == paced["hours_closed"] >= 1
+
+def test_controller_backtest_replays_recorded_minutes(controller):
+    import json
+    minutes = [
+        {"minute": "2026-01-01T10:00", "count": 10, "final_delay_sum": 20.0, "used": 100},
+        {"minute": "2026-01-01T10:01", "count": 10, "final_delay_sum": 20.0, "used": 150},
+        {"minute": "2026-01-01T11:00", "count": 12, "final_delay_sum": 24.0, "used": 10},
+    ]
+    with open("recorded.json", "w") as f:
+        json.dump({"minutes": minutes}, f)
+    workload, recorded_iterations = MistHelper.build_workload_from_delay_metrics(MistHelper.load_recorded_delay_metrics("recorded.json"))
+    assert workload == [{"requests_per_iteration": 5.0, "iteration_seconds": 4.0, "background_rps": 0.0}]
+    assert recorded_iterations == 22
+    reports = MistHelper.run_rate_controller_backtest("recorded.json", fixed_delay=1.0)
+    assert [report["pacing"] for report in reports] == ["pid", "even", "fixed"]
+    assert all(report["iterations"] == 22 for report in reports)
+
+def test_exit_waits_for_background_refresh(online):
+    import subprocess, textwrap
+    script = textwrap.dedent("""
+        import sys, time
+        from MistHelper import MistHelper
+        MistHelper.org_id = "org-a"
+        MistHelper.write_dict_list_to_csv([{"id": "1"}], "SiteList.csv")
+        MistHelper.load_dataset_manifest()["SiteList.csv"]["generated_epoch"] -= 24 * 3600
+        def regenerate():
+            time.sleep(0.5)
+            MistHelper.write_dict_list_to_csv([{"id": "1"}, {"id": "2"}], "SiteList.csv")
+        MistHelper.check_and_generate_csv("SiteList.csv", regenerate, stale_while_revalidate=True)
+        sys.exit(0)
+    """)
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(MistHelper.__file__)))
+    subprocess.run([sys.executable, "-c", script], cwd=online, env=dict(os.environ, PYTHONPATH=repo_root), check=True, timeout=60)
+    assert len(MistHelper.load_csv_rows_with_memory_cache("SiteList.csv")) == 2
+    assert not os.path.exists("SiteList.csv.lock")
+
+def test_dataset_variant_from_other_history_hours_is_stale(online, monkeypatch):
+    MistHelper.write_dict_list_to_csv([{"id": "a1"}], "OrgAlarms.csv")
+    assert MistHelper.get_dataset_staleness_reason("OrgAlarms.csv") is not None  # Rewritten without a query
+    MistHelper.record_dataset_manifest_entry("OrgAlarms.csv", endpoint="searchOrgAlarms", query_parameters={"limit": 1000, "status": "open", "time_range_hours": 24})
+    monkeypatch.setattr(MistHelper, "search_history_hours", 24)
+    assert MistHelper.get_dataset_staleness_reason("OrgAlarms.csv") is None
+    monkeypatch.setattr(MistHelper, "search_history_hours", 720)
+    assert "query parameters" in MistHelper.get_dataset_staleness_reason("OrgAlarms.csv")
+    monkeypatch.setattr(MistHelper, "delta_sync_enabled", True)
+    assert "query parameters" in MistHelper.get_dataset_staleness_reason("OrgAlarms.csv")
+
+    MistHelper.write_dict_list_to_csv([{"id": "a1"}, {"id": "a2"}], "OrgAlarms.csv")
+    entry = MistHelper.load_dataset_manifest()["OrgAlarms.csv"]
+    assert "query_parameters" not in entry and "endpoint" not in entry